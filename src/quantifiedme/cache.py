@@ -1,3 +1,7 @@
+import hashlib
+import os
+from collections.abc import Iterable
+from functools import cache
 from pathlib import Path
 
 from joblib import Memory
@@ -5,3 +9,35 @@ from joblib import Memory
 cache_dir = Path("~/.cache/quantifiedme").expanduser()
 
 memory = Memory(location=cache_dir, verbose=0)
+
+
+def fingerprint(paths: Iterable[Path]) -> str:
+    """
+    Returns a hash of the size and mtime of every file in `paths`.
+
+    Directories are walked recursively, and missing paths are included as such,
+    so the fingerprint changes whenever an input file is added, removed or modified.
+    """
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in files:
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                h.update(f"{file}:missing\n".encode())
+                continue
+            if not file.is_dir():
+                h.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+@cache
+def code_version() -> str:
+    """Returns a hash of the quantifiedme source code, to invalidate caches on changes."""
+    h = hashlib.sha256()
+    pkgdir = Path(__file__).parent
+    for file in sorted(pkgdir.rglob("*.py")):
+        h.update(os.fsencode(file.relative_to(pkgdir)))
+        h.update(file.read_bytes())
+    return h.hexdigest()
@@ -0,0 +1,216 @@
+"""
+Classifies events into categories, with rules from a ``categories.toml`` file.
+
+Each table under ``[categories]`` is a category, with an optional regex in its
+``$re`` key, and each other string key is a subcategory with that regex, e.g.::
+
+    [categories.Work]
+    $re = "Google (Sheets|Slides|Forms)"
+
+    [categories.Work.Programming]
+    ActivityWatch = "[Aa]ctivity[Ww]atch|aw-.*"
+
+An event gets every category whose regex matches its app, title or url,
+together with their parent categories, or ``Uncategorized`` if none match.
+
+Rules are compiled once, and events are classified by their unique
+(app, title, url) tuples, which are far fewer than the events. The results can
+be persisted to a Parquet file keyed by a hash of the categories file, so later
+runs only classify the tuples they haven't seen before.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sys
+from collections.abc import Iterable
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aw_core import Event
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+logger = logging.getLogger(__name__)
+
+UNCATEGORIZED = "Uncategorized"
+
+Key = tuple[str, str, str]
+
+_BARE_RE_KEY = re.compile(r"^(\s*)\$re(\s*=)", re.MULTILINE)
+
+_CACHE_SCHEMA = pa.schema(
+    [
+        ("app", pa.string()),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("tags", pa.list_(pa.string())),
+    ]
+)
+
+
+def load_rules(path: Path | str) -> list[tuple[str, str, str | None]]:
+    """Reads the (category, regex, parent) rules from a categories file."""
+    # `$re` isn't a valid bare key in TOML, but categories files use it unquoted
+    text = _BARE_RE_KEY.sub(r'\1"$re"\2', Path(path).read_text())
+    categories = tomllib.loads(text).get("categories", {})
+
+    rules: list[tuple[str, str, str | None]] = []
+
+    def _walk(table: dict, parent: str | None) -> None:
+        for name, value in table.items():
+            if name == "$re":
+                continue
+            if isinstance(value, dict):
+                rules.append((name, value.get("$re", ""), parent))
+                _walk(value, name)
+            else:
+                rules.append((name, value, parent))
+
+    _walk(categories, None)
+    return rules
+
+
+class Classifier:
+    """Assigns category tags to events, by matching their app, title and url."""
+
+    def __init__(
+        self,
+        rules: list[tuple[str, str, str | None]],
+        cache_path: Path | str | None = None,
+    ):
+        self.cache_path = Path(cache_path) if cache_path is not None else None
+        self._parents: dict[str, set[str]] = {}
+        for name, _, parent in rules:
+            if parent is not None:
+                self._parents.setdefault(name, set()).add(parent)
+        # rules without a regex only serve as parents
+        self._rules = [(name, regex) for name, regex, _ in rules if regex]
+        self._patterns = [re.compile(regex) for _, regex in self._rules]
+        self._table: dict[Key, tuple[str, ...]] | None = None
+        self._n_persisted = 0
+
+    def __repr__(self) -> str:
+        return f"<Classifier {len(self._rules)} rules>"
+
+    @classmethod
+    def from_toml(cls, path: Path | str, cache_dir: Path | None = None) -> "Classifier":
+        """
+        Loads the rules from a categories file.
+
+        With `cache_dir`, results are persisted in it, in a file named by the
+        hash of the categories file (so editing the rules starts a new one).
+        """
+        path = Path(path)
+        cache_path = None
+        if cache_dir is not None:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+            cache_path = cache_dir / f"categories-{digest}.parquet"
+        return cls(load_rules(path), cache_path=cache_path)
+
+    @property
+    def rules(self) -> list[tuple[str, str]]:
+        """The (name, regex) of each rule with a regex."""
+        return list(self._rules)
+
+    def match(self, text: str) -> set[str]:
+        """Names of the rules matching anywhere in `text` (without parents)."""
+        return {
+            name
+            for (name, _), pattern in zip(self._rules, self._patterns, strict=True)
+            if pattern.search(text)
+        }
+
+    def with_parents(self, names: Iterable[str]) -> tuple[str, ...]:
+        """
+        Tags for the matched rule `names`: the names and their parents, sorted
+        (or ``Uncategorized`` if there are none).
+        """
+        tags = set(names)
+        stack = list(tags)
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                if parent not in tags:
+                    tags.add(parent)
+                    stack.append(parent)
+        return tuple(sorted(tags)) if tags else (UNCATEGORIZED,)
+
+    def _classify_key(self, key: Key) -> tuple[str, ...]:
+        names: set[str] = set()
+        for text in key:
+            if text:
+                names |= self.match(text)
+        return self.with_parents(names)
+
+    def _load_table(self) -> dict[Key, tuple[str, ...]]:
+        if self._table is None:
+            self._table = {}
+            if self.cache_path is not None and self.cache_path.exists():
+                cached = pq.read_table(self.cache_path, schema=_CACHE_SCHEMA)
+                self._table = {
+                    (app, title, url): tuple(tags)
+                    for app, title, url, tags in zip(
+                        *(cached[c].to_pylist() for c in _CACHE_SCHEMA.names),
+                        strict=True,
+                    )
+                }
+            self._n_persisted = len(self._table)
+        return self._table
+
+    def _save_table(self) -> None:
+        table = self._load_table()
+        if self.cache_path is None or len(table) == self._n_persisted:
+            return
+        keys = list(table)
+        columns = [[k[i] for k in keys] for i in range(3)]
+        arrow = pa.table(
+            [*columns, [list(tags) for tags in table.values()]], schema=_CACHE_SCHEMA
+        )
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(".parquet.tmp")
+        pq.write_table(arrow, tmp_path)
+        os.replace(tmp_path, self.cache_path)
+        self._n_persisted = len(table)
+
+    def tags(self, keys: Iterable[Key]) -> list[tuple[str, ...]]:
+        """
+        Tags for each (app, title, url) key, sorted.
+
+        Each unique key is only classified once, and results are persisted
+        (if the classifier has a cache path) for the next run.
+        """
+        table = self._load_table()
+        keys = list(keys)
+        new = {key for key in keys if key not in table}
+        for key in new:
+            table[key] = self._classify_key(key)
+        if new:
+            logger.debug(f"Classified {len(new)} new (app, title, url) tuples")
+            self._save_table()
+        return [table[key] for key in keys]
+
+    def classify(self, events: list[Event]) -> list[Event]:
+        """Sets the ``$tags`` of `events` (in place), and returns them."""
+        keys = (
+            (
+                e.data.get("app") or "",
+                e.data.get("title") or "",
+                e.data.get("url") or "",
+            )
+            for e in events
+        )
+        for e, tags in zip(events, self.tags(keys), strict=True):
+            e.data["$tags"] = set(tags)
+        return events
+
+    def classify_table(self, table: pa.Table) -> pa.Table:
+        """Sets the tags column of an event store table, from its app, title and url."""
+        columns = [table[c].fill_null("").to_pylist() for c in ("app", "title", "url")]
+        tags = self.tags(zip(*columns, strict=True))
+        column = pa.array([list(t) for t in tags], type=pa.list_(pa.string()))
+        return table.set_column(table.schema.get_field_index("tags"), "tags", column)
@@ -1,29 +1,262 @@
+import hashlib
 import itertools
+import json
 import logging
 import os
+import pickle
+import time
+from collections.abc import Callable, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import (
     date,
     datetime,
     timedelta,
     timezone,
 )
-from typing import Literal, TypeAlias
+from functools import partial
+from pathlib import Path
+from typing import Any, Literal, TypeAlias
 
 import click
 import pandas as pd
 from aw_core import Event
 
+from ..cache import cache_dir, code_version, fingerprint
+from ..config import _get_config_path, load_config
 from ..load.location import load_daily_df as load_location_daily_df
 from ..load.qslang import load_daily_df as load_drugs_df
 from ..load.whoop import load_cycles_df as load_whoop_cycles_df
 from ..load.whoop import load_journal_daily_df as load_whoop_journal_daily_df
 from .heartrate import load_heartrate_summary_df
-from .screentime import load_category_df, load_screentime_cached
+from .screentime import (
+    load_category_df,
+    load_category_df_aggregated,
+    load_screentime_cached,
+)
 from .sleep import load_sleep_df
 
 logger = logging.getLogger(__name__)
 
-Sources = Literal["screentime", "heartrate", "drugs", "location", "sleep", "journal", "cycles"]
+Sources = Literal[
+    "screentime", "heartrate", "drugs", "location", "sleep", "journal", "cycles"
+]
+
+# Sources are joined in this order, regardless of which finishes loading first
+SOURCES: list[Sources] = [
+    "screentime",
+    "heartrate",
+    "drugs",
+    "location",
+    "sleep",
+    "cycles",
+    "journal",
+]
+
+# Optional sources are skipped with a warning if they fail with one of
+# OPTIONAL_ERRORS, instead of failing the whole load.
+# Whoop sources only ship in some exports, and may not be configured at all
+# (KeyError is raised by whoop._whoop_dir when the config has no `data.whoop` entry).
+OPTIONAL_SOURCES: set[Sources] = {"cycles", "journal"}
+OPTIONAL_ERRORS = (FileNotFoundError, NotImplementedError, KeyError)
+
+# Config `data` entries each source reads its input files from.
+# These are fingerprinted to key the persistent cache of each source's daily frame.
+SOURCE_INPUTS: dict[Sources, list[str]] = {
+    "screentime": ["categories", "smartertime_buckets"],
+    "heartrate": ["oura-heartrate", "oura-sleep", "fitbit", "whoop"],
+    "drugs": [],
+    "location": ["location"],
+    "sleep": ["fitbit", "oura-sleep", "whoop"],
+    "cycles": ["whoop"],
+    "journal": ["whoop"],
+}
+
+# Sources with inputs that can't be fingerprinted (the ActivityWatch server and
+# the QSlang notes), so their cached frames are only reused on the same day.
+VOLATILE_SOURCES: set[Sources] = {"screentime", "drugs"}
+
+
+def _load_screentime(
+    since: datetime,
+    fast: bool,
+    screentime_events: list[Event] | None,
+    aggregated: bool = False,
+) -> pd.DataFrame:
+    if aggregated and screentime_events is None:
+        df_time = load_category_df_aggregated(since=since)
+    else:
+        if screentime_events is None:
+            screentime_events = load_screentime_cached(fast=fast, since=since)
+        df_time = load_category_df(screentime_events)
+    # df_time = df_time[["Work", "Media", "ActivityWatch"]]
+    return df_time.add_prefix("time:")
+
+
+def _load_heartrate() -> pd.DataFrame:
+    # Only runs when the source exports changed (or without the cache), so
+    # that's when new data is appended to the heart rate store
+    df_hr = load_heartrate_summary_df(freq="D", update=True)
+    df_hr.index = pd.DatetimeIndex(df_hr.index.date)  # type: ignore
+    return df_hr
+
+
+def _load_drugs() -> pd.DataFrame:
+    # keep only columns starting with "tag"
+    df_drugs: pd.DataFrame = load_drugs_df()
+    columns = df_drugs.columns[df_drugs.columns.str.startswith("tag")]
+    return df_drugs[columns]  # type: ignore
+
+
+def _load_location() -> pd.DataFrame:
+    # TODO: add boolean for if sleeping together
+    df_location = load_location_daily_df()
+    df_location.index = pd.DatetimeIndex(df_location.index.date)  # type: ignore
+    return df_location.add_prefix("loc:")
+
+
+def _load_sleep() -> pd.DataFrame:
+    df_sleep = load_sleep_df()
+    df_sleep.index = pd.DatetimeIndex(df_sleep.index.date)  # type: ignore
+    return df_sleep.add_prefix("sleep:")
+
+
+def _load_cycles() -> pd.DataFrame:
+    df_cycles = load_whoop_cycles_df()
+    df_cycles.index = pd.DatetimeIndex(df_cycles.index.date)  # type: ignore
+    return df_cycles.add_prefix("whoop:")
+
+
+def _load_journal() -> pd.DataFrame:
+    # include_notes defaults to False — free-text notes are excluded for
+    # privacy. Pass include_notes=True via the loader directly if needed.
+    df_journal = load_whoop_journal_daily_df()
+    df_journal.index = pd.DatetimeIndex(df_journal.index.date)  # type: ignore
+    return df_journal.add_prefix("journal:")
+
+
+_descriptions: dict[Sources, str] = {
+    "screentime": "screentime",
+    "heartrate": "heartrate",
+    "drugs": "drugs",
+    "location": "location",
+    "sleep": "sleep",
+    "cycles": "Whoop cycles (recovery, HRV, RHR, strain, SpO2)",
+    "journal": "journal (Whoop self-reports)",
+}
+
+
+def _input_paths(config: MutableMapping[str, Any], source: Sources) -> list[Path]:
+    paths = []
+    for key in SOURCE_INPUTS[source]:
+        value = config["data"].get(key)
+        for path in value.values() if isinstance(value, dict) else [value]:
+            if not isinstance(path, str):
+                continue
+            path = Path(path).expanduser()
+            # relative paths are relative to the config file
+            if not path.is_absolute():
+                path = _get_config_path().parent / path
+            paths.append(path)
+    return paths
+
+
+def _source_key(source: Sources, params: dict[str, Any]) -> str:
+    """
+    Returns the cache key for a source's daily frame.
+
+    Combines a fingerprint of the source's input files, the code version, the
+    config, and the loader parameters.
+    """
+    config = load_config()
+    if source in VOLATILE_SOURCES:
+        params = {**params, "date": date.today()}
+    key = {
+        "inputs": fingerprint(_input_paths(config, source)),
+        "code": code_version(),
+        "config": config,
+        "params": params,
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def cached_source(
+    source: Sources,
+    loader: Callable[[], pd.DataFrame],
+    params: dict[str, Any] | None = None,
+) -> Callable[[], pd.DataFrame]:
+    """
+    Wraps a source loader with a persistent cache of its daily frame.
+
+    The cached frame is reused as long as the source's key (see `_source_key`)
+    is unchanged, so only sources whose inputs changed are recomputed. Each set
+    of `params` is cached in its own file, so switching between them (like
+    `fast=True`/`False`) doesn't overwrite the frame of the other.
+    """
+    params_hash = hashlib.sha256(
+        json.dumps(params or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    path = cache_dir / "daily" / f"{source}-{params_hash}.pickle"
+
+    def load() -> pd.DataFrame:
+        key = _source_key(source, params or {})
+        if path.exists():
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+            if cached["key"] == key:
+                logger.info(f"Loaded {source} from cache")
+                return cached["df"]
+        df = loader()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump({"key": key, "df": df}, f)
+        return df
+
+    return load
+
+
+def _timed(loader: Callable[[], pd.DataFrame]) -> tuple[pd.DataFrame, float]:
+    start = time.perf_counter()
+    df = loader()
+    return df, time.perf_counter() - start
+
+
+def load_sources(
+    loaders: dict[Sources, Callable[[], pd.DataFrame]],
+    workers: int | None = None,
+) -> tuple[dict[Sources, pd.DataFrame], dict[Sources, float]]:
+    """
+    Runs the source loaders concurrently in a thread pool.
+
+    Returns the loaded dataframes in the order of `loaders`, along with the wall
+    time of each loader in seconds. Optional sources that fail with one of
+    OPTIONAL_ERRORS are skipped with a warning; any other failure cancels the
+    loaders that haven't started yet and is re-raised.
+    """
+    dfs: dict[Sources, pd.DataFrame] = {}
+    times: dict[Sources, float] = {}
+    if not loaders:
+        return dfs, times
+    with ThreadPoolExecutor(max_workers=workers or len(loaders)) as executor:
+        futures = {
+            source: executor.submit(_timed, loader)
+            for source, loader in loaders.items()
+        }
+        for source, future in futures.items():
+            try:
+                dfs[source], times[source] = future.result()
+            except OPTIONAL_ERRORS as e:
+                if source not in OPTIONAL_SOURCES:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+                logger.warning(f"Skipping {source} source: {e}")
+            except Exception:
+                executor.shutdown(cancel_futures=True)
+                raise
+            else:
+                logger.info(f"Loaded {source} in {times[source]:.2f}s")
+    return dfs, times
 
 
 def load_all_df(
@@ -31,10 +264,24 @@ def load_all_df(
     screentime_events: list[Event] | None = None,
     ignore: list[Sources] | None = None,
     days: int | None = None,
+    workers: int | None = None,
+    cache: bool = True,
+    aggregated_screentime: bool = False,
 ) -> pd.DataFrame:
     """
     Loads a bunch of data into a single dataframe with one row per day.
     Serves as a useful starting point for further analysis.
+
+    Sources are loaded concurrently (set `workers=1` to load them one at a time),
+    but always joined in the same order.
+
+    The daily frame of each source is cached on disk, and only recomputed when
+    its input files, the code, the config, or the parameters change
+    (set `cache=False` to always recompute).
+
+    With `aggregated_screentime`, the daily screentime is categorized and summed
+    by the ActivityWatch server instead of loading every event (see
+    `load_category_df_aggregated`).
     """
     if ignore is None:
         ignore = []
@@ -45,66 +292,38 @@ def load_all_df(
         since = datetime.now(tz=timezone.utc) - timedelta(days=30 if fast else 2 * 365)
     print(f"Loading data since {since}")
 
-    if "screentime" not in ignore:
-        print("\n# Adding screentime")
-        if screentime_events is None:
-            screentime_events = load_screentime_cached(fast=fast, since=since)
-        df_time = load_category_df(screentime_events)
-        # df_time = df_time[["Work", "Media", "ActivityWatch"]]
-        df = join(df, df_time.add_prefix("time:"))
-        print(f"Range: {min(df.index)}/{max(df.index)}")
-
-    if "heartrate" not in ignore:
-        print("\n# Adding heartrate")
-        df_hr = load_heartrate_summary_df(freq="D")
-        df_hr.index = pd.DatetimeIndex(df_hr.index.date)  # type: ignore
-        df = join(df, df_hr)
-
-    if "drugs" not in ignore:
-        print("\n# Adding drugs")
-        # keep only columns starting with "tag"
-        df_drugs: pd.DataFrame = load_drugs_df()
-        columns = df_drugs.columns[df_drugs.columns.str.startswith("tag")]
-        df_drugs = df_drugs[columns]  # type: ignore
-        df = join(df, df_drugs)
-
-    if "location" not in ignore:
-        print("\n# Adding location")
-        # TODO: add boolean for if sleeping together
-        df_location = load_location_daily_df()
-        df_location.index = pd.DatetimeIndex(df_location.index.date)  # type: ignore
-        df = join(df, df_location.add_prefix("loc:"))
-
-    if "sleep" not in ignore:
-        print("\n# Adding sleep")
-        df_sleep = load_sleep_df()
-        df_sleep.index = pd.DatetimeIndex(df_sleep.index.date)  # type: ignore
-        df = join(df, df_sleep.add_prefix("sleep:"))
-
-    if "cycles" not in ignore:
-        print("\n# Adding Whoop cycles (recovery, HRV, RHR, strain, SpO2)")
-        try:
-            df_cycles = load_whoop_cycles_df()
-        except (FileNotFoundError, NotImplementedError, KeyError) as e:
-            logger.warning(f"Skipping cycles source: {e}")
-        else:
-            df_cycles.index = pd.DatetimeIndex(df_cycles.index.date)  # type: ignore
-            df = join(df, df_cycles.add_prefix("whoop:"))
-
-    if "journal" not in ignore:
-        print("\n# Adding journal (Whoop self-reports)")
-        # include_notes defaults to False — free-text notes are excluded for
-        # privacy. Pass include_notes=True via the loader directly if needed.
-        try:
-            df_journal = load_whoop_journal_daily_df()
-        except (FileNotFoundError, NotImplementedError, KeyError) as e:
-            # Journal source is optional: only ships in the standard Whoop
-            # export, and may not be configured at all. KeyError is raised
-            # by _whoop_dir when the config has no `data.whoop` entry.
-            logger.warning(f"Skipping journal source: {e}")
-        else:
-            df_journal.index = pd.DatetimeIndex(df_journal.index.date)  # type: ignore
-            df = join(df, df_journal.add_prefix("journal:"))
+    available: dict[Sources, Callable[[], pd.DataFrame]] = {
+        "screentime": partial(
+            _load_screentime, since, fast, screentime_events, aggregated_screentime
+        ),
+        "heartrate": _load_heartrate,
+        "drugs": _load_drugs,
+        "location": _load_location,
+        "sleep": _load_sleep,
+        "cycles": _load_cycles,
+        "journal": _load_journal,
+    }
+    loaders = {s: available[s] for s in SOURCES if s not in ignore}
+    if cache:
+        params: dict[Sources, dict[str, Any]] = {
+            "screentime": {
+                "since": since.date(),
+                "fast": fast,
+                "aggregated": aggregated_screentime,
+            }
+        }
+        for s in loaders:
+            # explicitly passed events can't be fingerprinted
+            if s == "screentime" and screentime_events is not None:
+                continue
+            loaders[s] = cached_source(s, loaders[s], params.get(s))
+    dfs, times = load_sources(loaders, workers=workers)
+
+    for source, df_source in dfs.items():
+        print(f"\n# Adding {_descriptions[source]} (loaded in {times[source]:.2f}s)")
+        df = join(df, df_source)
+        if source == "screentime":
+            print(f"Range: {min(df.index)}/{max(df.index)}")
 
     print()
 
@@ -1,8 +1,21 @@
+import logging
+import math
+from collections.abc import Callable, Iterable
+from datetime import datetime, timedelta
+
 import click
+import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
 
+from ..cache import cache_dir
+from ..config import load_config
+from ..hrstore import HeartrateStore
 from ..load import fitbit, oura, whoop
 
+logger = logging.getLogger(__name__)
+
 
 # load heartrate from multiple sources, combine into a single dataframe
 def load_heartrate_df() -> pd.DataFrame:
@@ -34,46 +47,179 @@ def load_heartrate_df() -> pd.DataFrame:
     return df
 
 
-def load_heartrate_minutes_df():
+def _load_whoop_heartrate_df() -> pd.DataFrame | None:
+    try:
+        return whoop.load_heartrate_df()
+    except NotImplementedError as e:
+        # Standard Whoop CSV export ships only daily HR (cycles), not per-minute.
+        print(f"  Skipped: {e}")
+        return None
+
+
+_loaders: dict[str, Callable[[], pd.DataFrame | None]] = {
+    "oura": oura.load_heartrate_df,
+    "fitbit": fitbit.load_heartrate_df,
+    "whoop": _load_whoop_heartrate_df,
+}
+
+
+def update_heartrate_store() -> HeartrateStore:
+    """
+    Appends new data from each source to the minute-resolution heart rate store.
+
+    This loads every source at full resolution, so it's done as a separate step
+    when the source exports change, rather than on every read.
+    """
+    store = HeartrateStore(cache_dir / "heartrate")
+    for source, loader in _loaders.items():
+        print(f"# Loading {source} heartrate data")
+        df = loader()
+        if df is not None:
+            n = store.append(source, df["hr"])
+            logger.info(f"Appended {n} minutes of {source} heartrate")
+    return store
+
+
+def load_heartrate_store(update: bool = False) -> HeartrateStore:
+    """
+    Returns the minute-resolution heart rate store, with data from all sources.
+
+    Reading doesn't load the sources, unless `update` is set (see
+    `update_heartrate_store`).
+    """
+    if update:
+        return update_heartrate_store()
+    return HeartrateStore(cache_dir / "heartrate")
+
+
+def load_heartrate_minutes_df(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    update: bool = False,
+) -> pd.DataFrame:
     """We consider using minute-resolution a decent starting point for summary heartrate data.
 
-    NOTE: ignores source, combines all sources into a single point per freq.
+    NOTE: ignores source, combines all sources into a single point per minute
+    (the mean of the per-source minute means).
     """
-    df = load_heartrate_df().drop(columns=["source"])
-    df = df.resample("1min").mean()
-    return df
+    return load_heartrate_store(update).minutes(start, end).to_frame()
+
+
+# Lower bounds of the default heart rate zones, each zone is (lower, next lower]
+DEFAULT_ZONES = {"resting": 0, "low": 100, "med": 140, "high": 160}
+MAX_HR = 300
+
+
+def summarize_heartrate(
+    hr: pd.Series,
+    zones: dict[str, int] | None = None,
+    freqs: Iterable[str] = ("D",),
+    date_offset: timedelta | None = None,
+) -> dict[str, pd.DataFrame]:
+    """
+    Summarizes a minute heart rate series into the mean and time spent in each zone,
+    for each of `freqs` (e.g. "h", "D", "W").
+
+    Every minute is assigned its zone and period (on the coarsest grid that all
+    freqs are multiples of) in a single pass, and the resulting histogram is
+    then regrouped for each freq, so asking for several freqs costs one scan.
+
+    Periods start at `date_offset` past midnight (default: ``me.date_offset_hours``).
+    Days (and coarser periods) are labeled by their date like elsewhere, e.g. with
+    an offset of 4h the day 2024-01-02 runs from 04:00 on Jan 2 to 04:00 on Jan 3,
+    while shorter periods are labeled by their start time (04:00, 10:00, ... for
+    "6h").
+    """
+    if zones is None:
+        zones = DEFAULT_ZONES
+    freqs = list(freqs)
+    if date_offset is None:
+        date_offset = timedelta(hours=load_config()["me"]["date_offset_hours"])
+    resolution = pd.Timedelta(hr.index.freq or "1min").as_unit("us")
+
+    # zone index of each minute, len(zones) for minutes outside all zones (or NaN)
+    values = hr.to_numpy(dtype=float)
+    edges = np.array([*zones.values(), MAX_HR], dtype=float)
+    zone = np.searchsorted(edges, values, side="left") - 1
+    zone[(zone < 0) | (zone >= len(zones))] = len(zones)
+
+    # period index of each minute, on the base grid
+    base = _base_period(freqs, resolution).value
+    ns = (pd.DatetimeIndex(hr.index) - date_offset).as_unit("ns").asi8
+    first = ns.min() // base if len(ns) else 0
+    period = ns // base - first
+    n = int(period.max()) + 1 if len(ns) else 0
+
+    n_bins = len(zones) + 1
+    hist = np.bincount(period * n_bins + zone, minlength=n * n_bins)
+    valid = ~np.isnan(values)
+    df_base = pd.DataFrame(
+        hist.reshape(n, n_bins)[:, : len(zones)],
+        columns=list(zones),
+        index=pd.to_datetime(
+            (first + np.arange(n)) * base, unit="ns", utc=True
+        ).as_unit(pd.DatetimeIndex(hr.index).unit),
+    )
+    df_base["sum"] = np.bincount(period[valid], weights=values[valid], minlength=n)
+    df_base["count"] = np.bincount(period[valid], minlength=n)
+
+    summaries = {}
+    for freq in freqs:
+        agg = df_base.groupby(pd.Grouper(freq=freq)).sum()
+        index = agg.index
+        if _is_sub_daily(freq):
+            # labels of shorter periods are times, so they're shifted back
+            index = index + date_offset
+        df = pd.DataFrame(index=index.rename(hr.index.name))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df["hr_mean"] = (
+                agg["sum"] / agg["count"].where(agg["count"] > 0)
+            ).to_numpy()
+        for z in zones:
+            df[f"hr_duration_{z}"] = agg[z].to_numpy() * resolution
+        summaries[freq] = df
+    return summaries
+
+
+def _is_sub_daily(freq: str) -> bool:
+    offset = to_offset(freq)
+    return isinstance(offset, Tick) and pd.Timedelta(offset) < pd.Timedelta(days=1)
+
+
+def _base_period(freqs: list[str], resolution: pd.Timedelta) -> pd.Timedelta:
+    """The coarsest period that every freq is a whole multiple of (at most a day)."""
+    day = pd.Timedelta(days=1)
+    base = day.value
+    for freq in freqs:
+        offset = to_offset(freq)
+        # calendar offsets (weeks, months, ...) are made up of whole days
+        period = pd.Timedelta(offset).value if isinstance(offset, Tick) else day.value
+        base = math.gcd(base, period)
+    return max(pd.Timedelta(base, unit="ns"), resolution)
 
 
 def load_heartrate_summary_df(
-    zones: dict[str, int] | None = None, freq="D"
+    zones: dict[str, int] | None = None,
+    freq="D",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    update: bool = False,
 ) -> pd.DataFrame:
     """
     Load heartrates, group into freq, bin by zone, and return a dataframe.
+
+    Reads the heart rate store as is, unless `update` is set.
     """
-    if zones is None:
-        zones = {"resting": 0, "low": 100, "med": 140, "high": 160}
-    source_df = load_heartrate_minutes_df()
-    df = pd.DataFrame()
-    df["hr_mean"] = source_df["hr"].groupby(pd.Grouper(freq=freq)).mean()
-
-    # compute time spent in each zone
-    df_zones = pd.cut(
-        source_df["hr"], bins=[*zones.values(), 300], labels=[*zones.keys()]
-    )
-    for zone in zones:
-        df[f"hr_duration_{zone}"] = df_zones[df_zones == zone].groupby(
-            pd.Grouper(freq=freq)
-        ).count() * pd.Timedelta(minutes=1)
-    # replace NaT with 0
-    df = df.fillna(pd.Timedelta(0))
-    return df
+    hr = load_heartrate_minutes_df(start, end, update)["hr"]
+    return summarize_heartrate(hr, zones, freqs=[freq])[freq]
 
 
 @click.command()
 @click.option("--freq", default="D")
-def heartrate(freq: str):
+@click.option("--update", is_flag=True, help="Load new data from the sources first")
+def heartrate(freq: str, update: bool):
     """Loads heartrate data."""
-    df = load_heartrate_summary_df(freq=freq)
+    df = load_heartrate_summary_df(freq=freq, update=update)
     print(df)
 
 
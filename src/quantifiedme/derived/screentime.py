@@ -1,30 +1,31 @@
 import logging
-import pickle
-from collections import defaultdict
+import shutil
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Literal
 
-import aw_research.classify
 import click
 import numpy as np
 import pandas as pd
 from aw_client import ActivityWatchClient
 from aw_core import Event
-from aw_research.util import categorytime_per_day, split_into_weeks, verify_no_overlap
-from aw_transform.union_no_overlap import union_no_overlap
 
 from ..cache import cache_dir, memory
+from ..classify import Classifier
 from ..config import _get_config_path, load_config
-from ..load.activitywatch import load_events as load_events_activitywatch
+from ..eventstore import EventStore
+from ..load.activitywatch import query_tag_durations
+from ..load.activitywatch import sync_hosts as sync_hosts_activitywatch
 from ..load.activitywatch_fake import create_fake_events
 from ..load.smartertime import load_events as load_events_smartertime
+from ..merge import merge_events
+from ..validate import OnInvalid, validate_events
 
 logger = logging.getLogger(__name__)
 
 
-def _cache_file(fast: bool) -> Path:
-    return cache_dir / ("events_fast.pickle" if fast else "events.pickle")
+def _cache_store(fast: bool) -> EventStore:
+    return EventStore(cache_dir / ("events_fast" if fast else "events"))
 
 
 def _get_aw_client(testing: bool) -> ActivityWatchClient:
@@ -44,7 +45,15 @@ def load_screentime(
     personal: bool = True,
     cache: bool = True,
     awc: ActivityWatchClient | None = None,
+    on_invalid: OnInvalid = "repair",
 ) -> list[Event]:
+    """
+    Loads events from the datasources, merged without overlap and classified.
+
+    Events of each source are validated to be within [since, now], sorted and
+    without overlap, with `on_invalid` deciding whether invalid events are
+    repaired (clipped or dropped), only warned about, or raise.
+    """
     config = load_config(use_example=not personal)
 
     now = datetime.now(tz=timezone.utc)
@@ -53,9 +62,11 @@ def load_screentime(
     else:
         assert since.tzinfo
 
-    # The below code does caching using joblib, setting cache=False clears the cache.
+    # The below code does caching using joblib and the synced event stores,
+    # setting cache=False clears the cache.
     if not cache:
         memory.clear()
+        shutil.rmtree(cache_dir / "activitywatch", ignore_errors=True)
 
     # Auto-detect datasources from config if not specified
     if datasources is None:
@@ -78,51 +89,51 @@ def load_screentime(
     hostnames_config = config["data"]["activitywatch"].get("hostnames", [])
     hostnames = hostnames or hostnames_config
 
-    events: list[Event] = []
+    # Events of each source, in priority order (earlier sources take precedence)
+    sources: list[list[Event]] = []
 
     if "activitywatch" in datasources:
         if awc is None:
             awc = _get_aw_client(not personal)
-        for hostname in hostnames or []:
-            logger.info(f"Getting events for {hostname}...")
-            # Split up into previous days and today, to take advantage of caching
-            # TODO: Split up into whole days
-            # TODO: Use `aw_client.queries.canonicalQuery` instead
-            events_aw: list[Event] = []
-            for dtstart, dtend in split_into_weeks(since, now):
-                events_aw += load_events_activitywatch(
-                    awc, hostname, since=dtstart, end=dtend
-                )
-                logger.debug(f"{len(events_aw)} events retreived")
-            for e in events_aw:
-                e.data["$hostname"] = hostname
-                e.data["$source"] = "activitywatch"
-            events = _join_events(events, events_aw, f"activitywatch {hostname}")
+        logger.info(f"Getting events for {', '.join(hostnames or [])}...")
+        # Only fetches weeks not already synced, plus the current partial week,
+        # with the weeks of all hosts fetched concurrently
+        # TODO: Use `aw_client.queries.canonicalQuery` instead
+        stores = sync_hosts_activitywatch(awc, hostnames or [], since=since, now=now)
+        for hostname, store in stores.items():
+            events_aw = list(store.iter_events(start=since, end=now))
+            logger.debug(f"{len(events_aw)} events retreived")
+            name = f"activitywatch {hostname}"
+            _log_events(events_aw, name)
+            events_aw, _ = validate_events(events_aw, name, since, now, on_invalid)
+            sources.append(events_aw)
 
     if "smartertime_buckets" in datasources:
         events_smartertime = load_events_smartertime(since)
-        events = _join_events(events, events_smartertime, "smartertime")
+        _log_events(events_smartertime, "smartertime")
+        events_smartertime, _ = validate_events(
+            events_smartertime, "smartertime", since, now, on_invalid
+        )
+        sources.append(events_smartertime)
 
     # if "toggl" in datasources:
     #    events_toggl = load_toggl(since, now)
-    #    events = _join_events(events, events_toggl, "toggl")
+    #    _log_events(events_toggl, "toggl")
+    #    sources.append(events_toggl)
 
     if "fake" in datasources:
         events_fake = list(create_fake_events(start=since, end=now))
-        events = _join_events(events, events_fake, "fake")
-
-    # Verify that no events are older than `since`
-    print(f"Query start: {since}")
-    print(f"Events start: {events[0].timestamp}")
-    assert all(since <= e.timestamp for e in events)
+        _log_events(events_fake, "fake")
+        # FIXME: fake events may end in the future, so they aren't checked against now
+        events_fake, _ = validate_events(events_fake, "fake", since, None, on_invalid)
+        sources.append(events_fake)
 
-    # Verify that no events take place in the future
-    # FIXME: Doesn't work with fake data, atm
-    if "fake" not in datasources:
-        assert all(e.timestamp + e.duration <= now for e in events)
+    # Joins the sources in a single sweep, which also verifies they don't overlap
+    events = merge_events(sources)
 
-    # Verify that no events overlap
-    verify_no_overlap(events)
+    print(f"Query start: {since}")
+    if events:
+        print(f"Events start: {events[0].timestamp}")
 
     # Categorize
     events = classify(events, personal)
@@ -133,49 +144,35 @@ def load_screentime(
 def load_screentime_cached(
     since: datetime | None = None, fast=False, **kwargs
 ) -> list[Event]:
-    # returns screentime from picked cache produced by Dashboard.ipynb (or here)
+    # returns screentime from the event store produced by Dashboard.ipynb (or here)
     # if older than 1 day, it will be regenerated
-    path = _cache_file(fast)
+    store = _cache_store(fast)
     cutoff = datetime.now() - timedelta(days=1)
-    if path.exists() and datetime.fromtimestamp(path.stat().st_mtime) > cutoff:
-        print(f"Loading from cache: {path}")
-        with open(path, "rb") as f:
-            events = pickle.load(f)
+    if (mtime := store.mtime()) and mtime > cutoff:
+        print(f"Loading from cache: {store.path}")
         # if fast didn't get us enough data to satisfy the query, we need to load the rest
-        if fast and since and events[-1].timestamp < since:
+        time_range = store.time_range()
+        if fast and since and time_range and time_range[1] < since:
             print("Fast couldn't satisfy since, trying again without fast")
-            events = load_screentime_cached(since=since, fast=False, **kwargs)
-        # trim according to since
-        if since:
-            events = [e for e in events if e.timestamp >= since]
-        return events
+            return load_screentime_cached(since=since, fast=False, **kwargs)
+        # trim according to since (pushed down to the store)
+        return list(store.iter_events(start=since))
     events = load_screentime(since=since, **kwargs)
-    with open(path, "wb") as f:
-        pickle.dump(events, f)
+    store.write(events)
     return events
 
 
-def _join_events(
-    old_events: list[Event], new_events: list[Event], source: str
-) -> list[Event]:
-    if not new_events:
+def _log_events(events: list[Event], source: str) -> None:
+    if not events:
         logger.info(f"No events found from {source}, continuing...")
-        return old_events
-
-    logger.info(f"Fetch from {source} complete, joining with the rest...")
-
-    event_first = min(new_events, key=lambda e: e.timestamp)
-    event_last = max(new_events, key=lambda e: e.timestamp)
-    logger.info(f"  Count: {len(new_events)}")
-    logger.info(f"  Start: {event_first.timestamp}")
-    logger.info(f"  End:   {event_last.timestamp}")
-    verify_no_overlap(new_events)
-    events = union_no_overlap(old_events, new_events)
-    verify_no_overlap(events)
-    return events
+        return
+    logger.info(f"Fetch from {source} complete")
+    logger.info(f"  Count: {len(events)}")
+    logger.info(f"  Start: {min(e.timestamp for e in events)}")
+    logger.info(f"  End:   {max(e.timestamp for e in events)}")
 
 
-def classify(events: list[Event], personal: bool) -> list[Event]:
+def _load_classifier(personal: bool) -> Classifier:
     # Now load the classes from within the notebook, or from a CSV file.
     config = load_config(use_example=not personal)
     categories_path = Path(config["data"]["categories"]).expanduser()
@@ -185,34 +182,101 @@ def classify(events: list[Event], personal: bool) -> list[Event]:
             _get_config_path(use_example=not personal).parent / categories_path
         )
 
-    aw_research.classify._init_classes(filename=str(categories_path))
-    events = aw_research.classify.classify(events)
+    # Results are persisted per version of the categories file, so only
+    # (app, title, url) tuples not seen in earlier runs are classified
+    return Classifier.from_toml(categories_path, cache_dir=cache_dir / "classify")
 
-    return events
+
+def classify(events: list[Event], personal: bool) -> list[Event]:
+    return _load_classifier(personal).classify(events)
 
 
-def load_category_df(events: list[Event]) -> pd.DataFrame:
-    tss = {}
-    all_categories = list({t for e in events for t in e.data["$tags"]})
-    events_by_date = defaultdict(list)
-    for e in events:
-        events_by_date[e.timestamp.date()].append(e)
-    for cat in all_categories:
-        try:
-            tss[cat] = categorytime_per_day(events, cat)
-        except Exception as e:
-            if "No events to calculate on" not in str(e):
-                raise
-    df = pd.DataFrame(tss)
-    df = df.replace(np.nan, 0)
+def _events_to_df(events: list[Event]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime([e.timestamp for e in events], utc=True),
+            "duration": pd.to_timedelta([e.duration for e in events]),
+            "tags": [list(e.data.get("$tags", [])) for e in events],
+        }
+    )
+
+
+def load_category_df(events: list[Event] | pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a daily dataframe with the hours spent in each category.
+
+    Also includes the sum over all categories (All_cols, hours) and the total
+    duration of all events (All_events, timedelta) for each day.
+
+    Takes either a list of classified events, or a dataframe with timestamp,
+    duration and tags columns (as returned by `EventStore.to_df`).
+    """
+    df_events = events if isinstance(events, pd.DataFrame) else _events_to_df(events)
+    date = pd.to_datetime(df_events["timestamp"], utc=True).dt.floor("D")
+    duration = pd.to_timedelta(df_events["duration"])
+
+    df_tags = pd.DataFrame(
+        {
+            "date": date,
+            "hours": duration.dt.total_seconds() / 3600,
+            "tag": df_events["tags"],
+        }
+    )
+    df_tags = df_tags.explode("tag").dropna(subset=["tag"])
+    df = df_tags.groupby(["date", "tag"])["hours"].sum().unstack(fill_value=0.0)
+    df.columns.name = None
+
+    # Each category covers every day from its first to its last event, with
+    # zeros for days without events, and the index is the union of those ranges.
+    if not df.empty:
+        bounds = df_tags.groupby("tag")["date"].agg(["min", "max"])
+        days = pd.date_range(
+            bounds["min"].min(), bounds["max"].max(), freq="D", unit=df.index.unit
+        )
+        coverage = np.zeros(len(days) + 1, dtype=np.int64)
+        np.add.at(coverage, days.get_indexer(bounds["min"]), 1)
+        np.add.at(coverage, days.get_indexer(bounds["max"]) + 1, -1)
+        covered = np.cumsum(coverage[:-1]) > 0
+        df = df.reindex(days if covered.all() else days[covered], fill_value=0.0)
+
     df["All_cols"] = df.sum(axis=1)
-    df["All_events"] = [
-        sum((e.duration for e in events_by_date[d]), start=timedelta(0))
-        for d in df.index
-    ]
+    df["All_events"] = (
+        duration.groupby(date).sum().reindex(df.index, fill_value=timedelta(0))
+    )
     return df
 
 
+def load_category_df_aggregated(
+    since: datetime | None = None,
+    hostnames: list[str] | None = None,
+    personal: bool = True,
+    awc: ActivityWatchClient | None = None,
+) -> pd.DataFrame:
+    """
+    Returns the daily dataframe of `load_category_df`, for ActivityWatch hosts only,
+    with the events categorized and summed per day by the ActivityWatch server.
+
+    Transfers one event per day and set of categories instead of every event,
+    for when only the daily totals are needed. Unlike `load_screentime`, the
+    events aren't synced to (or read from) the local event store, and other
+    datasources (like smartertime buckets) aren't included.
+    """
+    now = datetime.now(tz=timezone.utc)
+    if since is None:
+        since = now - timedelta(days=365)
+    if hostnames is None:
+        config = load_config(use_example=not personal)
+        hostnames = config["data"]["activitywatch"].get("hostnames", [])
+    if awc is None:
+        awc = _get_aw_client(not personal)
+
+    classifier = _load_classifier(personal)
+    events = query_tag_durations(awc, hostnames or [], classifier.rules, since, now)
+    for e in events:
+        e.data["$tags"] = set(classifier.with_parents(e.data["$tags"]))
+    return load_category_df(events)
+
+
 @click.command()
 @click.option("--csv", is_flag=True, help="Print as CSV")
 def screentime(csv: bool):
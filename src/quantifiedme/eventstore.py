@@ -0,0 +1,223 @@
+"""
+Columnar on-disk store for ActivityWatch-style events.
+
+Events are kept as Parquet files with one column per commonly used field
+(timestamp, duration, ``$hostname``, ``$source``, app, title, url, ``$tags``),
+sorted by timestamp so that row-group statistics allow predicate pushdown on
+time range and hostname. Any remaining keys in ``Event.data`` are kept as a
+JSON string in the ``extra`` column, so a write/read round-trip is lossless.
+
+A store is a directory; each named part is a single Parquet file, and reads
+scan all parts as one dataset. Results can be had as an Arrow table, a pandas
+dataframe, or lazily materialized ``Event`` objects.
+"""
+
+import json
+import logging
+import os
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from aw_core import Event
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("duration", pa.duration("us")),
+        ("hostname", pa.string()),
+        ("source", pa.string()),
+        ("app", pa.string()),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("tags", pa.list_(pa.string())),
+        ("extra", pa.string()),
+    ]
+)
+
+# Maps columns to the `Event.data` keys they are stored from
+_DATA_COLUMNS = {
+    "hostname": "$hostname",
+    "source": "$source",
+    "app": "app",
+    "title": "title",
+    "url": "url",
+}
+
+# Small enough that a time-range query can skip most of the file
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def events_to_table(events: Iterable[Event]) -> pa.Table:
+    """Converts events into an Arrow table with the store schema, sorted by timestamp."""
+    columns: dict[str, list] = {name: [] for name in SCHEMA.names}
+    for e in events:
+        data = dict(e.data)
+        columns["timestamp"].append(e.timestamp)
+        columns["duration"].append(e.duration)
+        for col, key in _DATA_COLUMNS.items():
+            columns[col].append(data.pop(key, None))
+        tags = data.pop("$tags", None)
+        columns["tags"].append(sorted(tags) if tags is not None else None)
+        columns["extra"].append(json.dumps(data, default=list) if data else None)
+    table = pa.table(columns, schema=SCHEMA)
+    return table.sort_by("timestamp")
+
+
+def table_to_events(table: pa.Table) -> Iterator[Event]:
+    """Lazily materializes events from a table, one record batch at a time."""
+    for batch in table.to_batches():
+        for row in batch.to_pylist():
+            data: dict = json.loads(row["extra"]) if row["extra"] else {}
+            for col, key in _DATA_COLUMNS.items():
+                if row[col] is not None:
+                    data[key] = row[col]
+            if row["tags"] is not None:
+                data["$tags"] = set(row["tags"])
+            yield Event(timestamp=row["timestamp"], duration=row["duration"], data=data)
+
+
+class EventStore:
+    """A directory of Parquet files holding events, queried as a single dataset."""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"<EventStore {self.path}>"
+
+    def _part_path(self, name: str) -> Path:
+        return self.path / f"{name}.parquet"
+
+    def parts(self) -> list[str]:
+        """Names of the parts in the store, sorted."""
+        if not self.path.exists():
+            return []
+        return sorted(p.stem for p in self.path.glob("*.parquet"))
+
+    def exists(self) -> bool:
+        return bool(self.parts())
+
+    def mtime(self) -> datetime | None:
+        """Time of the most recent write to the store, or None if empty."""
+        paths = [self._part_path(name) for name in self.parts()]
+        if not paths:
+            return None
+        return datetime.fromtimestamp(max(p.stat().st_mtime for p in paths))
+
+    def write(
+        self,
+        events: Iterable[Event] | pa.Table,
+        name: str = "events",
+        metadata: dict[str, str] | None = None,
+    ) -> None:
+        """
+        Writes events to the part `name`, replacing it if it already exists.
+
+        `metadata` is stored in the schema of the part (see :meth:`metadata`).
+        """
+        table = (
+            events.sort_by("timestamp")
+            if isinstance(events, pa.Table)
+            else events_to_table(events)
+        )
+        if metadata is not None:
+            table = table.replace_schema_metadata(metadata)
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self._part_path(name)
+        # write to a temporary file first, so readers never see a partial part
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        logger.debug(f"Wrote {len(table)} events to {path}")
+
+    def metadata(self, name: str) -> dict[str, str] | None:
+        """Metadata the part `name` was written with, or None if there is no such part."""
+        path = self._part_path(name)
+        if not path.exists():
+            return None
+        metadata = pq.read_schema(path).metadata or {}
+        # leave out the serialized schema Arrow adds to every file
+        return {
+            k.decode(): v.decode()
+            for k, v in metadata.items()
+            if not k.startswith(b"ARROW:")
+        }
+
+    def remove(self, name: str) -> None:
+        self._part_path(name).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for name in self.parts():
+            self.remove(name)
+
+    def scan(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        hostnames: list[str] | None = None,
+        columns: list[str] | None = None,
+        parts: list[str] | None = None,
+    ) -> pa.Table:
+        """
+        Reads events with `start <= timestamp < end` and a hostname in `hostnames`.
+
+        Filters are pushed down to the Parquet reader, so row groups outside
+        the range are never decoded. Pass `columns` to only read a subset.
+        """
+        names = (
+            self.parts() if parts is None else sorted(set(parts) & set(self.parts()))
+        )
+        if not names:
+            schema = (
+                SCHEMA
+                if columns is None
+                else pa.schema([SCHEMA.field(c) for c in columns])
+            )
+            return schema.empty_table()
+
+        dataset = ds.dataset(
+            [str(self._part_path(name)) for name in names],
+            schema=SCHEMA,
+            format="parquet",
+        )
+        expr = None
+        for cond in [
+            ds.field("timestamp") >= _to_utc(start) if start else None,
+            ds.field("timestamp") < _to_utc(end) if end else None,
+            ds.field("hostname").isin(hostnames) if hostnames is not None else None,
+        ]:
+            if cond is not None:
+                expr = cond if expr is None else expr & cond
+        table = dataset.to_table(columns=columns, filter=expr)
+        if "timestamp" in table.column_names:
+            table = table.sort_by("timestamp")
+        return table
+
+    def to_df(self, **kwargs) -> pd.DataFrame:
+        """Like :meth:`scan`, but returns a pandas dataframe."""
+        return self.scan(**kwargs).to_pandas()
+
+    def iter_events(self, **kwargs) -> Iterator[Event]:
+        """Like :meth:`scan`, but lazily yields ``Event`` objects."""
+        yield from table_to_events(self.scan(**kwargs))
+
+    def time_range(self) -> tuple[datetime, datetime] | None:
+        """Timestamps of the first and last event in the store, or None if empty."""
+        col = self.scan(columns=["timestamp"])["timestamp"]
+        if len(col) == 0:
+            return None
+        minmax = pc.min_max(col)
+        return minmax["min"].as_py(), minmax["max"].as_py()
+
+
+def _to_utc(dt: datetime) -> pa.Scalar:
+    assert dt.tzinfo, "datetime must be timezone-aware"
+    return pa.scalar(dt.astimezone(timezone.utc), type=SCHEMA.field("timestamp").type)
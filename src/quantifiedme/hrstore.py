@@ -0,0 +1,289 @@
+"""
+Minute-resolution on-disk store for heart rate data from several sources.
+
+Each source (e.g. oura, fitbit, whoop) is kept as a memory-mapped array with
+one uint8 bpm value per minute, and a bitmap marking which minutes have data.
+All sources share a grid starting at midnight UTC of the first stored day, so
+a time range maps to the same slice of every array, and reading a range only
+touches the pages that hold it.
+
+Samples are averaged per minute and rounded to whole bpm when appended.
+Appends are incremental: minutes that already have data for the source are
+skipped, except from the minute of its watermark (its last sample) on, which
+may have been stored before all of its samples arrived. Minutes without data
+are always filled, so a newer export also covering older days (or late-synced
+data) fills the gaps it has data for.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+_NS_PER_MINUTE = 60 * 10**9
+
+
+class HeartrateStore:
+    """A directory of per-source minute arrays of heart rate, on a shared grid."""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"<HeartrateStore {self.path}>"
+
+    def _bpm_path(self, source: str) -> Path:
+        return self.path / f"{source}.bpm"
+
+    def _valid_path(self, source: str) -> Path:
+        return self.path / f"{source}.valid"
+
+    def _load_meta(self) -> dict:
+        path = self.path / "meta.json"
+        if not path.exists():
+            return {"origin": None, "sources": {}}
+        return json.loads(path.read_text())
+
+    def _save_meta(self, meta: dict) -> None:
+        path = self.path / "meta.json"
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, path)
+
+    def sources(self) -> list[str]:
+        """Names of the sources in the store, sorted."""
+        return sorted(self._load_meta()["sources"])
+
+    def origin(self) -> pd.Timestamp | None:
+        """Start of the minute grid, or None if the store is empty."""
+        origin = self._load_meta()["origin"]
+        if origin is None:
+            return None
+        return pd.Timestamp(origin * _NS_PER_MINUTE, tz="UTC")
+
+    def until(self, source: str) -> pd.Timestamp | None:
+        """Timestamp of the last sample appended for `source`, or None."""
+        info = self._load_meta()["sources"].get(source)
+        if info is None:
+            return None
+        return pd.Timestamp(info["until"], tz="UTC")
+
+    def clear(self) -> None:
+        for source in self.sources():
+            self._bpm_path(source).unlink(missing_ok=True)
+            self._valid_path(source).unlink(missing_ok=True)
+        (self.path / "meta.json").unlink(missing_ok=True)
+
+    def append(self, source: str, hr: pd.Series) -> int:
+        """
+        Appends heart rate samples for `source`, given as bpm indexed by timestamp.
+
+        Returns the number of minutes written.
+        """
+        meta = self._load_meta()
+        info = meta["sources"].get(source)
+
+        index = pd.DatetimeIndex(hr.index)
+        index = index.tz_localize("UTC") if index.tz is None else index
+        ns = index.tz_convert("UTC").as_unit("ns").asi8
+        values = hr.to_numpy(dtype=float)
+        minute = ns // _NS_PER_MINUTE
+        keep = ~np.isnan(values)
+        if not keep.any():
+            return 0
+        ns, values, minute = ns[keep], values[keep], minute[keep]
+
+        # mean of the samples in each minute
+        minutes, inverse = np.unique(minute, return_inverse=True)
+        sums = np.bincount(inverse, weights=values)
+        bpm = np.rint(sums / np.bincount(inverse)).clip(0, 255).astype(np.uint8)
+
+        first_day = minutes[0] // MINUTES_PER_DAY * MINUTES_PER_DAY
+        if meta["origin"] is None:
+            meta["origin"] = int(first_day)
+        elif first_day < meta["origin"]:
+            self._rebase(meta, int(first_day))
+        idx = minutes - meta["origin"]
+
+        if info is not None:
+            # minutes already stored, up to the one of the watermark
+            stored = self._valid_at(source, info["minutes"], idx)
+            new = ~stored | (minutes >= info["until"] // _NS_PER_MINUTE)
+            if not new.any():
+                return 0
+            minutes, idx, bpm = minutes[new], idx[new], bpm[new]
+
+        # lengths are whole days, so the bitmap is always whole bytes
+        length = -(-(idx[-1] + 1) // MINUTES_PER_DAY) * MINUTES_PER_DAY
+        length = max(length, info["minutes"] if info is not None else 0)
+        self._resize(source, int(length))
+
+        bpm_mm = np.memmap(self._bpm_path(source), np.uint8, "r+", shape=(length,))
+        bpm_mm[idx] = bpm
+        bpm_mm.flush()
+        valid_mm = np.memmap(
+            self._valid_path(source), np.uint8, "r+", shape=(length // 8,)
+        )
+        lo, hi = idx[0] // 8, idx[-1] // 8 + 1
+        bits = np.unpackbits(valid_mm[lo:hi], bitorder="little")
+        bits[idx - lo * 8] = 1
+        valid_mm[lo:hi] = np.packbits(bits, bitorder="little")
+        valid_mm.flush()
+        del bpm_mm, valid_mm
+
+        until = int(ns.max()) if info is None else max(int(ns.max()), info["until"])
+        meta["sources"][source] = {"minutes": int(length), "until": until}
+        self._save_meta(meta)
+        logger.debug(f"Wrote {len(minutes)} minutes of {source} heart rate")
+        return len(minutes)
+
+    def _valid_at(self, source: str, length: int, idx: np.ndarray) -> np.ndarray:
+        """Whether `source` has data at each of the minute indices `idx`."""
+        valid = np.zeros(len(idx), bool)
+        inside = idx < length
+        if not inside.any():
+            return valid
+        valid_mm = np.memmap(
+            self._valid_path(source), np.uint8, "r", shape=(length // 8,)
+        )
+        i = idx[inside]
+        valid[inside] = (valid_mm[i // 8] >> (i % 8)) & 1
+        del valid_mm
+        return valid
+
+    def _resize(self, source: str, length: int) -> None:
+        """Grows the files of `source` to hold `length` minutes, zero-filled."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        for path, size in [
+            (self._bpm_path(source), length),
+            (self._valid_path(source), length // 8),
+        ]:
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+
+    def _rebase(self, meta: dict, origin: int) -> None:
+        """Moves the grid origin back to `origin`, shifting all sources by whole days."""
+        shift = meta["origin"] - origin
+        for source, info in meta["sources"].items():
+            for path, pad in [
+                (self._bpm_path(source), shift),
+                (self._valid_path(source), shift // 8),
+            ]:
+                tmp_path = path.with_suffix(path.suffix + ".tmp")
+                tmp_path.write_bytes(bytes(pad) + path.read_bytes())
+                os.replace(tmp_path, path)
+            info["minutes"] += shift
+        meta["origin"] = origin
+
+    def _bounds(
+        self, meta: dict, start: datetime | None, end: datetime | None
+    ) -> tuple[int, int]:
+        """Minute indices (relative to the origin) of the range [start, end)."""
+        length = max((i["minutes"] for i in meta["sources"].values()), default=0)
+        lo = 0 if start is None else _ceil_minute(start) - meta["origin"]
+        hi = length if end is None else _ceil_minute(end) - meta["origin"]
+        return max(lo, 0), max(hi, lo, 0)
+
+    def read(
+        self,
+        source: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+        """
+        Reads the minutes in [start, end) for `source`.
+
+        Returns the minute index, the bpm (uint8) and validity (bool) arrays.
+        Only the requested slice of the files is read.
+        """
+        meta = self._load_meta()
+        if meta["origin"] is None:
+            return (
+                pd.DatetimeIndex([], tz="UTC"),
+                np.empty(0, np.uint8),
+                np.empty(0, bool),
+            )
+        lo, hi = self._bounds(meta, start, end)
+        return self._index(meta, lo, hi), *self._read(meta, source, lo, hi)
+
+    def _index(self, meta: dict, lo: int, hi: int) -> pd.DatetimeIndex:
+        minutes = np.arange(meta["origin"] + lo, meta["origin"] + hi, dtype=np.int64)
+        return pd.DatetimeIndex(
+            pd.to_datetime(minutes * _NS_PER_MINUTE, unit="ns", utc=True),
+            name="timestamp",
+        )
+
+    def _read(
+        self, meta: dict, source: str, lo: int, hi: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        bpm = np.zeros(hi - lo, np.uint8)
+        valid = np.zeros(hi - lo, bool)
+        length = meta["sources"].get(source, {}).get("minutes", 0)
+        n = min(hi, length) - lo
+        if n <= 0:
+            return bpm, valid
+        bpm_mm = np.memmap(self._bpm_path(source), np.uint8, "r", shape=(length,))
+        bpm[:n] = bpm_mm[lo : lo + n]
+        valid_mm = np.memmap(
+            self._valid_path(source), np.uint8, "r", shape=(length // 8,)
+        )
+        bits = np.unpackbits(valid_mm[lo // 8 : -(-(lo + n) // 8)], bitorder="little")
+        valid[:n] = bits[lo % 8 : lo % 8 + n]
+        return bpm, valid
+
+    def to_df(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        sources: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """Heart rate per minute with one column per source, NaN where a source has no data."""
+        meta = self._load_meta()
+        sources = sorted(meta["sources"]) if sources is None else sources
+        if meta["origin"] is None:
+            index = pd.DatetimeIndex([], tz="UTC", name="timestamp")
+            return pd.DataFrame(columns=sources, index=index, dtype=float)
+        lo, hi = self._bounds(meta, start, end)
+        columns = {}
+        for source in sources:
+            bpm, valid = self._read(meta, source, lo, hi)
+            columns[source] = np.where(valid, bpm, np.nan)
+        return pd.DataFrame(columns, index=self._index(meta, lo, hi))
+
+    def minutes(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        sources: list[str] | None = None,
+    ) -> pd.Series:
+        """Heart rate per minute, averaged over the sources with data in each minute."""
+        meta = self._load_meta()
+        sources = sorted(meta["sources"]) if sources is None else sources
+        if meta["origin"] is None:
+            index = pd.DatetimeIndex([], tz="UTC", name="timestamp")
+            return pd.Series(index=index, dtype=float, name="hr")
+        lo, hi = self._bounds(meta, start, end)
+        total = np.zeros(hi - lo)
+        count = np.zeros(hi - lo, np.uint8)
+        for source in sources:
+            bpm, valid = self._read(meta, source, lo, hi)
+            total += np.where(valid, bpm, 0)
+            count += valid
+        with np.errstate(invalid="ignore"):
+            hr = np.where(count > 0, total / count, np.nan)
+        return pd.Series(hr, index=self._index(meta, lo, hi), name="hr")
+
+
+def _ceil_minute(dt: datetime) -> int:
+    """The first minute (since epoch) starting at or after `dt`, naive datetimes being UTC."""
+    ts = pd.Timestamp(dt)
+    ts = ts.tz_localize("UTC") if ts.tz is None else ts
+    return -(-ts.as_unit("ns").value // _NS_PER_MINUTE)
@@ -2,19 +2,38 @@
 This was originally part of aw-research, which in turn was based on/refactored out of the QuantifiedMe notebook.
 """
 
+import json
 import logging
-from datetime import datetime, timezone
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
 from urllib.parse import urlparse
 
 import aw_research
 import aw_research.classify
+import requests
+import requests.adapters
 from aw_client import ActivityWatchClient
 from aw_core import Event
 
-from ..cache import memory
+from ..cache import cache_dir, memory
+from ..eventstore import EventStore
 
 logger = logging.getLogger(__name__)
 
+# Concurrent queries when syncing, and retries (after BACKOFF, 2 * BACKOFF, ...
+# seconds) of queries failing with a connection error, timeout (in seconds)
+# or _RETRY_STATUS
+WORKERS = 4
+RETRIES = 3
+BACKOFF = 1.0
+TIMEOUT = 300.0
+_RETRY_STATUS = {502, 503, 504}
+
 
 @memory.cache(ignore=["awc"])
 def load_events(
@@ -22,6 +41,15 @@ def load_events(
     hostname: str,
     since: datetime,
     end: datetime,
+) -> list[Event]:
+    return _query_events(awc, hostname, since, end)
+
+
+def _query_events(
+    awc: "ActivityWatchClient | QueryPool",
+    hostname: str,
+    since: datetime,
+    end: datetime,
 ) -> list[Event]:
     query = aw_research.classify.build_query(hostname)
     logger.debug(f"Query:\n{query}")
@@ -51,3 +79,298 @@ def load_events(
 
     events = [e for e in events if e.data]
     return events
+
+
+def _week_start(dt: datetime) -> datetime:
+    """Returns the start (Monday 00:00 UTC) of the week containing `dt`."""
+    dt = dt.astimezone(timezone.utc)
+    monday = dt.date() - timedelta(days=dt.weekday())
+    return datetime.combine(monday, datetime.min.time(), tzinfo=timezone.utc)
+
+
+def _sync_store(awc: ActivityWatchClient, hostname: str) -> EventStore:
+    # keyed by server, so the testing and personal servers don't share a store
+    server = urlparse(awc.server_address).netloc.replace(":", "_")
+    return EventStore(cache_dir / "activitywatch" / server / hostname)
+
+
+def _watermark_path(store: EventStore) -> Path:
+    return store.path / "watermark.json"
+
+
+def _load_watermark(store: EventStore) -> tuple[datetime, datetime] | None:
+    path = _watermark_path(store)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        wm = json.load(f)
+    return datetime.fromisoformat(wm["since"]), datetime.fromisoformat(wm["until"])
+
+
+def _save_watermark(store: EventStore, since: datetime, until: datetime) -> None:
+    with open(_watermark_path(store), "w") as f:
+        json.dump({"since": since.isoformat(), "until": until.isoformat()}, f)
+
+
+class QueryPool:
+    """
+    Runs queries on the server of `awc` from several threads.
+
+    Queries are posted over a pool of keep-alive connections (one per worker),
+    rather than a new connection per query, and connection errors, timeouts
+    and 502/503/504 responses are retried with exponential backoff.
+
+    Clients that aren't an `ActivityWatchClient` (like stand-ins in tests) are
+    queried through their own `query` method, with the same retries.
+    """
+
+    def __init__(
+        self,
+        awc: ActivityWatchClient,
+        workers: int = WORKERS,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+    ):
+        self.awc = awc
+        self.retries = retries
+        self.backoff = backoff
+        self._session: requests.Session | None = None
+        if isinstance(awc, ActivityWatchClient):
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+    def _post(self, query: str, timeperiods: list[tuple[datetime, datetime]]) -> Any:
+        assert self._session is not None
+        data = {
+            "timeperiods": [
+                f"{start.isoformat()}/{end.isoformat()}" for start, end in timeperiods
+            ],
+            "query": query.split("\n"),
+        }
+        r = self._session.post(
+            f"{self.awc.server_address}/api/0/query/", json=data, timeout=TIMEOUT
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def query(self, query: str, timeperiods: list[tuple[datetime, datetime]]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                if self._session is None:
+                    return self.awc.query(query, timeperiods=timeperiods)
+                return self._post(query, timeperiods)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error: requests.RequestException = e
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in _RETRY_STATUS:
+                    raise
+                error = e
+            if attempt == self.retries:
+                raise error
+            delay = self.backoff * 2**attempt
+            logger.warning(f"Query failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _weeks_to_sync(
+    store: EventStore, since: datetime, now: datetime
+) -> tuple[list[datetime], datetime, datetime]:
+    """Returns the weeks to fetch, and the new watermark (since, until)."""
+    start = _week_start(since)
+    current = _week_start(now)
+    watermark = _load_watermark(store)
+    next_week = current + timedelta(days=7)
+    if watermark is None:
+        return _weeks_between(start, next_week), start, current
+    synced_since, synced_until = watermark
+    weeks = _weeks_between(start, synced_since) + _weeks_between(
+        synced_until, next_week
+    )
+    return weeks, min(start, synced_since), current
+
+
+def sync_events(
+    awc: ActivityWatchClient,
+    hostname: str,
+    since: datetime,
+    now: datetime | None = None,
+    store: EventStore | None = None,
+    workers: int = WORKERS,
+) -> EventStore:
+    """
+    Incrementally syncs events for `hostname` into a local store, one part per week.
+
+    The store keeps a persistent watermark: the range of weeks it has synced
+    (`since`) and the start of the first week that was unfinished at the last
+    sync (`until`). Weeks before `until` are final and never fetched again,
+    the week at `until` and any later weeks are (re-)fetched so the current
+    partial week is reconciled on every run, and weeks before the synced range
+    are backfilled only if an earlier `since` is requested.
+
+    Weeks are fetched concurrently, see `sync_hosts`.
+    """
+    stores = {hostname: store} if store is not None else None
+    return sync_hosts(awc, [hostname], since, now, stores, workers)[hostname]
+
+
+def sync_hosts(
+    awc: ActivityWatchClient,
+    hostnames: list[str],
+    since: datetime,
+    now: datetime | None = None,
+    stores: dict[str, EventStore] | None = None,
+    workers: int = WORKERS,
+) -> dict[str, EventStore]:
+    """
+    Incrementally syncs the events of several hosts, each into a store as in `sync_events`.
+
+    The (host, week) queries of all hosts are issued concurrently by up to
+    `workers` threads, over pooled keep-alive connections with retries (see
+    `QueryPool`), so long backfills are limited by the server rather than
+    the round-trip of each query. Results are written to the stores in
+    (host, week) order, and a host's watermark is only saved once all its
+    weeks are written.
+    """
+    now = now or datetime.now(tz=timezone.utc)
+    stores = {h: (stores or {}).get(h) or _sync_store(awc, h) for h in hostnames}
+    watermarks: dict[str, tuple[datetime, datetime]] = {}
+    jobs: list[tuple[str, datetime, datetime]] = []
+    for hostname, store in stores.items():
+        store.path.mkdir(parents=True, exist_ok=True)
+        weeks, synced_since, synced_until = _weeks_to_sync(store, since, now)
+        watermarks[hostname] = (synced_since, synced_until)
+        jobs += [(hostname, week, min(week + timedelta(days=7), now)) for week in weeks]
+    remaining = Counter(hostname for hostname, _, _ in jobs)
+
+    pool = QueryPool(awc, workers=workers)
+
+    def _fetch(job: tuple[str, datetime, datetime]) -> list[Event]:
+        hostname, week, end = job
+        logger.info(f"Syncing events for {hostname} ({week.date()}/{end.date()})")
+        return _query_events(pool, hostname, since=week, end=end)
+
+    # hosts without weeks to fetch only get their watermark updated
+    for hostname, store in stores.items():
+        if not remaining[hostname]:
+            _save_watermark(store, *watermarks[hostname])
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fetch, job) for job in jobs]
+            for (hostname, week, _), future in zip(jobs, futures, strict=True):
+                try:
+                    events = future.result()
+                except Exception:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+                for e in events:
+                    e.data["$hostname"] = hostname
+                    e.data["$source"] = "activitywatch"
+                stores[hostname].write(events, name=f"week-{week.date().isoformat()}")
+                remaining[hostname] -= 1
+                if not remaining[hostname]:
+                    _save_watermark(stores[hostname], *watermarks[hostname])
+    finally:
+        pool.close()
+    return stores
+
+
+def _weeks_between(start: datetime, end: datetime) -> list[datetime]:
+    """Returns the week starts in [start, end), where both are week starts."""
+    weeks = []
+    while start < end:
+        weeks.append(start)
+        start += timedelta(days=7)
+    return weeks
+
+
+# Keys the category rules are matched against, as in `classify.Classifier`
+_TAG_KEYS = ["app", "title", "url"]
+
+
+def build_tag_query(hostnames: list[str], rules: list[tuple[str, str]]) -> str:
+    """
+    Builds a query for the total duration of each set of tags, per timeperiod.
+
+    The not-afk window events of each host are joined without overlap (earlier
+    hosts taking precedence), tagged with the name of every (name, regex) rule
+    matching their app, title or url, and merged by their tags, so each
+    timeperiod returns one event per distinct set of tags.
+    """
+    classes = [
+        [name, {"type": "regex", "regex": regex, "select_keys": _TAG_KEYS}]
+        for name, regex in rules
+    ]
+    # The query language doesn't unescape backslashes (as in aw_client.queries)
+    classes_str = re.sub(r"\\\\", r"\\", json.dumps(classes))
+    lines = ["events = [];"]
+    for i, hostname in enumerate(hostnames):
+        lines += [
+            f'window_{i} = flood(query_bucket(find_bucket("aw-watcher-window_{hostname}")));',
+            f'not_afk_{i} = flood(query_bucket(find_bucket("aw-watcher-afk_{hostname}")));',
+            f'not_afk_{i} = filter_keyvals(not_afk_{i}, "status", ["not-afk"]);',
+            f"window_{i} = filter_period_intersect(window_{i}, not_afk_{i});",
+            f"events = union_no_overlap(events, window_{i});",
+        ]
+    lines += [
+        f"events = tag(events, {classes_str});",
+        'events = merge_events_by_keys(events, ["$tags"]);',
+        "RETURN = events;",
+    ]
+    return "\n".join(lines)
+
+
+def _day_periods(since: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    """Splits [since, end) into periods at each midnight (UTC)."""
+    since, end = since.astimezone(timezone.utc), end.astimezone(timezone.utc)
+    periods = []
+    start = since
+    while start < end:
+        midnight = datetime.combine(
+            start.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc
+        )
+        periods.append((start, min(midnight, end)))
+        start = midnight
+    return periods
+
+
+def query_tag_durations(
+    awc: ActivityWatchClient,
+    hostnames: list[str],
+    rules: list[tuple[str, str]],
+    since: datetime,
+    end: datetime,
+) -> list[Event]:
+    """
+    Total duration of each set of matching rule names per day, computed by the server.
+
+    Instead of transferring every event, the events are tagged and summed by
+    the server (see `build_tag_query`), with one timeperiod per day (UTC) in a
+    single request. Returns one event per day and set of tags, timestamped at
+    the start of the day (or `since`), with the names in ``$tags``.
+
+    Events spanning midnight are split by the server, rather than counted on
+    the day they start.
+    """
+    periods = _day_periods(since, end)
+    if not periods or not hostnames:
+        return []
+    query = build_tag_query(hostnames, rules)
+    logger.debug(f"Query:\n{query}")
+
+    result = awc.query(query, timeperiods=periods)
+    return [
+        Event(
+            timestamp=start, duration=e["duration"], data={"$tags": e["data"]["$tags"]}
+        )
+        for (start, _), day in zip(periods, result, strict=True)
+        for e in day
+    ]
@@ -34,19 +34,31 @@ because their requirements genuinely differ:
 
 So: no raw values leave this module except inside the attribute dicts the caller
 explicitly asked for. This file contains only parsing logic — no data.
+
+The one thing it does persist is the incremental per-day aggregate store of
+:func:`update_daily_aggregates` (Alice's counts, without rereading years of
+backups each day). That holds only dates, counts, and backup file names:
+distinct contacts are counted from in-memory sets that are dropped after each
+run, never from stored numbers or hashes.
 """
 
 from __future__ import annotations
 
 import glob
+import json
 import os
-from datetime import datetime, timezone
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from itertools import islice
 from pathlib import Path
 from typing import TYPE_CHECKING
 from xml.etree.ElementTree import iterparse
 
+import numpy as np
+
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Iterable, Iterator
+    from datetime import tzinfo
     from xml.etree.ElementTree import Element
 
 # Call "type" codes used by the app (Android CallLog.Calls.TYPE).
@@ -63,20 +75,26 @@ SMS_RECEIVED = "1"
 SMS_SENT = "2"
 
 
-def iter_records(path: str | os.PathLike, tag: str) -> Iterator[dict[str, str]]:
+def iter_records(
+    path: str | os.PathLike, tag: str, since_ms: int | None = None
+) -> Iterator[dict[str, str]]:
     """Stream ``<tag>`` elements' attributes, clearing each so memory stays bounded.
 
     ``iterparse`` yields elements as they close; we copy the attributes,
     ``clear()`` the element, and purge it from the root so the (potentially
     40MB+) document never materializes in memory. Yields a plain ``dict`` per
     record so callers can't accidentally retain live XML nodes.
+
+    With ``since_ms``, records whose ``date`` is missing or older are skipped
+    without being copied.
     """
     root: Element | None = None
     for event, elem in iterparse(str(path), events=("start", "end")):
         if event == "start" and root is None:
             root = elem
         elif event == "end" and elem.tag == tag:
-            yield dict(elem.attrib)
+            if since_ms is None or _to_int(elem.get("date")) >= since_ms:
+                yield dict(elem.attrib)
             elem.clear()
             if root is not None:
                 del root[
@@ -84,6 +102,22 @@ def iter_records(path: str | os.PathLike, tag: str) -> Iterator[dict[str, str]]:
                 ]  # clear all root children (bounded; for flat XML only one is present here)
 
 
+def iter_record_batches(
+    path: str | os.PathLike,
+    tag: str,
+    batch_size: int = 10_000,
+    since_ms: int | None = None,
+) -> Iterator[list[dict[str, str]]]:
+    """Like :func:`iter_records`, but yields lists of up to ``batch_size`` records.
+
+    Meant to be fed to :func:`records_to_arrays`, so that per-record work is
+    limited to the XML parse, while memory stays bounded by the batch size.
+    """
+    records = iter_records(path, tag, since_ms=since_ms)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
 def iter_sent_sms(path: str | os.PathLike) -> Iterator[dict[str, str]]:
     """Yield attribute dicts for *sent* SMS (type==2) from an ``sms-*.xml`` file.
 
@@ -130,6 +164,90 @@ def epoch_ms_to_iso(date_ms: str | None, tz: timezone | None = None) -> str | No
     return dt.isoformat() if dt else None
 
 
+_MS_PER_DAY = 24 * 3600 * 1000
+# Dates from year 10000 on can't be represented as a ``datetime``.
+_MAX_MS = (date(9999, 12, 31).toordinal() - date(1970, 1, 1).toordinal()) * _MS_PER_DAY
+# Ordinal (as in ``date.toordinal()``) of the epoch's day.
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def records_to_arrays(
+    records: Iterable[dict[str, str]],
+    tz: tzinfo | None = None,
+    int_fields: Iterable[str] = ("type",),
+) -> dict[str, np.ndarray]:
+    """Convert raw attribute dicts into numpy arrays, one element per record.
+
+    Returns:
+
+    - ``date_ms``: epoch millis (int64)
+    - ``day``: ordinal of the local day, as in ``date.toordinal()`` (int32);
+      ``date.fromordinal(day)`` gives the day :func:`epoch_ms_to_day` would
+    - one int64 array per name in ``int_fields`` (e.g. ``type``, ``duration``)
+
+    Missing or garbage values are ``-1`` (for ``date`` this makes ``day`` -1 too).
+    Days are computed with a UTC offset looked up once per distinct UTC day,
+    rather than a ``datetime`` per record, so this stays cheap for large
+    backups. ``tz=None`` is system local time, as in :func:`epoch_ms_to_day`.
+    Identifying attributes (numbers, bodies) are never touched.
+    """
+    records = records if isinstance(records, list) else list(records)
+    date_ms = np.fromiter(
+        (_to_int(r.get("date")) for r in records), np.int64, len(records)
+    )
+    valid = (date_ms >= 0) & (date_ms < _MAX_MS)
+    local_ms = date_ms + _utc_offsets_ms(date_ms, valid, tz)
+    day = np.where(valid, local_ms // _MS_PER_DAY + _EPOCH_ORDINAL, -1)
+    arrays = {"date_ms": date_ms, "day": day.astype(np.int32)}
+    for field in int_fields:
+        arrays[field] = np.fromiter(
+            (_to_int(r.get(field)) for r in records), np.int64, len(records)
+        )
+    return arrays
+
+
+def _utc_offsets_ms(
+    date_ms: np.ndarray, valid: np.ndarray, tz: tzinfo | None
+) -> np.ndarray:
+    """UTC offsets (ms) of ``tz`` at each of the (valid) epoch-millis instants."""
+    offsets = np.zeros(len(date_ms), np.int64)
+    if not valid.any():
+        return offsets
+    if isinstance(tz, timezone):
+        offsets[:] = _utc_offset_ms(0, tz)
+        return offsets
+    # Offsets only change at DST transitions, so look them up at the start and
+    # end of each distinct UTC day, and per record only on transition days.
+    utc_days, inverse = np.unique(date_ms[valid] // _MS_PER_DAY, return_inverse=True)
+    day_offsets = np.empty(len(utc_days), np.int64)
+    changing = np.zeros(len(utc_days), bool)
+    for i, utc_day in enumerate(utc_days.tolist()):
+        start = _utc_offset_ms(utc_day * _MS_PER_DAY, tz)
+        end = _utc_offset_ms((utc_day + 1) * _MS_PER_DAY - 1, tz)
+        day_offsets[i] = start
+        changing[i] = start != end
+    valid_ms = date_ms[valid]
+    valid_offsets = day_offsets[inverse]
+    for i in np.flatnonzero(changing[inverse]):
+        valid_offsets[i] = _utc_offset_ms(int(valid_ms[i]), tz)
+    offsets[valid] = valid_offsets
+    return offsets
+
+
+def _utc_offset_ms(date_ms: int, tz: tzinfo | None) -> int:
+    dt = datetime.fromtimestamp(date_ms / 1000, tz=tz)
+    offset = (dt if tz is not None else dt.astimezone()).utcoffset()
+    return int(offset.total_seconds() * 1000) if offset is not None else 0
+
+
+def _to_int(value: str | None) -> int:
+    """Parse an integer attribute (e.g. epoch millis), with ``-1`` for missing/garbage input."""
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except (ValueError, TypeError):
+        return -1
+
+
 def _epoch_ms_to_dt(date_ms: str | None, tz: timezone | None) -> datetime | None:
     if not date_ms:
         return None
@@ -142,7 +260,7 @@ def _epoch_ms_to_dt(date_ms: str | None, tz: timezone | None) -> datetime | None
     # for deterministic behavior; tests always do.
     try:
         return datetime.fromtimestamp(seconds, tz=tz)
-    except (OverflowError, OSError):
+    except (OverflowError, OSError, ValueError):
         return None
 
 
@@ -156,3 +274,152 @@ def latest_file(comms_dir: str | os.PathLike, prefix: str) -> Path | None:
     base = Path(os.path.expanduser(str(comms_dir)))
     matches = sorted(glob.glob(str(base / f"{glob.escape(prefix)}*.xml")))
     return Path(matches[-1]) if matches else None
+
+
+# Backup streams aggregated by :func:`update_daily_aggregates`: file prefix,
+# record tag, and the attribute holding the contact's number.
+_STREAMS = {"sms": ("sms-", "sms", "address"), "calls": ("calls-", "call", "number")}
+
+# Prefixes of the counters each stream writes to a day's row: ``calls_<type>``
+# per call type, and ``call_minutes`` / ``call_contacts``.
+_COUNTER_PREFIXES = {"sms": ("sms_",), "calls": ("calls_", "call_")}
+
+
+def update_daily_aggregates(
+    comms_dir: str | os.PathLike,
+    store_path: str | os.PathLike,
+    tz: timezone | None = None,
+) -> dict[str, dict[str, float]]:
+    """Incrementally update and return privacy-safe per-day aggregates.
+
+    The store at ``store_path`` (JSON) holds one row of counters per day:
+
+    - ``sms_received`` / ``sms_sent`` and ``calls_<type>`` (see ``CALL_TYPES``)
+    - ``call_minutes``, the total duration of all calls
+    - ``sms_contacts`` / ``call_contacts``, the number of distinct numbers
+
+    and a checkpoint per stream: the backup file it last read, and the newest
+    ``date`` (epoch ms) seen in it. Since backups are cumulative snapshots, a
+    run only aggregates records from the start of the checkpoint's day onward,
+    and replaces the counters of those days (the last day may have been partial).
+    An unchanged backup file isn't read at all. Records that show up later with
+    a date before the checkpoint's day are not counted.
+
+    Distinct contacts are counted with in-memory sets of normalized numbers,
+    which are dropped when the run ends. Only dates and counts are persisted,
+    so the store contains nothing identifying. Days are local to ``tz``
+    (``None`` = system local time, as in :func:`epoch_ms_to_day`), which must be
+    the same on every run; a store written with another tz is rebuilt.
+    """
+    store_path = Path(store_path)
+    tz_key = str(tz)
+    store: dict = {"tz": tz_key, "checkpoints": {}, "days": {}}
+    if store_path.exists():
+        loaded = json.loads(store_path.read_text())
+        if loaded.get("tz") == tz_key:
+            store = loaded
+
+    changed = False
+    for stream, (prefix, tag, contact_key) in _STREAMS.items():
+        path = latest_file(comms_dir, prefix)
+        if path is None:
+            continue
+        stat = path.stat()
+        checkpoint = store["checkpoints"].get(stream)
+        source = {"file": path.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if checkpoint is not None and checkpoint["source"] == source:
+            continue
+
+        since_ms = checkpoint["day_start_ms"] if checkpoint is not None else None
+        days, last_ms = _aggregate(path, stream, tag, contact_key, since_ms, tz)
+        for day, counters in days.items():
+            row = store["days"].setdefault(day, {})
+            # drop this stream's counters for the day, which are recomputed in full
+            for key in [k for k in row if k.startswith(_COUNTER_PREFIXES[stream])]:
+                del row[key]
+            row.update(counters)
+        if last_ms is None and checkpoint is not None:
+            last_ms = checkpoint["date_ms"]
+        store["checkpoints"][stream] = {
+            "source": source,
+            "date_ms": last_ms,
+            "day_start_ms": _day_start_ms(last_ms, tz) if last_ms is not None else None,
+        }
+        changed = True
+
+    if changed:
+        store["days"] = dict(sorted(store["days"].items()))
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = store_path.with_name(store_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(store, indent=1))
+        os.replace(tmp_path, store_path)
+    return store["days"]
+
+
+def _prefix(stream: str) -> str:
+    return "sms" if stream == "sms" else "call"
+
+
+def _aggregate(
+    path: Path,
+    stream: str,
+    tag: str,
+    contact_key: str,
+    since_ms: int | None,
+    tz: timezone | None,
+) -> tuple[dict[str, dict[str, float]], int | None]:
+    """Per-day counters for the records of one backup file, and the newest date seen."""
+    counts: dict[int, dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    contacts: dict[int, set[str]] = defaultdict(set)
+    last_ms: int | None = None
+    int_fields = ("type",) if stream == "sms" else ("type", "duration")
+    for batch in iter_record_batches(path, tag, since_ms=since_ms):
+        arrays = records_to_arrays(batch, tz, int_fields=int_fields)
+        keep = arrays["day"] >= 0
+        if not keep.any():
+            continue
+        day = arrays["day"][keep]
+        batch_last_ms = int(arrays["date_ms"][keep].max())
+        last_ms = batch_last_ms if last_ms is None else max(last_ms, batch_last_ms)
+
+        pairs, n = np.unique(
+            np.stack([day, arrays["type"][keep]]), axis=1, return_counts=True
+        )
+        for (d, kind), count in zip(pairs.T.tolist(), n.tolist(), strict=True):
+            if stream == "sms":
+                key = {SMS_RECEIVED: "sms_received", SMS_SENT: "sms_sent"}.get(
+                    str(kind)
+                )
+                if key is None:
+                    continue
+            else:
+                key = f"calls_{CALL_TYPES.get(str(kind), 'other')}"
+            counts[d][key] += count
+        batch_days, inverse = np.unique(day, return_inverse=True)
+        # days with only other types (e.g. drafts) still get a row
+        for d in batch_days.tolist():
+            counts.setdefault(d, defaultdict(int))
+        if stream == "calls":
+            seconds = np.bincount(inverse, weights=arrays["duration"][keep].clip(0))
+            for d, s in zip(batch_days.tolist(), seconds.tolist(), strict=True):
+                counts[d]["call_minutes"] += s / 60
+
+        kept = (r for r, k in zip(batch, keep.tolist(), strict=True) if k)
+        for d, attrs in zip(day.tolist(), kept, strict=True):
+            number = normalize_number(attrs.get(contact_key))
+            if number:
+                contacts[d].add(number)
+
+    days = {}
+    for d, row in counts.items():
+        days[date.fromordinal(d).isoformat()] = {
+            **row,
+            f"{_prefix(stream)}_contacts": len(contacts[d]),
+        }
+    return days, last_ms
+
+
+def _day_start_ms(date_ms: int, tz: timezone | None) -> int:
+    dt = datetime.fromtimestamp(date_ms / 1000, tz=tz)
+    midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(midnight.timestamp() * 1000)
@@ -1,10 +1,14 @@
-import multiprocessing
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import matplotlib.pyplot as plt
+import numpy as np
+import orjson
 import pandas as pd
 
-from ..cache import memory
+from ..cache import cache_dir
 from ..config import load_config
 
 
@@ -47,42 +51,131 @@ def _load_sleep_file(filepath):
     return df
 
 
-def _load_heartrate_file(filepath):
-    # print(f"Loading {filepath}...")
-    # json format is {"dateTime": "2020-01-01", "value": {"bpm": 60, "confidence": 0}}
-    df = pd.read_json(filepath)
-    df["timestamp"] = pd.to_datetime(df["dateTime"], utc=True)
-    df["hr"] = df["value"].apply(lambda x: x["bpm"])
-    df = df.set_index("timestamp")
-    df = df[["hr"]]
-    return df
-
-
-@memory.cache
-def load_heartrate_df() -> pd.DataFrame:
+def _parse_heartrate_file(filepath: Path) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the timestamps (ns since epoch, UTC) and heart rates in a daily file."""
+    # json format is [{"dateTime": "01/01/20 00:00:05", "value": {"bpm": 60, "confidence": 0}}, ...]
+    records = orjson.loads(filepath.read_bytes())
+    hr = np.fromiter((r["value"]["bpm"] for r in records), np.int64, len(records))
+    timestamp = _parse_datetimes([r["dateTime"] for r in records])
+    return timestamp, hr
+
+
+def _parse_datetimes(datetimes: list[str]) -> np.ndarray:
+    """
+    Parses `dateTime` values, which are UTC and formatted as "MM/DD/YY HH:MM:SS",
+    into ns since epoch.
+
+    Since the format is fixed-width, the digits are read directly from the
+    bytes, which is much faster than `pd.to_datetime` (that can't infer this
+    format). Falls back to pandas for anything else.
+    """
+    chars = np.array(datetimes, dtype=bytes)
+    if chars.dtype.itemsize == 17:
+        b = chars.view(np.uint8).reshape(-1, 17)
+        d = b.astype(np.int64) - ord("0")
+
+        def num(i: int) -> np.ndarray:
+            return d[:, i] * 10 + d[:, i + 1]
+
+        month, day, year = num(0), num(3), 2000 + num(6)
+        hour, minute, second = num(9), num(12), num(15)
+        valid = (
+            (b[:, [2, 5]] == ord("/")).all()
+            and (b[:, 8] == ord(" ")).all()
+            and (b[:, [11, 14]] == ord(":")).all()
+            and ((month >= 1) & (month <= 12) & (day >= 1)).all()
+            and ((hour < 24) & (minute < 60) & (second < 60)).all()
+        )
+        if valid:
+            months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+            month_start = months.astype("datetime64[D]").astype(np.int64)
+            month_end = (months + 1).astype("datetime64[D]").astype(np.int64)
+            # days past the end of the month (like Feb 30) would roll over
+            # into the next one, so those are left to pandas to reject
+            if (day <= month_end - month_start).all():
+                days = month_start + day - 1
+                return (days * 86400 + hour * 3600 + minute * 60 + second) * 10**9
+    timestamp = pd.to_datetime(datetimes, utc=True)
+    return timestamp.as_unit("ns").asi8
+
+
+def _parse_heartrate_files(
+    files: list[Path], workers: int | None = None
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Parses files in a process pool with up to one worker per CPU."""
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers <= 1:
+        return [_parse_heartrate_file(f) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(files) // (4 * workers))
+        return list(executor.map(_parse_heartrate_file, files, chunksize=chunksize))
+
+
+def load_heartrate_arrays(
+    files: list[Path], cache_path: Path, workers: int | None = None
+) -> dict[str, np.ndarray]:
+    """
+    Loads timestamp (ns since epoch) and hr arrays from heart rate files, in order.
+
+    Results are cached per file, keyed by path and mtime, so only new or
+    modified files are parsed when a newer export is unpacked over an old one.
+    """
+    keys = [f"{f}:{f.stat().st_mtime_ns}" for f in files]
+    cached: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    if cache_path.exists():
+        with np.load(cache_path) as data:
+            bounds = np.cumsum(np.concatenate([[0], data["counts"]]))
+            timestamp, hr = data["timestamp"], data["hr"]
+            for key, start, end in zip(
+                data["keys"], bounds[:-1], bounds[1:], strict=True
+            ):
+                cached[str(key)] = (timestamp[start:end], hr[start:end])
+
+    new = [(key, f) for key, f in zip(keys, files, strict=True) if key not in cached]
+    if new:
+        print(f"Parsing {len(new)} of {len(files)} Fitbit heart rate files...")
+        parsed = _parse_heartrate_files([f for _, f in new], workers=workers)
+        cached.update(zip([key for key, _ in new], parsed, strict=True))
+
+    results = [cached[key] for key in keys]
+    arrays = {
+        "timestamp": np.concatenate([r[0] for r in results] or [np.empty(0, np.int64)]),
+        "hr": np.concatenate([r[1] for r in results] or [np.empty(0, np.int64)]),
+    }
+    # rewrite the cache if files were added, modified or removed
+    if new or len(cached) != len(keys):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            keys=np.array(keys, dtype=str),
+            counts=np.array([len(r[1]) for r in results], dtype=np.int64),
+            **arrays,
+        )
+        os.replace(tmp_path, cache_path)
+    return arrays
+
+
+def load_heartrate_df(
+    path: Path | None = None, workers: int | None = None
+) -> pd.DataFrame:
     # load heartrate data from Fitbit export
-    filepath = load_config()["data"]["fitbit"]
-    filepath = Path(filepath).expanduser()
+    if path is None:
+        path = load_config()["data"]["fitbit"]
+    filepath = Path(path).expanduser()
 
     # filepath is the root folder of an unzipped Fitbit export
     # heartrate data is split into daily files in `Global Export Data/heart_rate-YYYY-MM-DD.json`
     # we need to combine all of these files into a single dataframe
+    files = sorted(filepath.glob("Global Export Data/heart_rate-*.json"))
+    # one cache per export, so several exports don't overwrite each other's
+    digest = hashlib.sha256(str(filepath.resolve()).encode()).hexdigest()[:16]
+    arrays = load_heartrate_arrays(
+        files, cache_dir / "fitbit" / f"heartrate-{digest}.npz", workers=workers
+    )
 
-    # get all the files in the folder
-    files = filepath.glob("Global Export Data/heart_rate-*.json")
-
-    # load each file into a dataframe
-    # parallelize to speed up the process
-    pool = multiprocessing.Pool(20)
-    dfs = pool.map(_load_heartrate_file, sorted(files))
-
-    # combine all the dataframes into a single dataframe
-    df = pd.concat(dfs)
-
-    # rename column bpm to hr
-    df = df.rename(columns={"bpm": "hr"})
-
-    return df
+    index = pd.to_datetime(arrays["timestamp"], unit="ns", utc=True)
+    return pd.DataFrame({"hr": arrays["hr"]}, index=index.rename("timestamp"))
 
 
 if __name__ == "__main__":
@@ -16,19 +16,33 @@ through Home Assistant — current and future sensors automatically included.
 """
 
 import sqlite3
+from collections.abc import Iterator
 from contextlib import closing
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Day, Tick
 
 from ..config import load_config
 
+# Aggregations that `resample` can compute inside SQLite
+SQL_AGGS = {"mean": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+# Rows fetched from SQLite per chunk
+CHUNKSIZE = 100_000
+
 
 def load_sensor_df(
     path: Path | None = None,
     entity_ids: list[str] | None = None,
     units: dict[str, str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    resample: str | None = None,
+    agg: str | list[str] = "mean",
+    chunksize: int = CHUNKSIZE,
 ) -> pd.DataFrame:
     """
     Load environmental sensor data from Home Assistant's SQLite database.
@@ -42,6 +56,16 @@ def load_sensor_df(
         units: Optional mapping from entity_id to unit string (e.g.,
                {"sensor.temperature_bedroom": "°C", "sensor.co2_office": "ppm"}).
                If provided, a ``unit`` column is populated; unknown entities get NaN.
+        start: Only return states updated at or after this time (UTC).
+        end: Only return states updated before this time (UTC).
+        resample: Optional bucket width, as a fixed pandas frequency (e.g.
+                  ``"5min"``, ``"1h"``, ``"1D"``; not calendar ones like ``"1ME"``).
+                  States are then aggregated per entity and bucket inside
+                  SQLite, and the index holds the start of each bucket.
+        agg: Aggregation(s) used with ``resample``, any of ``mean``, ``min``,
+             ``max`` and ``count``. A single aggregation is returned in the
+             ``state`` column, a list gives one column per aggregation.
+        chunksize: Number of rows fetched from SQLite at a time.
 
     Returns:
         DataFrame indexed by UTC timestamp with columns:
@@ -51,6 +75,43 @@ def load_sensor_df(
 
     Non-numeric states (e.g., 'unavailable', 'unknown') are dropped.
     """
+    chunks = list(
+        iter_sensor_df(
+            path,
+            entity_ids,
+            start=start,
+            end=end,
+            resample=resample,
+            agg=agg,
+            chunksize=chunksize,
+        )
+    )
+    if chunks:
+        df = pd.concat(chunks)
+    else:
+        df = pd.DataFrame(columns=["entity_id", *_value_columns(resample, agg)])
+        df = df.set_index(pd.DatetimeIndex([], tz="UTC", name="timestamp"))
+
+    df["unit"] = df["entity_id"].map(units) if units is not None else None
+    return df
+
+
+def iter_sensor_df(
+    path: Path | None = None,
+    entity_ids: list[str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    resample: str | None = None,
+    agg: str | list[str] = "mean",
+    chunksize: int = CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    """
+    Like :func:`load_sensor_df`, but yields the result in time-ordered chunks
+    of at most ``chunksize`` rows (without the ``unit`` column).
+
+    Filtering on entity, time range and numeric state, as well as resampling,
+    is done by SQLite, so only the rows that are needed are ever read into Python.
+    """
     if path is None:
         config = load_config()
         path = Path(config["data"]["home_assistant"]).expanduser()
@@ -60,10 +121,11 @@ def load_sensor_df(
     if not path.exists():
         raise FileNotFoundError(f"Home Assistant database not found at {path}")
 
+    # validates resample/agg before touching the database
+    _value_columns(resample, agg)
+    width = _resample_width(resample) if resample is not None else None
     if entity_ids is not None and len(entity_ids) == 0:
-        return pd.DataFrame(columns=["entity_id", "state", "unit"]).set_index(
-            pd.DatetimeIndex([], tz="UTC", name="timestamp")
-        )
+        return
 
     with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as con:
         tables = {
@@ -73,68 +135,151 @@ def load_sensor_df(
             ).fetchall()
         }
         if "states_meta" in tables:
-            df = _load_modern_schema(con, entity_ids)
+            query, params = _modern_schema_query(entity_ids, start, end)
         else:
-            df = _load_legacy_schema(con, entity_ids)
+            query, params = _legacy_schema_query(entity_ids, start, end)
 
-    df["unit"] = df["entity_id"].map(units) if units is not None else None
-    return df
+        if width is not None:
+            query, params = _resample_query(query, params, width, agg)
+        else:
+            query += " ORDER BY ts"
+
+        for chunk in pd.read_sql_query(query, con, params=params, chunksize=chunksize):
+            # epoch seconds (REAL), exact to well below a microsecond for both
+            # schemas, so rounding to microseconds undoes the float error
+            us = (chunk.pop("ts") * 1e6).round().astype("int64")
+            chunk.index = pd.DatetimeIndex(
+                pd.to_datetime(us, unit="us", utc=True), name="timestamp"
+            )
+            yield chunk
+
+
+def _value_columns(resample: str | None, agg: str | list[str]) -> list[str]:
+    """Names of the value columns returned for the given resample/agg arguments."""
+    if resample is None:
+        return ["state"]
+    aggs = [agg] if isinstance(agg, str) else list(agg)
+    unknown = set(aggs) - set(SQL_AGGS)
+    if unknown or not aggs:
+        raise ValueError(
+            f"Unsupported aggregation(s) {sorted(unknown)}, expected any of {list(SQL_AGGS)}"
+        )
+    return ["state"] if isinstance(agg, str) else aggs
 
 
-def _load_modern_schema(
-    con: sqlite3.Connection, entity_ids: list[str] | None
-) -> pd.DataFrame:
-    """Load from HA 2023.x+ schema with states_meta table."""
+# Numeric affinity is applied to the text `state` when comparing it to a REAL,
+# so this only holds for states that are numbers (not 'unavailable', 'unknown', '').
+_NUMERIC_STATE = "CAST(state AS REAL) = state"
+
+
+def _modern_schema_query(
+    entity_ids: list[str] | None, start: datetime | None, end: datetime | None
+) -> tuple[str, list]:
+    """Query for the HA 2023.x+ schema, where states reference states_meta."""
+    where = [_NUMERIC_STATE.replace("state", "s.state")]
+    params: list = []
     if entity_ids is not None:
-        placeholders = ",".join("?" * len(entity_ids))
-        query = f"""
-            SELECT
-                sm.entity_id,
-                s.state,
-                datetime(s.last_updated_ts, 'unixepoch') AS last_updated
-            FROM states s
-            JOIN states_meta sm ON s.metadata_id = sm.metadata_id
-            WHERE sm.entity_id IN ({placeholders})
-            ORDER BY s.last_updated_ts
-        """
-        df = pd.read_sql_query(query, con, params=tuple(entity_ids))
-    else:
-        query = """
-            SELECT
-                sm.entity_id,
-                s.state,
-                datetime(s.last_updated_ts, 'unixepoch') AS last_updated
-            FROM states s
-            JOIN states_meta sm ON s.metadata_id = sm.metadata_id
-            ORDER BY s.last_updated_ts
-        """
-        df = pd.read_sql_query(query, con)
-
-    return _clean_df(df)
-
-
-def _load_legacy_schema(
-    con: sqlite3.Connection, entity_ids: list[str] | None
-) -> pd.DataFrame:
-    """Load from legacy HA schema (pre-2023) with entity_id in states table."""
+        where.append(f"sm.entity_id IN ({','.join('?' * len(entity_ids))})")
+        params.extend(entity_ids)
+    # bounds on last_updated_ts, so the (metadata_id, last_updated_ts) index is used
+    if start is not None:
+        where.append("s.last_updated_ts >= ?")
+        params.append(_to_utc(start).timestamp())
+    if end is not None:
+        where.append("s.last_updated_ts < ?")
+        params.append(_to_utc(end).timestamp())
+    query = f"""
+        SELECT
+            sm.entity_id,
+            CAST(s.state AS REAL) AS state,
+            s.last_updated_ts AS ts
+        FROM states s
+        JOIN states_meta sm ON s.metadata_id = sm.metadata_id
+        WHERE {" AND ".join(where)}
+    """
+    return query, params
+
+
+# Epoch seconds of the naive UTC `last_updated` text ("YYYY-MM-DD HH:MM:SS[.ffffff]"),
+# as whole seconds plus the fraction parsed from the text. The date functions of
+# SQLite only keep milliseconds, and julianday() arithmetic is off by tens of µs.
+_LEGACY_EPOCH = (
+    "CAST(strftime('%s', last_updated) AS INTEGER)"
+    " + CAST('0' || substr(last_updated, 20, 7) AS REAL)"
+)
+
+
+def _legacy_schema_query(
+    entity_ids: list[str] | None, start: datetime | None, end: datetime | None
+) -> tuple[str, list]:
+    """Query for the legacy HA schema (pre-2023), with entity_id in states."""
+    where = [_NUMERIC_STATE]
+    params: list = []
     if entity_ids is not None:
-        placeholders = ",".join("?" * len(entity_ids))
-        query = f"""
-            SELECT entity_id, state, last_updated
-            FROM states
-            WHERE entity_id IN ({placeholders})
-            ORDER BY last_updated
-        """
-        df = pd.read_sql_query(query, con, params=tuple(entity_ids))
-    else:
-        query = """
-            SELECT entity_id, state, last_updated
-            FROM states
-            ORDER BY last_updated
-        """
-        df = pd.read_sql_query(query, con)
-
-    return _clean_df(df)
+        where.append(f"entity_id IN ({','.join('?' * len(entity_ids))})")
+        params.extend(entity_ids)
+    # last_updated is naive UTC text, which compares in time order
+    if start is not None:
+        where.append("last_updated >= ?")
+        params.append(_to_utc(start).replace(tzinfo=None).isoformat(sep=" "))
+    if end is not None:
+        where.append("last_updated < ?")
+        params.append(_to_utc(end).replace(tzinfo=None).isoformat(sep=" "))
+    query = f"""
+        SELECT
+            entity_id,
+            CAST(state AS REAL) AS state,
+            {_LEGACY_EPOCH} AS ts
+        FROM states
+        WHERE {" AND ".join(where)}
+    """
+    return query, params
+
+
+def _resample_width(resample: str) -> float:
+    """
+    Width in seconds of the buckets of a pandas frequency string like ``"1h"``.
+
+    Only fixed frequencies are supported, as calendar ones (like ``"1ME"``)
+    can't be bucketed by epoch seconds. Days are fixed, since timestamps are UTC.
+    """
+    try:
+        offset = to_offset(resample)
+    except ValueError as e:
+        raise ValueError(f"Invalid resample frequency {resample!r}: {e}") from None
+    if not isinstance(offset, Tick | Day) or offset.nanos <= 0:
+        raise ValueError(
+            f"resample must be a positive fixed frequency (like '1h'), got {resample!r}"
+        )
+    return offset.nanos / 1e9
+
+
+def _resample_query(
+    query: str, params: list, width: float, agg: str | list[str]
+) -> tuple[str, list]:
+    """Wraps a states query to aggregate states per entity and bucket of `width` seconds."""
+    aggs = (
+        [f"{SQL_AGGS[agg]}(state) AS state"]
+        if isinstance(agg, str)
+        else [f"{SQL_AGGS[a]}(state) AS {a}" for a in agg]
+    )
+    query = f"""
+        SELECT
+            entity_id,
+            {", ".join(aggs)},
+            CAST(ts / ? AS INTEGER) * ? AS ts
+        FROM ({query})
+        GROUP BY entity_id, CAST(ts / ? AS INTEGER)
+        ORDER BY ts, entity_id
+    """
+    return query, [width, width, *params, width]
+
+
+def _to_utc(dt: datetime) -> datetime:
+    """Interprets naive datetimes as UTC."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
 
 def _clean_df(df: pd.DataFrame) -> pd.DataFrame:
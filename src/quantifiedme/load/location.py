@@ -1,25 +1,29 @@
 import glob
-import json
+import itertools
+import logging
+import os
 from datetime import datetime
 from pathlib import Path
+from typing import TypeAlias
 
 import click
+import ijson
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
-from tqdm import tqdm
 
-from ..cache import memory
+from ..cache import cache_dir, fingerprint
 from ..config import load_config
 
+logger = logging.getLogger(__name__)
 
-@memory.cache
-def load_all_dfs() -> dict[str, pd.DataFrame]:
+
+def load_all_dfs(resample=True) -> dict[str, pd.DataFrame]:
     dfs = {}
     path = str(Path(load_config()["data"]["location"]).expanduser())
     for filepath in glob.glob(path + "/*.json"):
         name = Path(filepath).name.replace(".json", "")
-        df = location_history_to_df(filepath)
+        df = location_history_to_df(filepath, resample=resample)
         dfs[name] = df
     return dfs
 
@@ -30,109 +34,339 @@ def load_daily_df(whitelist: list[str] | None = None) -> pd.DataFrame:
     me = config["me"]["name"]
     locations = config["locations"]
 
-    df = pd.DataFrame(index=pd.DatetimeIndex([]))
-    dfs = load_all_dfs()
-
-    for location in whitelist or [*locations.keys(), *dfs.keys()]:
-        if location == me:
-            continue
-        if location in locations:
-            loc = locations[location]
-            df[location] = _proximity_to_location(
-                dfs[me], (loc["lat"], loc["long"]), threshold_radius=loc["accuracy"]
-            )
-        elif location in dfs:
-            df[location] = colocate(dfs[me], dfs[location])
-        else:
-            raise ValueError(f"Unknown location {location}")
+    # colocation works on the raw fixes, locations on the resampled history
+    dfs = load_all_dfs(resample=False)
 
-    return df
+    names = [n for n in whitelist or [*locations.keys(), *dfs.keys()] if n != me]
+    for name in names:
+        if name not in locations and name not in dfs:
+            raise ValueError(f"Unknown location {name}")
+
+    df = proximity_to_locations(
+        _resample(dfs[me]),
+        {name: locations[name] for name in names if name in locations},
+    )
+    people = [name for name in names if name not in locations]
+    if people:
+        df_people = colocate_pairs(dfs, pairs=[(me, name) for name in people])
+        df_people.columns = df_people.columns.droplevel(0)
+        df = df.join(df_people, how="outer")
 
+    return df[names]
 
-def location_history_to_df(fn, use_inferred_loc=False) -> pd.DataFrame:
+
+def location_history_to_df(fn, use_inferred_loc=False, resample=True) -> pd.DataFrame:
+    """
+    Loads a Google Takeout location history into a dataframe with lat, long and accuracy columns.
+
+    Unless `resample=False`, the locations are resampled to 10 minutes and
+    forward-filled for up to 12h.
+    """
     print(f"Loading location data from {fn}")
-    with open(fn) as f:
-        locs = json.load(f)["locations"]
-    for loc in tqdm(locs):
-        try:
-            loc["lat"] = loc.pop("latitudeE7") / 10_000_000
-            loc["long"] = loc.pop("longitudeE7") / 10_000_000
-        except KeyError:
-            if use_inferred_loc and "inferredLocation" in loc:
-                inferredloc = loc.pop("inferredLocation")[0]
-                loc["lat"] = inferredloc["latitudeE7"] / 10_000_000
-                loc["long"] = inferredloc["longitudeE7"] / 10_000_000
-            else:
-                print(f"Error parsing location entry. Entry had keys: {loc.keys()}")
-                # raise ValueError(f"Error parsing location entry: {loc}, {loc.keys()}")
-
-        if "timestampMs" in loc:
-            loc["timestamp"] = pd.Timestamp(
-                int(loc.pop("timestampMs")),
-                unit="ms",
-                tz="UTC",
-            )
-        elif "timestamp" in loc:
-            loc["timestamp"] = pd.Timestamp(loc.pop("timestamp"))
-        else:
-            raise ValueError("No timestamp found")
-
-        # strip extra fields
-        for p in [
-            "velocity",
-            "verticalAccuracy",
-            "altitude",
-            "activity",
-            "heading",
-            "locationMetadata",
-            "osLevel",
-            "deviceTag",
-            "formFactor",
-            "batteryCharging",
-            "serverTimestamp",
-        ]:
-            if p in loc:
-                loc.pop(p)
-
-    df = pd.DataFrame(locs)
-    # no idea why this is typed as None, needing the type-ignore on next lint
-    df = df.set_index("timestamp")
+    arrays = load_location_arrays(fn, use_inferred_loc=use_inferred_loc)
+    index = pd.DatetimeIndex(
+        pd.to_datetime(arrays["timestamp"], unit="ns", utc=True), name="timestamp"
+    )
+    df = pd.DataFrame(
+        {k: arrays[k] for k in ["lat", "long", "accuracy"]},
+        index=index,
+    )
     # Remove duplicates in index
     df = df[~df.index.duplicated(keep="first")]  # type: ignore
-    # resample and fill missing values, but only for up to 12h
-    df = df.resample("10Min").ffill(limit=6 * 12)
+    if resample:
+        df = _resample(df)
     return df
 
 
-def colocate(df_person1, df_person2, verbose=False) -> pd.DataFrame:
-    df = df_person1.join(df_person2, lsuffix="_a", rsuffix="_b")
-    df["dist"] = (
-        (df["lat_a"] - df["lat_b"]) ** 2 + (df["long_a"] - df["long_b"]) ** 2
-    ).pow(1 / 2)
+def _resample(df: pd.DataFrame) -> pd.DataFrame:
+    # resample and fill missing values, but only for up to 12h
+    return df.resample("10Min").ffill(limit=6 * 12)
+
+
+def load_location_arrays(fn, use_inferred_loc=False) -> dict[str, np.ndarray]:
+    """
+    Loads a location history as arrays of timestamp (ns since epoch), lat, long and accuracy.
+
+    The arrays are cached in a compact binary file per location history,
+    which is reused until the source file changes.
+    """
+    path = Path(fn)
+    cache_path = cache_dir / "location" / f"{path.stem}.npz"
+    key = f"{fingerprint([path])}:{use_inferred_loc}"
+    if cache_path.exists():
+        with np.load(cache_path) as data:
+            if str(data["key"]) == key:
+                return {k: data[k] for k in _LOCATION_FIELDS}
+
+    arrays = _parse_location_history(path, use_inferred_loc=use_inferred_loc)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, so an interrupted run leaves no partial cache
+    tmp_path = cache_path.with_suffix(".npz.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, key=np.array(key), **arrays)
+    os.replace(tmp_path, cache_path)
+    return arrays
+
+
+_LOCATION_FIELDS = ["timestamp", "lat", "long", "accuracy"]
+_E7 = 10_000_000
+
+
+def _parse_location_history(
+    path: Path, use_inferred_loc=False
+) -> dict[str, np.ndarray]:
+    """
+    Streams the records of a location history into arrays.
+
+    Records are read one at a time by the C parser backend, so the document
+    is never held in memory, and each record is dropped as soon as its fields
+    are copied into the arrays (which are preallocated and grown by doubling).
+    """
+    size = 1 << 16
+    timestamp = np.empty(size, dtype=np.int64)
+    lat = np.empty(size)
+    long = np.empty(size)
+    accuracy = np.empty(size)
+    # newer exports have ISO 8601 timestamps, which are parsed in bulk at the end
+    iso_timestamps: list[str | None] = []
+    n_missing = 0
+
+    n = 0
+    with open(path, "rb") as f:
+        for loc in ijson.items(f, "locations.item", use_float=True):
+            if n == size:
+                size *= 2
+                for arr in (timestamp, lat, long, accuracy):
+                    arr.resize(size, refcheck=False)
+
+            if "latitudeE7" in loc:
+                lat[n] = loc["latitudeE7"] / _E7
+                long[n] = loc["longitudeE7"] / _E7
+            elif use_inferred_loc and "inferredLocation" in loc:
+                inferredloc = loc["inferredLocation"][0]
+                lat[n] = inferredloc["latitudeE7"] / _E7
+                long[n] = inferredloc["longitudeE7"] / _E7
+            else:
+                lat[n] = long[n] = np.nan
+                n_missing += 1
+            accuracy[n] = loc.get("accuracy", np.nan)
+
+            if "timestampMs" in loc:
+                timestamp[n] = int(loc["timestampMs"]) * 1_000_000
+                iso_timestamps.append(None)
+            elif "timestamp" in loc:
+                iso_timestamps.append(loc["timestamp"])
+            else:
+                raise ValueError("No timestamp found")
+            n += 1
+
+    if n_missing:
+        logger.warning(f"{n_missing} location entries had no lat/long")
+
+    timestamp = timestamp[:n]
+    has_iso = np.array([ts is not None for ts in iso_timestamps], dtype=bool)
+    if has_iso.any():
+        parsed = pd.to_datetime(
+            [ts for ts in iso_timestamps if ts is not None], utc=True, format="ISO8601"
+        )
+        timestamp[has_iso] = parsed.as_unit("ns").asi8
+
+    return {
+        "timestamp": timestamp,
+        "lat": lat[:n],
+        "long": long[:n],
+        "accuracy": accuracy[:n],
+    }
+
+
+# How long a fix is assumed to remain valid, for colocation
+COLOCATION_TOLERANCE = pd.Timedelta(hours=12)
+
 
-    df_close = df[df["dist"] < 0.01].copy()
-    df_close["duration"] = df.index.freq.nanos / 3600e9  # Normalize to hours
-    df_close = df_close.resample("24H").apply({"duration": "sum"})
-    df_close = df_close["duration"]
-    # print(df_close)
+def colocate(
+    df_person1: pd.DataFrame,
+    df_person2: pd.DataFrame,
+    max_distance: float = 1000,
+    tolerance: pd.Timedelta = COLOCATION_TOLERANCE,
+    verbose=False,
+) -> pd.Series:
+    """
+    Returns a daily series with the hours two people spent within `max_distance` meters of each other.
+
+    Works directly on the raw, irregular fixes of each person (no resampling
+    needed): at any time, each person is assumed to be at their latest fix,
+    for up to `tolerance` after it. The time between consecutive fixes (of
+    either person) is counted when both positions are known and close.
+    """
+    df_close = _colocate_fixes(
+        _fixes(df_person1), _fixes(df_person2), max_distance, tolerance
+    )
     if verbose:
         print(df_close)
-
     return df_close
 
 
-def _proximity_to_location(
-    df: pd.DataFrame, loc: tuple[float, float], threshold_radius=0.001, verbose=False
+def colocate_pairs(
+    dfs: dict[str, pd.DataFrame],
+    pairs: list[tuple[str, str]] | None = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Like :func:`colocate`, but for many people at once.
+
+    Computes the colocation for each pair in `pairs` (defaults to every pair
+    in `dfs`), preparing each person's fixes only once. Returns a daily
+    dataframe with a (person1, person2) column for each pair.
+    """
+    if pairs is None:
+        pairs = list(itertools.combinations(dfs.keys(), 2))
+    if not pairs:
+        return pd.DataFrame(index=pd.DatetimeIndex([], tz="UTC"))
+    fixes = {name: _fixes(dfs[name]) for name in {p for pair in pairs for p in pair}}
+    series = {(a, b): _colocate_fixes(fixes[a], fixes[b], **kwargs) for a, b in pairs}
+    return pd.concat(series, axis=1).fillna(0.0)
+
+
+Fixes: TypeAlias = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _fixes(df: pd.DataFrame) -> Fixes:
+    """Returns the (timestamp ns, lat, long) arrays of a location history, sorted and without missing values."""
+    df = df.dropna(subset=["lat", "long"]).sort_index()
+    df = df[~df.index.duplicated(keep="first")]
+    t = pd.DatetimeIndex(df.index).tz_convert("UTC").as_unit("ns").asi8
+    return t, df["lat"].to_numpy(dtype=float), df["long"].to_numpy(dtype=float)
+
+
+def _colocate_fixes(
+    fixes1: Fixes,
+    fixes2: Fixes,
+    max_distance: float = 1000,
+    tolerance: pd.Timedelta = COLOCATION_TOLERANCE,
 ) -> pd.Series:
-    lat, lon = loc
-    dist = ((df["lat"] - lat) ** 2 + (df["long"] - lon) ** 2) ** 0.5
-    dist = dist[dist < threshold_radius]
-    df_dist = pd.DataFrame(dist, columns=["dist"])
-    df_dist["duration"] = 10 / 60
-    df_dist = df_dist.resample("24H").apply({"duration": np.sum})  # type: ignore
+    t1, lat1, long1 = fixes1
+    t2, lat2, long2 = fixes2
+    tol = tolerance.value
+
+    # every fix of either person starts a segment, lasting until the next fix
+    t = np.union1d(t1, t2)
+    end = np.append(t[1:], t[-1:])
+    # latest fix of each person at the start of each segment (a backward as-of match)
+    i1 = np.searchsorted(t1, t, side="right") - 1
+    i2 = np.searchsorted(t2, t, side="right") - 1
+    known = (i1 >= 0) & (i2 >= 0)
+    t, end, i1, i2 = t[known], end[known], i1[known], i2[known]
+
+    # positions are only valid for `tolerance` after each fix
+    end = np.minimum(end, np.minimum(t1[i1], t2[i2]) + tol)
+    close = haversine(lat1[i1], long1[i1], lat2[i2], long2[i2]) < max_distance
+    duration = np.where(close, end - t, 0)
+    start, duration = t[duration > 0], duration[duration > 0]
+    if len(start) == 0:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], tz="UTC"))
+
+    # integrate the (non-overlapping) segments over each day
+    day = pd.Timedelta(days=1).value
+    first_day = start[0] // day * day
+    last_day = (start[-1] + duration[-1] - 1) // day * day
+    bounds = np.arange(first_day, last_day + 2 * day, day)
+    cum = np.concatenate([[0], np.cumsum(duration)])
+    # total duration before each bound: all earlier segments, plus the elapsed
+    # part of the segment the bound falls in
+    i = np.searchsorted(start, bounds, side="right") - 1
+    j = np.maximum(i, 0)
+    total = np.where(i >= 0, cum[j] + np.clip(bounds - start[j], 0, duration[j]), 0)
+    hours = np.diff(total) / 3600e9
+    index = pd.DatetimeIndex(pd.to_datetime(bounds[:-1], unit="ns", utc=True), freq="D")
+    return pd.Series(hours, index=index)
+
+
+EARTH_RADIUS_M = 6_371_000
+
+
+def haversine(lat1, long1, lat2, long2):
+    """Great-circle distance in meters between points given in degrees (broadcasts like numpy)."""
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _radius_m(loc: dict) -> float:
+    # `radius` is in meters, the older `accuracy` is in degrees (of arc)
+    if "radius" in loc:
+        return loc["radius"]
+    return np.radians(loc.get("accuracy", 0.001)) * EARTH_RADIUS_M
+
+
+def nearest_location(
+    lat: np.ndarray,
+    long: np.ndarray,
+    locations: dict[str, dict],
+    chunksize: int = 100_000,
+) -> np.ndarray:
+    """
+    Assigns each point to the nearest location within that location's radius.
+
+    Returns the index of the location in `locations` for each point, or -1 if
+    the point isn't within the radius of any location. Distances to all
+    locations are computed together, in chunks to bound memory.
+    """
+    loc_lat = np.array([loc["lat"] for loc in locations.values()], dtype=float)
+    loc_long = np.array([loc["long"] for loc in locations.values()], dtype=float)
+    radius = np.array([_radius_m(loc) for loc in locations.values()], dtype=float)
+
+    nearest = np.full(len(lat), -1, dtype=np.int64)
+    if not locations:
+        return nearest
+    for start in range(0, len(lat), chunksize):
+        end = start + chunksize
+        # (points, locations) distance matrix, with out-of-radius set to inf
+        dist = haversine(
+            lat[start:end, np.newaxis], long[start:end, np.newaxis], loc_lat, loc_long
+        )
+        dist[~(dist <= radius)] = np.inf
+        idx = dist.argmin(axis=1)
+        within = np.isfinite(dist[np.arange(len(idx)), idx])
+        nearest[start:end] = np.where(within, idx, -1)
+    return nearest
+
+
+def proximity_to_locations(
+    df: pd.DataFrame, locations: dict[str, dict], verbose=False
+) -> pd.DataFrame:
+    """
+    Returns a daily dataframe with the hours spent at each location.
+
+    Takes a (resampled) location history and a mapping of names to locations
+    with `lat`, `long`, and a radius (see `_radius_m`). Each fix counts towards
+    the nearest location it is within the radius of, for the sampling period
+    of the history (10 minutes, if it has no frequency).
+    """
+    period = df.index.freq.nanos if df.index.freq else 10 * 60 * 1e9
+    nearest = nearest_location(
+        df["lat"].to_numpy(dtype=float), df["long"].to_numpy(dtype=float), locations
+    )
+    mask = nearest >= 0
+    days = pd.DatetimeIndex(df.index[mask]).floor("D")
+
+    df_hours = (
+        pd.Series(period / 3600e9, index=days)
+        .groupby([days, nearest[mask]])
+        .sum()
+        .unstack(fill_value=0.0)
+    )
+    if not df_hours.empty:
+        df_hours = df_hours.reindex(
+            pd.date_range(days.min(), days.max(), freq="D"), fill_value=0.0
+        )
+    df_hours = df_hours.reindex(columns=range(len(locations)), fill_value=0.0)
+    df_hours.columns = pd.Index(list(locations.keys()))
     if verbose:
-        print(df_dist)
-    return df_dist["duration"]
+        print(df_hours)
+    return df_hours
 
 
 def plot_df_duration(df, title, save: str | None = None) -> None:
@@ -1,11 +1,15 @@
+import functools
+import itertools
 import json
 import logging
+import threading
 from datetime import timedelta
 from pathlib import Path
 
 import click
-import iso8601
 import matplotlib.pyplot as plt
+import numpy as np
+import orjson
 import pandas as pd
 
 from ..config import load_config
@@ -23,12 +27,37 @@ def load_data_old():
     return data
 
 
+def _data_path(key: str) -> Path:
+    return Path(load_config()["data"][key]).expanduser()
+
+
+# Guards _read_json, so threads loading the same export parse it only once
+_read_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _read_json(path: Path, mtime_ns: int) -> dict:
+    # keyed by mtime, so a modified file is read again
+    return orjson.loads(path.read_bytes())
+
+
+def _load_json(key: str) -> dict:
+    """
+    Loads the JSON export at config `data.<key>`.
+
+    The last parsed export is kept in memory until the file changes, so the
+    sleep export (read last by `load_heartrate_df`) is only parsed once for
+    both `load_heartrate_df` and a following `load_sleep_df`, also when they
+    run in different threads. Callers must not modify the returned data.
+    """
+    path = _data_path(key)
+    with _read_lock:
+        return _read_json(path, path.stat().st_mtime_ns)
+
+
 def load_sleep_df() -> pd.DataFrame:
     # new format
-    path = load_config()["data"]["oura-sleep"]
-    path = Path(path).expanduser()
-    with open(path) as f:
-        data = json.load(f)
+    data = _load_json("oura-sleep")
     df = pd.DataFrame(data["sleep"])
     # "day" (prev "summary_date") is the "start" date
     # https://cloud.ouraring.com/docs/sleep
@@ -70,48 +99,56 @@ def load_activity_df() -> pd.DataFrame:
 
 
 def load_heartrate_df() -> pd.DataFrame:
-    filepath = load_config()["data"]["oura-heartrate"]
-    filepath = Path(filepath).expanduser()
-    with open(filepath) as f:
-        raw = json.load(f)
-        data_heartrate = [
-            (iso8601.parse_date(entry["timestamp"]), entry["bpm"])
-            for entry in raw["heart_rate"]
-        ]
-        df = pd.DataFrame(data_heartrate, columns=["timestamp", "bpm"])
-
-    filepath = load_config()["data"]["oura-sleep"]
-    filepath = Path(filepath).expanduser()
-    with open(filepath) as f:
-        raw = json.load(f)
-        nights_hr = [
-            (
-                entry["bedtime_start"],
-                entry["heart_rate"]["items"],
-                entry["heart_rate"]["interval"],
-            )
-            for entry in raw["sleep"]
-            if "heart_rate" in entry
-        ]
-        data_heartrate_sleep = [
-            (iso8601.parse_date(start) + i * timedelta(seconds=interval), bpm)
-            for (start, bpms, interval) in nights_hr
-            for (i, bpm) in enumerate(bpms)
-        ]
-        df_heartrate_sleep = pd.DataFrame(
-            data_heartrate_sleep, columns=["timestamp", "bpm"]
-        )
-
-    df = df.combine_first(df_heartrate_sleep)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df = df.set_index("timestamp")
-    # drop zeros
-    df = df[df["bpm"] > 0]
+    """
+    Loads heart rate samples, from both the daytime heart rate export and the
+    per-night heart rate series in the sleep export.
+    """
+    raw = _load_json("oura-heartrate")
+    timestamp = _to_ns([entry["timestamp"] for entry in raw["heart_rate"]])
+    bpm = np.array([entry["bpm"] for entry in raw["heart_rate"]], dtype=float)
+
+    ts_sleep, bpm_sleep = _expand_sleep_heartrate(_load_json("oura-sleep")["sleep"])
+
+    df = pd.DataFrame(
+        {"hr": np.concatenate([bpm, bpm_sleep])},
+        index=pd.to_datetime(
+            np.concatenate([timestamp, ts_sleep]), unit="ns", utc=True
+        ).rename("timestamp"),
+    )
+    # drop zeros (and missing samples)
+    df = df[df["hr"] > 0]
+    return df.sort_index(kind="stable")
+
+
+def _expand_sleep_heartrate(sleep: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expands the heart rate series of each night into timestamps (ns) and bpm.
+
+    Each night has a start and an interval, so sample i is at start + i * interval.
+    """
+    nights = [entry for entry in sleep if entry.get("heart_rate")]
+    if not nights:
+        return np.empty(0, np.int64), np.empty(0)
+    starts = _to_ns([entry["bedtime_start"] for entry in nights])
+    intervals = np.array(
+        [round(entry["heart_rate"]["interval"] * 1e9) for entry in nights],
+        dtype=np.int64,
+    )
+    lengths = np.array([len(entry["heart_rate"]["items"]) for entry in nights])
+    # missing samples are null, which become NaN
+    bpm = np.array(
+        list(itertools.chain.from_iterable(e["heart_rate"]["items"] for e in nights)),
+        dtype=float,
+    )
+    # position of each sample within its night
+    position = np.arange(len(bpm)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    timestamp = np.repeat(starts, lengths) + position * np.repeat(intervals, lengths)
+    return timestamp, bpm
 
-    # rename bpm to hr
-    df = df.rename(columns={"bpm": "hr"})  # type: ignore
 
-    return df
+def _to_ns(timestamps: list[str]) -> np.ndarray:
+    """Parses ISO 8601 timestamps (with any UTC offset) into ns since epoch."""
+    return pd.to_datetime(timestamps, utc=True, format="ISO8601").as_unit("ns").asi8
 
 
 @click.command()
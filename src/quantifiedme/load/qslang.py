@@ -1,3 +1,4 @@
+import functools
 import logging
 from datetime import timedelta
 
@@ -15,90 +16,91 @@ from ..config import load_config
 logger = logging.getLogger(__name__)
 
 
-class DuplicateFilter:
+@functools.cache
+def dose_to_base_units(amount: str) -> float | None:
     """
-    Filters away duplicate log messages.
-    Modified version of: https://stackoverflow.com/a/31953563/965332
+    Parses a dose amount like "100mg" and returns its magnitude in base units,
+    or None if the unit is not known to pint.
+
+    Cached, since pint parsing is slow and a log only has a few hundred
+    distinct amounts (which also means each unknown unit is warned about once).
     """
+    try:
+        quantity = ureg(amount)
+    except pint.UndefinedUnitError as e:
+        logger.warning(e)
+        return None
+    if isinstance(quantity, (int, float)):
+        return quantity
+    return quantity.to_base_units().magnitude
 
-    def __init__(self, logger):
-        self.msgs = set()
-        self.logger = logger
 
-    def filter(self, record):
-        msg = str(record.msg)
-        is_duplicate = msg in self.msgs
-        if not is_duplicate:
-            self.msgs.add(msg)
-        return not is_duplicate
+def _dose_amount(e: Event) -> str | None:
+    """
+    Returns the amount string of a dose event, or None if the amount is unknown.
 
-    def __enter__(self):
-        self.logger.addFilter(self)
+    Event data can contain either:
+     - "amount" (string-formatted amount)
+     - "dose" (dict with "amount" and "unit" keys)
+    """
+    if "?" in e.data.get("amount", ""):
+        return None
+    dose = e.data.get("dose")
+    if dose:
+        return f"{dose.get('amount', '')}{dose.get('unit', '')}"
+    assert "amount" in e.data
+    return e.data["amount"]
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.logger.removeFilter(self)
+
+def _normalize_doses(events: list[Event]) -> np.ndarray:
+    """
+    Returns the dose of each event in base units: 0 for non-dose events and
+    doses with unknown units, NaN for doses with an unknown amount.
+    """
+    doses = np.zeros(len(events))
+    amounts = pd.Series(
+        {i: _dose_amount(e) for i, e in enumerate(events) if e.type == "dose"},
+        dtype=object,
+    )
+    if amounts.empty:
+        return doses
+    # parse each distinct amount once, then map the factors onto all doses
+    factors = {
+        amount: dose_to_base_units(amount) or 0.0
+        for amount in amounts.dropna().unique()
+    }
+    doses[amounts.index] = amounts.map(factors).astype(float)
+    return doses
 
 
 @memory.cache
-def load_df(events: list[Event] | None = None) -> pd.DataFrame:
+def load_df(events: list[Event] | None = None, keep_data: bool = False) -> pd.DataFrame:
+    """
+    Returns a dataframe with one row per event, with the dose in base units.
+
+    Set `keep_data` to include the raw event data in a `data` column.
+    """
     if events is None:
         events = load_events()
     events = list(events)
 
-    with DuplicateFilter(logger):
-        for e in events:
-            if e.type != "dose":
-                continue
-            try:
-                # event data can contain either:
-                #  - "amount" (string-formatted amount)
-                #  - "dose" (dict with "amount" and "unit" keys)
-
-                # If amount is unknown, we should use the mean dose for the substance in its place,
-                # so we'll set it to np.nan in the meantime
-                if "?" in e.data.get("amount", ""):
-                    e.data["amount_pint"] = np.nan
-                else:
-                    dose = e.data.get("dose")
-                    if dose:
-                        amount = dose.get("amount", "")
-                        unit = dose.get("unit", "")
-                        e.data["amount_pint"] = ureg(f"{amount}{unit}")
-                    else:
-                        assert "amount" in e.data
-                        e.data["amount_pint"] = ureg(e.data["amount"])
-
-                    if not isinstance(e.data["amount_pint"], (int, float)):
-                        e.data["amount_pint"] = (
-                            e.data["amount_pint"].to_base_units().magnitude
-                        )
-            except pint.UndefinedUnitError as e:
-                logger.warning(e)
-
     date_offset = timedelta(hours=load_config()["me"]["date_offset_hours"])
 
     df = pd.DataFrame(
-        [
-            {
-                "timestamp": e.timestamp,
-                "date": (e.timestamp - date_offset).date(),
-                "substance": e.data.get("substance"),
-                "dose": e.data.get("amount_pint") or 0,
-                # FIXME: Only supports one tag
-                "tag": sorted(e.data.get("tags") or {"none"})[0],
-                "data": e.data,
-            }
-            for e in events
-        ]
+        {
+            "timestamp": [e.timestamp for e in events],
+            "date": [(e.timestamp - date_offset).date() for e in events],
+            "substance": [e.data.get("substance") for e in events],
+            "dose": _normalize_doses(events),
+            # FIXME: Only supports one tag
+            "tag": [min(e.data.get("tags") or {"none"}) for e in events],
+        }
     )
+    if keep_data:
+        df["data"] = [e.data for e in events]
 
-    # Replace NaN with mean of non-zero doses
-    for substance in set(df["substance"]):
-        doses = df[df["substance"] == substance]["dose"]
-        mean_dose = doses.dropna().mean()
-        df.loc[df["substance"] == substance, ["dose"]] = doses.replace(
-            np.nan, mean_dose
-        )
+    # Replace NaN (unknown amount) with mean of known doses for the substance
+    df["dose"] = df["dose"].fillna(df.groupby("substance")["dose"].transform("mean"))
 
     return df
 
@@ -137,28 +139,62 @@ def to_series(
     return series
 
 
-def load_daily_df(events: list[Event] | None = None) -> pd.DataFrame:
-    """Returns a daily dataframe"""
+def load_daily_df(
+    events: list[Event] | None = None, sparse: bool = False
+) -> pd.DataFrame:
+    """
+    Returns a daily dataframe with the number of doses per tag (``tag:<tag>``)
+    and the total dose per substance (lowercased, without dashes and spaces).
+
+    Both are built with a single groupby over all doses. Each column covers the
+    days from its first to its last entry, and the index is the union of those.
+    Set `sparse` to get a sparse frame, since most substances are rarely taken.
+    """
     if events is None:
         events = load_events()
+    events = list(events)
     df_src = load_df(events)
-    df = pd.DataFrame()
-
-    tags = {tag for e in events for tag in e.data.get("tags", [])}
-    series_tags = {
-        f"tag:{tag}": to_series(df_src, tag=tag).replace(np.nan, 0) for tag in tags
-    }
-
-    substances = {s for s in df_src["substance"] if s}
-    series_subst = {
-        subst.lower().replace("-", "").replace(" ", ""): to_series(
-            df_src, substance=subst
-        )
-        for subst in substances
-    }
-    df = pd.concat([df, pd.DataFrame(series_tags), pd.DataFrame(series_subst)], axis=1)
-    df = df.fillna(0)
+    df_src = df_src.assign(date=pd.to_datetime(df_src["date"]))
+
+    tags = sorted({tag for e in events for tag in e.data.get("tags", [])})
+    counts = df_src[df_src["tag"].isin(tags)].groupby(["date", "tag"]).size().unstack()
+    counts = counts.reindex(columns=tags).add_prefix("tag:")
+
+    substance = (
+        df_src["substance"]
+        .where(df_src["substance"].astype(bool))
+        .str.lower()
+        .str.replace("-", "")
+        .str.replace(" ", "")
+    )
+    doses = (
+        df_src.assign(substance=substance)
+        .dropna(subset=["substance"])
+        .groupby(["date", "substance"])["dose"]
+        .sum()
+        .unstack()
+    )
 
+    df = pd.concat([counts, doses], axis=1)
+    df.columns.name = None
+    if df.empty:
+        return df
+
+    # Days without doses are NaN until here, which tells us each column's range
+    days = pd.date_range(df.index.min(), df.index.max(), freq="D")
+    present = df.reindex(days).notna().to_numpy()
+    has_doses = present.any(axis=0)
+    first = present.argmax(axis=0)[has_doses]
+    last = len(days) - 1 - present[::-1].argmax(axis=0)[has_doses]
+    coverage = np.zeros(len(days) + 1, dtype=np.int64)
+    np.add.at(coverage, first, 1)
+    np.add.at(coverage, last + 1, -1)
+    covered = np.cumsum(coverage[:-1]) > 0
+    df = df.reindex(days if covered.all() else days[covered]).fillna(0.0)
+    df = df.astype(float)
+
+    if sparse:
+        df = df.astype(pd.SparseDtype(float, 0.0))
     return df
 
 
@@ -8,60 +8,150 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import aw_client
+import ijson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from aw_core.models import Event
-from aw_transform.union_no_overlap import union_no_overlap
 
+from ..cache import cache_dir, fingerprint
 from ..config import load_config
+from ..eventstore import SCHEMA, EventStore, table_to_events
+from ..merge import merge_events
 
+# Activities (substrings) that are kept, everything else is dropped
+PHONE_ACTIVITIES = ("phone:", "call:")
 
-def load_events(since: datetime) -> list[Event]:
+
+def load_events(since: datetime, store: EventStore | None = None) -> list[Event]:
+    """
+    Loads smartertime events after `since` from all devices, merged without overlap.
+
+    The events are read from the tables of each device (see `load_tables`).
+    """
     # TODO: allow loading directly from export, so we don't need to manually convert to aw-bucket json
-    events_smartertime: list[Event] = []
     # TODO: underspecified hostname priority
-    for events in _load_smartertime_devices(since).values():
-        events_smartertime = union_no_overlap(events_smartertime, events)
-    return events_smartertime
+    return merge_events(
+        [list(table_to_events(table)) for table in load_tables(since, store).values()]
+    )
 
 
-def _load_smartertime_devices(since: datetime) -> dict[str, list]:
-    """Loads smartertime data from all devices/files specified in config"""
+def load_tables(
+    since: datetime, store: EventStore | None = None
+) -> dict[str, pa.Table]:
+    """
+    Loads smartertime data from all devices/files specified in config.
 
-    result = {}
-    for hostname, smartertime_awbucket_path in load_config()["data"][
-        "smartertime_buckets"
-    ].items():
-        events = _load_smartertime_events(
-            since, filepath=str(Path(smartertime_awbucket_path).expanduser())
-        )
-        for e in events:
-            e.data["$source"] = "smartertime"
-            e.data["$hostname"] = hostname
-        result[hostname] = events
-    return result
+    Returns a table per hostname with the events after `since`, in the schema
+    of the event store. The tables are read from the store, synced first (see
+    `sync_tables`).
+    """
+    store = sync_tables(store)
+    since_scalar = pa.scalar(
+        since.astimezone(timezone.utc), type=SCHEMA.field("timestamp").type
+    )
+    tables = {}
+    for hostname in _smartertime_buckets():
+        # the store reads `timestamp >= since`, events at `since` are left out
+        table = store.scan(start=since, parts=[hostname])
+        tables[hostname] = table.filter(pc.greater(table["timestamp"], since_scalar))
+    return tables
+
+
+def sync_tables(store: EventStore | None = None) -> EventStore:
+    """
+    Writes all events of each device to an event store, one part per hostname,
+    and returns the store.
+
+    A part is keyed by a fingerprint of its export, and only re-parsed and
+    rewritten when the export changes. Parts of devices no longer in the
+    config are removed.
+    """
+    store = store or EventStore(cache_dir / "smartertime")
+    buckets = _smartertime_buckets()
+    for hostname, path in buckets.items():
+        key = fingerprint([path])
+        if (store.metadata(hostname) or {}).get("source_key") != key:
+            table = _load_smartertime_table(None, path, hostname)
+            store.write(table, name=hostname, metadata={"source_key": key})
+    for name in set(store.parts()) - set(buckets):
+        store.remove(name)
+    return store
+
+
+def _smartertime_buckets() -> dict[str, Path]:
+    """Paths of the smartertime exports by hostname, in config order."""
+    return {
+        hostname: Path(path).expanduser()
+        for hostname, path in load_config()["data"]["smartertime_buckets"].items()
+    }
 
 
 def _load_smartertime_events(since: datetime, filepath) -> list[Event]:
     """Loads smartertime data from a single json file (generated below)"""
+    return list(table_to_events(_load_smartertime_table(since, filepath)))
 
-    print(f"Loading smartertime data from {filepath}")
-    with open(filepath) as f:
-        data = json.load(f)
-        events = [Event(**e) for e in data["events"]]
-
-    # Filter out events before `since`
-    events = [e for e in events if since.astimezone(timezone.utc) < e.timestamp]
 
-    # Filter out no-events and non-phone events
-    events = [
-        e for e in events if any(s in e.data["activity"] for s in ["phone:", "call:"])
-    ]
+def _load_smartertime_table(
+    since: datetime | None, filepath: Path | str, hostname: str | None = None
+) -> pa.Table:
+    """
+    Loads phone events after `since` (or all, if None) from a single json file,
+    as an event store table.
 
-    # Normalize to window-bucket data schema
-    for e in events:
-        e.data["app"] = e.data["activity"]
-        e.data["title"] = e.data["app"]
+    The bucket is streamed, and events are filtered by activity before anything
+    but their raw fields is kept. Timestamps are parsed in bulk (as ISO 8601,
+    taken as UTC if they have no offset), and filtered by `since` before the
+    table is built.
+    """
+    print(f"Loading smartertime data from {filepath}")
+    raw_timestamps: list[str] = []
+    durations: list[float] = []
+    activities: list[str] = []
+    extras: list[str] = []
+    with open(filepath, "rb") as f:
+        for e in ijson.items(f, "events.item", use_float=True):
+            # Filter out no-events and non-phone events
+            activity = e["data"]["activity"]
+            if not any(s in activity for s in PHONE_ACTIVITIES):
+                continue
+            raw_timestamps.append(e["timestamp"])
+            durations.append(e["duration"])
+            activities.append(activity)
+            extras.append(json.dumps(e["data"]))
 
-    return events
+    # Filter out events before `since`
+    timestamps = pd.to_datetime(raw_timestamps, utc=True, format="ISO8601")
+    keep = (
+        np.flatnonzero(timestamps > since.astimezone(timezone.utc))
+        if since is not None
+        else np.arange(len(timestamps))
+    )
+    n = len(keep)
+    activity_column = pa.array(activities, pa.string()).take(keep)
+
+    # Normalize to window-bucket data schema, with the activity as app and title
+    table = pa.table(
+        {
+            # truncated to microseconds, like the store
+            "timestamp": pa.array(timestamps[keep]).cast(
+                SCHEMA.field("timestamp").type, safe=False
+            ),
+            "duration": np.round(np.array(durations, dtype=float)[keep] * 1e6).astype(
+                np.int64
+            ),
+            "hostname": [hostname] * n,
+            "source": ["smartertime"] * n,
+            "app": activity_column,
+            "title": activity_column,
+            "url": [None] * n,
+            "tags": [None] * n,
+            "extra": pa.array(extras, pa.string()).take(keep),
+        },
+        schema=SCHEMA,
+    )
+    return table.sort_by("timestamp")
 
 
 def read_csv_to_events(filepath):
@@ -13,12 +13,18 @@ Supports two export formats:
 Format is auto-detected from directory contents.
 """
 
+import hashlib
+import os
 from datetime import timedelta
 from pathlib import Path
 from typing import Literal
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
+from ..cache import cache_dir, fingerprint
 from ..config import load_config
 
 WhoopFormat = Literal["standard", "gdpr"]
@@ -305,30 +311,105 @@ def _question_to_key(question: str) -> str:
 # ── GDPR full export (legacy) ─────────────────────────────────────────────────
 
 
-def _load_heartrate_gdpr(d: Path) -> pd.DataFrame:
-    """Granular per-minute HR from the GDPR-export ``Health/metrics*.csv`` files."""
+# Health/metrics-*.csv columns (GDPR full export): hr, accel_x, accel_y,
+# accel_z, skin_temp, ts — one row per minute. Values are stored compactly:
+# hr as uint8 and the sensor readings as float32 (missing values are null).
+METRICS_SCHEMA = pa.schema(
+    [
+        ("ts", pa.timestamp("us", tz="UTC")),
+        ("hr", pa.uint8()),
+        ("accel_x", pa.float32()),
+        ("accel_y", pa.float32()),
+        ("accel_z", pa.float32()),
+        ("skin_temp", pa.float32()),
+    ]
+)
+
+
+def _metrics_files(d: Path) -> list[Path]:
     health = d / "Health"
     if not health.is_dir():
         raise FileNotFoundError(f"Whoop GDPR Health/ dir not found at {health}")
-
-    # Health/metrics-*.csv columns (GDPR full export): hr, accel_x, accel_y,
-    # accel_z, skin_temp, ts — one row per minute. Multiple files split by
-    # date range; concatenated here.
-    dfs = []
-    for file in health.iterdir():
-        if file.name.startswith("metrics") and file.name.endswith(".csv"):
-            df = pd.read_csv(file, parse_dates=True)
-            dfs.append(df)
-    if not dfs:
+    files = sorted(
+        file
+        for file in health.iterdir()
+        if file.name.startswith("metrics") and file.name.endswith(".csv")
+    )
+    if not files:
         raise FileNotFoundError(f"No metrics*.csv files in {health}")
+    return files
 
-    df = pd.concat(dfs, ignore_index=True)
-    df = df.set_index(pd.DatetimeIndex(df["ts"]))
-    del df["ts"]
-    # Only HR kept here; accel_*/skin_temp available in raw df if needed
-    df = df[["hr"]].sort_index()
-    df.index.name = "timestamp"
-    return df
+
+def _convert_metrics_csv(src: Path, dst: Path, key: str) -> None:
+    """
+    Streams a metrics CSV into a Parquet file with `METRICS_SCHEMA`.
+
+    The CSV is parsed block by block by the Arrow reader (multithreaded, with
+    the column types given up front), so memory use doesn't grow with the file.
+    Timestamps without an offset are taken as UTC.
+    """
+    value_columns = [f for f in METRICS_SCHEMA if f.name != "ts"]
+    reader = pacsv.open_csv(
+        src,
+        convert_options=pacsv.ConvertOptions(
+            column_types={f.name: f.type for f in value_columns},
+            include_columns=METRICS_SCHEMA.names,
+            include_missing_columns=True,
+        ),
+    )
+    schema = METRICS_SCHEMA.with_metadata({"source_key": key})
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst.with_suffix(".parquet.tmp")
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for batch in reader:
+            columns = [batch.column(f.name).cast(f.type) for f in METRICS_SCHEMA]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+    os.replace(tmp_path, dst)
+
+
+def _source_key(path: Path) -> str | None:
+    metadata = pq.read_schema(path).metadata or {}
+    key = metadata.get(b"source_key")
+    return key.decode() if key is not None else None
+
+
+def _metrics_cache_path(src: Path) -> Path:
+    digest = hashlib.sha256(str(src.resolve()).encode()).hexdigest()[:12]
+    return cache_dir / "whoop" / f"{src.stem}-{digest}.parquet"
+
+
+def load_metrics_df(
+    d: Path | None = None, columns: list[str] | None = None
+) -> pd.DataFrame:
+    """
+    Granular per-minute metrics from the GDPR-export ``Health/metrics*.csv`` files.
+
+    Each CSV is converted once into a Parquet file in the cache, which is reused
+    until the CSV changes, so loading is bound by I/O rather than CSV parsing.
+    Only `columns` (default: all of hr, accel_x/y/z and skin_temp) are read.
+    """
+    if d is None:
+        d = _whoop_dir()
+    if columns is None:
+        columns = [name for name in METRICS_SCHEMA.names if name != "ts"]
+
+    tables = []
+    for src in _metrics_files(d):
+        dst = _metrics_cache_path(src)
+        key = fingerprint([src])
+        if not dst.exists() or _source_key(dst) != key:
+            _convert_metrics_csv(src, dst, key)
+        tables.append(pq.read_table(dst, columns=["ts", *columns]))
+
+    df = pa.concat_tables(tables).to_pandas()
+    df = df.set_index(pd.DatetimeIndex(df.pop("ts"), name="timestamp"))
+    return df.sort_index(kind="stable")
+
+
+def _load_heartrate_gdpr(d: Path) -> pd.DataFrame:
+    """Granular per-minute HR from the GDPR-export ``Health/metrics*.csv`` files."""
+    # Only HR kept here; accel_*/skin_temp available through load_metrics_df
+    return load_metrics_df(d, columns=["hr"])
 
 
 def _load_sleep_gdpr(d: Path) -> pd.DataFrame:
@@ -0,0 +1,153 @@
+"""
+Merges events from several sources (e.g. hosts) into one list without overlap.
+
+Sources are given in priority order: where events overlap, the one from the
+earliest source is kept, and events from later sources are cut to the parts
+not covered by it. Zero-duration events of later sources are dropped if they
+are within (or at the bounds of) an event of an earlier source.
+
+This is what folding the sources with ``aw_transform.union_no_overlap`` is
+meant to do, but done in a single sweep over sorted arrays of start and end
+times (in microseconds), rather than a pass over the growing merged list (and
+a deepcopy of it) per source. It also fixes that ``union_no_overlap`` only
+cuts the first of several later events overlapping an event, leaving overlaps
+for ``verify_no_overlap`` to warn about.
+
+The sweep requires every source to be sorted and free of overlap with itself,
+which is verified as part of it; if a source isn't, the merge warns and falls
+back to ``union_no_overlap``.
+"""
+
+import logging
+from collections.abc import Sequence
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from aw_core import Event
+from aw_transform.union_no_overlap import union_no_overlap
+
+logger = logging.getLogger(__name__)
+
+# The time base of the arrays of `event_arrays`: microseconds since the epoch
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+US = timedelta(microseconds=1)
+
+
+def event_arrays(events: list[Event]) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end times of `events`, in microseconds since the epoch."""
+    # Reads the fields directly, skipping the property getters (`Event` already
+    # keeps the timestamp in UTC)
+    starts = np.fromiter(
+        ((e["timestamp"] - EPOCH) // US for e in events), np.int64, len(events)
+    )
+    durations = np.fromiter(
+        (e["duration"] // US for e in events), np.int64, len(events)
+    )
+    return starts, starts + durations
+
+
+def merge_intervals(
+    starts: Sequence[np.ndarray], ends: Sequence[np.ndarray]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None:
+    """
+    Merges sources of [start, end) intervals, earlier sources taking precedence.
+
+    Each source must be sorted and not overlap itself, or None is returned.
+    Returns the source, index (within the source), start and end of each piece
+    of the result, sorted by start. An interval of a later source may be cut
+    into several pieces, or dropped entirely.
+
+    Zero-length intervals are kept unless they are within (or at the bounds
+    of) an interval of an earlier source.
+    """
+    n = len(starts)
+    for s, e in zip(starts, ends, strict=True):
+        if (e < s).any() or (s[1:] < e[:-1]).any():
+            return None
+
+    # Sweep over the elementary segments between all bounds, finding the
+    # highest-priority interval covering each one.
+    positive = [e > s for s, e in zip(starts, ends, strict=True)]
+    bounds = np.unique(np.concatenate([np.empty(0, np.int64), *starts, *ends]))
+    segments = bounds[:-1]
+    source = np.full(len(segments), -1, np.int64)
+    index = np.full(len(segments), -1, np.int64)
+    for k in reversed(range(n)):
+        idx = np.flatnonzero(positive[k])
+        if not len(idx) or not len(segments):
+            continue
+        i = np.searchsorted(starts[k][idx], segments, side="right") - 1
+        covered = (i >= 0) & (ends[k][idx][np.maximum(i, 0)] > segments)
+        source[covered] = k
+        index[covered] = idx[i[covered]]
+
+    # Consecutive segments covered by the same interval make up a piece
+    change = np.ones(len(segments), bool)
+    change[1:] = (source[1:] != source[:-1]) | (index[1:] != index[:-1])
+    first = np.flatnonzero(change)
+    last = np.append(first[1:], len(segments))[: len(first)]
+    keep = source[first] >= 0
+    pieces = [
+        [source[first][keep]],
+        [index[first][keep]],
+        [bounds[first][keep]],
+        [bounds[last][keep]],
+    ]
+
+    # Zero-length intervals, unless covered by an earlier source
+    for k in range(n):
+        idx = np.flatnonzero(~positive[k])
+        t = starts[k][idx]
+        covered = np.zeros(len(idx), bool)
+        for j in range(k):
+            if len(idx) and len(starts[j]):
+                i = np.searchsorted(starts[j], t, side="right") - 1
+                covered |= (i >= 0) & (ends[j][np.maximum(i, 0)] >= t)
+        for piece, values in zip(
+            pieces, [np.full(len(idx), k), idx, t, t], strict=True
+        ):
+            piece.append(values[~covered])
+
+    source, index, start, end = (np.concatenate(piece) for piece in pieces)
+    order = np.lexsort((source, start))
+    return source[order], index[order], start[order], end[order]
+
+
+def merge_events(sources: Sequence[list[Event]]) -> list[Event]:
+    """
+    Merges lists of events into one without overlap, earlier lists taking precedence.
+
+    Events that are kept whole are returned as is, and the pieces of cut events
+    are new events with a copy of the data. Each list must be sorted by
+    timestamp; if a list overlaps itself, this warns and falls back to folding
+    the lists with ``union_no_overlap``.
+    """
+    arrays = [event_arrays(events) for events in sources]
+    starts, ends = [s for s, _ in arrays], [e for _, e in arrays]
+    merged = merge_intervals(starts, ends)
+    if merged is None:
+        logger.warning("Found overlapping events, merging with union_no_overlap")
+        events_union: list[Event] = []
+        for events in sources:
+            events_union = union_no_overlap(events_union, events)
+        return events_union
+
+    result = []
+    whole = [(s.tolist(), e.tolist()) for s, e in zip(starts, ends, strict=True)]
+    for k, i, start, end in zip(*(a.tolist() for a in merged), strict=True):
+        e = sources[k][i]
+        if start == whole[k][0][i] and end == whole[k][1][i]:
+            result.append(e)
+        else:
+            # a piece of a cut event (its timestamp is truncated to
+            # milliseconds by `Event`, as in union_no_overlap)
+            result.append(
+                Event(
+                    id=e.id,
+                    timestamp=EPOCH + start * US,
+                    duration=(end - start) * US,
+                    data=deepcopy(e.data),
+                )
+            )
+    return result
@@ -12,6 +12,7 @@ dose, and the kernel sums contributions from the past `window` days.
 """
 
 import logging
+from collections.abc import Sequence
 
 import numpy as np
 import pandas as pd
@@ -59,19 +60,68 @@ def decay_kernel(
     Returns:
         Series of same length with decay-weighted values.
     """
-    if tau <= 0:
-        raise ValueError(f"tau must be positive, got {tau}")
+    values = series.fillna(0).to_numpy(dtype=float)[:, np.newaxis]
+    result_values = decay_kernels(values, taus=[tau], window=window)[:, 0]
+    return pd.Series(result_values, index=series.index, dtype=float)
 
-    weights = np.exp(-np.arange(window) / tau)
-    values = series.fillna(0).values.astype(float)
 
-    # Vectorized convolution: pad with zeros on the left, convolve with weights
-    padded = np.concatenate([np.zeros(window - 1), values])
-    result_values = np.array(
-        [np.dot(padded[i : i + window][::-1], weights) for i in range(len(values))]
-    )
+def decay_kernels(
+    values: np.ndarray,
+    taus: list[float] | np.ndarray,
+    window: int | Sequence[int] = 7,
+) -> np.ndarray:
+    """Apply exponential decay kernels to every column of a 2D array at once.
 
-    return pd.Series(result_values, index=series.index, dtype=float)
+    Same as :func:`decay_kernel`, but for a (days, columns) array with one
+    τ per column. To compute several τ variants of the same series, repeat
+    its column with each τ.
+
+    Several windows can be given at once, in which case the weighted sums
+    are accumulated once up to the longest window, and the result for each
+    shorter window is taken along the way.
+
+    Args:
+        values: Array of shape (days, columns), without NaNs.
+        taus: Decay constant in days for each column. ``np.inf`` gives
+            uniform weights (a trailing sum).
+        window: Number of past days to consider, or a sequence of them.
+
+    Returns:
+        Array of the same shape with decay-weighted values, or for a
+        sequence of windows, of shape (windows, days, columns).
+    """
+    taus = np.asarray(taus, dtype=float)
+    if (taus <= 0).any():
+        raise ValueError(f"tau must be positive, got {taus[taus <= 0]}")
+    windows = np.atleast_1d(np.asarray(window, dtype=int))
+    if windows.size == 0 or (windows <= 0).any():
+        raise ValueError(f"window must be a positive number of days, got {window}")
+
+    # weights[k, j] = exp(-k / tau_j)
+    weights = np.exp(-np.arange(windows.max())[:, np.newaxis] / taus[np.newaxis, :])
+    result = _weighted_window_sums(np.asarray(values, dtype=float), weights, windows)
+    return result[0] if np.ndim(window) == 0 else result
+
+
+def _weighted_window_sums(
+    values: np.ndarray, weights: np.ndarray, windows: np.ndarray
+) -> np.ndarray:
+    """Computes Σ_{k<window} values[t-k, j] * weights[k, j] for each of `windows`,
+    treating days before the start as 0.
+
+    A causal convolution along the time axis, done as one vectorized
+    multiply-add of the shifted array per lag, so the cost is
+    O(max(windows) × days × columns) with no per-day Python loop. The sum is
+    copied out as it reaches each window, so shorter windows share the pass.
+    """
+    n_days = values.shape[0]
+    results = np.empty((len(windows), *values.shape))
+    result = np.zeros_like(values)
+    for k in range(windows.max()):
+        if k < n_days:
+            result[k:] += values[: n_days - k] * weights[k]
+        results[windows == k + 1] = result
+    return results
 
 
 def build_substance_features(
@@ -82,6 +132,8 @@ def build_substance_features(
 ) -> pd.DataFrame:
     """Build decay kernel features for substance tags.
 
+    All substances are computed together in a single 2D pass.
+
     Args:
         df: DataFrame with `tag:*` columns (binary 0/1).
         top_n: If set, keep only the N most frequent substances.
@@ -102,24 +154,33 @@ def build_substance_features(
     if top_n is not None:
         active_tags = frequencies[active_tags].nlargest(top_n).index.tolist()
 
-    features = pd.DataFrame(index=df.index)
-
-    for col in active_tags:
-        substance = col.removeprefix("tag:")
-        tau = SUBSTANCE_DECAY_DAYS.get(substance, DEFAULT_DECAY_DAYS)
-
-        # Raw binary (today)
-        features[f"decay:{substance}:today"] = df[col].fillna(0)
+    if not active_tags:
+        return pd.DataFrame(index=df.index)
 
-        # Decay kernel (accumulated exposure)
-        features[f"decay:{substance}:kernel"] = decay_kernel(df[col], tau=tau, window=window)
+    substances = [col.removeprefix("tag:") for col in active_tags]
+    taus = [SUBSTANCE_DECAY_DAYS.get(s, DEFAULT_DECAY_DAYS) for s in substances]
+
+    # Raw binary (today)
+    today = df[active_tags].fillna(0).to_numpy(dtype=float)
+    # Decay kernel (accumulated exposure), and the simple trailing sum (how
+    # many of past N days) as τ = inf, in the same pass
+    n = len(substances)
+    kernel, count = np.hsplit(
+        decay_kernels(
+            np.hstack([today, today]), taus=[*taus, *[np.inf] * n], window=window
+        ),
+        [n],
+    )
 
-        # Simple trailing sum (how many of past N days)
-        features[f"decay:{substance}:count_{window}d"] = (
-            df[col].fillna(0).rolling(window, min_periods=1).sum()
+    columns = {}
+    for i, substance in enumerate(substances):
+        columns[f"decay:{substance}:today"] = df[active_tags[i]].fillna(0)
+        columns[f"decay:{substance}:kernel"] = pd.Series(kernel[:, i], index=df.index)
+        columns[f"decay:{substance}:count_{window}d"] = pd.Series(
+            count[:, i], index=df.index
         )
 
-    return features
+    return pd.DataFrame(columns, index=df.index)
 
 
 def build_screentime_features(
@@ -161,9 +222,7 @@ def build_screentime_features(
             features[f"lag:{name}:d-{lag}"] = df[col].shift(lag)
 
         # 7-day rolling mean
-        features[f"roll:{name}:7d_mean"] = (
-            df[col].rolling(7, min_periods=1).mean()
-        )
+        features[f"roll:{name}:7d_mean"] = df[col].rolling(7, min_periods=1).mean()
 
         # 7-day rolling std (consistency/volatility)
         features[f"roll:{name}:7d_std"] = (
@@ -226,7 +285,9 @@ def build_autoregressive_features(
 
     # Rolling statistics
     features[f"ar:{name}:7d_mean"] = df[target_col].rolling(7, min_periods=1).mean()
-    features[f"ar:{name}:7d_std"] = df[target_col].rolling(7, min_periods=1).std().fillna(0)
+    features[f"ar:{name}:7d_std"] = (
+        df[target_col].rolling(7, min_periods=1).std().fillna(0)
+    )
     features[f"ar:{name}:14d_mean"] = df[target_col].rolling(14, min_periods=1).mean()
 
     return features
@@ -0,0 +1,122 @@
+"""
+Validates events loaded from a source before they are merged with other sources.
+
+The checks run on arrays of start and end times rather than on the events one
+by one, and instead of failing on the first bad event they report how many
+events of each source fail each check (with a few examples). Depending on
+`on_invalid`, invalid events are then repaired, only reported, or raise.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Literal
+
+import numpy as np
+from aw_core import Event
+
+from .merge import EPOCH, US, event_arrays
+
+logger = logging.getLogger(__name__)
+
+OnInvalid = Literal["raise", "warn", "repair"]
+
+# Number of example events kept per violation
+N_EXAMPLES = 3
+
+
+@dataclass
+class Violation:
+    """Events of a source failing a check, with the first few as examples."""
+
+    source: str
+    check: str
+    count: int
+    examples: list[tuple[datetime, timedelta]] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        examples = ", ".join(f"{ts} ({duration})" for ts, duration in self.examples)
+        return f"{self.source}: {self.count} events {self.check} (e.g. {examples})"
+
+
+def validate_events(
+    events: list[Event],
+    source: str,
+    since: datetime | None = None,
+    now: datetime | None = None,
+    on_invalid: OnInvalid = "repair",
+) -> tuple[list[Event], list[Violation]]:
+    """
+    Checks that the events of `source` are within [since, now], have no negative
+    durations, and are sorted without overlap.
+
+    Returns the events and the violations found. With ``on_invalid="repair"``
+    the events are repaired (in place): events are clipped to [since, now] and
+    sorted, overlapping events are cut at the start of the next one, and events
+    left without a duration (or with a negative one) are dropped. With
+    ``"warn"`` they are returned as is, and with ``"raise"`` a ValueError is
+    raised if there are any violations.
+    """
+    starts, ends = event_arrays(events)
+    checks = {"with negative duration": ends < starts}
+    if since is not None:
+        checks["before since"] = starts < (since - EPOCH) // US
+    if now is not None:
+        checks["after now"] = ends > (now - EPOCH) // US
+    checks["overlapping the previous event"] = np.append(False, starts[1:] < ends[:-1])
+
+    violations = []
+    for check, invalid in checks.items():
+        if count := int(np.count_nonzero(invalid)):
+            examples = [
+                (events[i].timestamp, events[i].duration)
+                for i in np.flatnonzero(invalid)[:N_EXAMPLES].tolist()
+            ]
+            violations.append(Violation(source, check, count, examples))
+    for violation in violations:
+        logger.warning(f"Invalid events: {violation}")
+    if not violations or on_invalid == "warn":
+        return events, violations
+    if on_invalid == "raise":
+        raise ValueError("Invalid events:\n" + "\n".join(str(v) for v in violations))
+    return _repair(events, starts, ends, since, now), violations
+
+
+def _repair(
+    events: list[Event],
+    starts: np.ndarray,
+    ends: np.ndarray,
+    since: datetime | None,
+    now: datetime | None,
+) -> list[Event]:
+    new_starts, new_ends = starts.copy(), ends.copy()
+    if since is not None:
+        # rounded up to whole milliseconds, since `Event` truncates timestamps
+        new_starts = np.maximum(new_starts, -(-((since - EPOCH) // US) // 1000) * 1000)
+    if now is not None:
+        new_ends = np.minimum(new_ends, (now - EPOCH) // US)
+
+    order = np.argsort(new_starts, kind="stable")
+    new_starts, new_ends = new_starts[order], new_ends[order]
+    keep = new_ends >= new_starts
+    # cut each event at the start of the next one (that's kept)
+    kept = np.flatnonzero(keep)
+    new_ends[kept[:-1]] = np.minimum(new_ends[kept[:-1]], new_starts[kept[1:]])
+    # drop events that had a duration, but were clipped to nothing
+    was_positive = ends[order] > starts[order]
+    keep &= (new_ends > new_starts) | ~was_positive
+
+    result = []
+    for i, start, end, changed in zip(
+        order[keep].tolist(),
+        new_starts[keep].tolist(),
+        new_ends[keep].tolist(),
+        ((new_starts != starts[order]) | (new_ends != ends[order]))[keep].tolist(),
+        strict=True,
+    ):
+        e = events[i]
+        if changed:
+            e.timestamp = EPOCH + start * US
+            e.duration = (end - start) * US
+        result.append(e)
+    return result
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from aw_core import Event
+
+from quantifiedme.classify import Classifier, load_rules
+from quantifiedme.config import rootdir
+from quantifiedme.eventstore import events_to_table
+
+t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+categories_example = rootdir / "categories.example.toml"
+
+
+def _event(**data) -> Event:
+    return Event(timestamp=t0, duration=timedelta(minutes=1), data=data)
+
+
+def test_load_rules():
+    rules = load_rules(categories_example)
+    assert ("Work", "Google (Sheets|Slides|Forms)", None) in rules
+    assert ("ActivityWatch", "[Aa]ctivity[Ww]atch|aw-.*", "Programming") in rules
+    # tables without a regex are only parents
+    assert ("Social Media", "", "Media") in rules
+
+
+def test_classify():
+    classifier = Classifier.from_toml(categories_example)
+    events = [
+        _event(app="Firefox", title="ActivityWatch - GitHub"),
+        _event(app="Firefox", title="Home", url="https://reddit.com/r/all"),
+        _event(app="Spotify", title="Song"),
+        _event(app="Terminal", title="vim"),
+        _event(title="YouTube"),
+    ]
+    tags = [e.data["$tags"] for e in classifier.classify(events)]
+    assert tags == [
+        {"ActivityWatch", "Programming", "Work"},
+        {"Reddit", "Social Media", "Media"},
+        {"Music", "Media"},
+        {"Uncategorized"},
+        {"YouTube", "Media"},
+    ]
+
+
+def test_with_parents():
+    classifier = Classifier.from_toml(categories_example)
+    assert classifier.with_parents(["ActivityWatch"]) == (
+        "ActivityWatch",
+        "Programming",
+        "Work",
+    )
+    assert classifier.with_parents([]) == ("Uncategorized",)
+    assert ("Music", "Spotify") in classifier.rules
+
+
+def test_classify_unique_and_persisted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    categories = tmp_path / "categories.toml"
+    categories.write_text(categories_example.read_text())
+    classified = []
+    classify_key = Classifier._classify_key
+
+    def _classify_key(self, key):
+        classified.append(key)
+        return classify_key(self, key)
+
+    monkeypatch.setattr(Classifier, "_classify_key", _classify_key)
+
+    events = [_event(app="Firefox", title=f"YouTube {i % 3}") for i in range(10)]
+    Classifier.from_toml(categories, cache_dir=tmp_path).classify(events)
+    # each unique (app, title, url) is classified once
+    assert len(classified) == 3
+    assert len(list(tmp_path.glob("categories-*.parquet"))) == 1
+
+    # a later run only classifies new tuples
+    events.append(_event(app="Firefox", title="Twitter"))
+    classifier = Classifier.from_toml(categories, cache_dir=tmp_path)
+    events = classifier.classify(events)
+    assert classified[3:] == [("Firefox", "Twitter", "")]
+    assert events[0].data["$tags"] == {"YouTube", "Media"}
+    assert events[-1].data["$tags"] == {"Twitter", "Social Media", "Media"}
+
+    # changing the categories file invalidates the results
+    categories.write_text(
+        categories.read_text() + '\n[categories.Browser]\nFirefox = "Firefox"\n'
+    )
+    events = Classifier.from_toml(categories, cache_dir=tmp_path).classify(events)
+    assert len(classified) == 4 + 4
+    assert events[0].data["$tags"] == {"YouTube", "Media", "Browser", "Firefox"}
+
+
+def test_classify_table():
+    classifier = Classifier.from_toml(categories_example)
+    table = events_to_table(
+        [_event(app="Firefox", title="QuantifiedMe"), _event(app="Terminal")]
+    )
+    table = classifier.classify_table(table)
+    assert table["tags"].to_pylist() == [
+        ["Programming", "QuantifiedMe", "Work"],
+        ["Uncategorized"],
+    ]
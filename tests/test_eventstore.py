@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aw_core import Event
+
+from quantifiedme.eventstore import EventStore, events_to_table, table_to_events
+
+t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _events(
+    hostname: str, n: int = 10, offset: timedelta = timedelta(0)
+) -> list[Event]:
+    return [
+        Event(
+            timestamp=t0 + offset + i * timedelta(hours=1),
+            duration=timedelta(minutes=30),
+            data={
+                "$hostname": hostname,
+                "$source": "activitywatch",
+                "app": "Firefox",
+                "title": f"Page {i}",
+                "url": f"https://example.com/{i}",
+                "$tags": {"Work", "Programming"} if i % 2 else {"Media"},
+                "audible": bool(i % 3),
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def test_roundtrip():
+    events = _events("host1")
+    events_rt = list(table_to_events(events_to_table(events)))
+    assert len(events_rt) == len(events)
+    for e, e_rt in zip(events, events_rt, strict=True):
+        assert e.timestamp == e_rt.timestamp
+        assert e.duration == e_rt.duration
+        assert e.data == e_rt.data
+
+
+def test_roundtrip_missing_fields():
+    events = [Event(timestamp=t0, duration=timedelta(seconds=5), data={"app": "a"})]
+    (e_rt,) = table_to_events(events_to_table(events))
+    assert e_rt.data == {"app": "a"}
+
+
+def test_store_scan(tmp_path: Path):
+    store = EventStore(tmp_path / "events")
+    assert not store.exists()
+    assert store.mtime() is None
+    assert len(store.scan(start=t0)) == 0
+
+    store.write(_events("host1"), name="host1")
+    store.write(_events("host2", offset=timedelta(minutes=30)), name="host2")
+    assert store.parts() == ["host1", "host2"]
+
+    table = store.scan()
+    assert len(table) == 20
+    # sorted across parts
+    assert table["timestamp"].to_pylist() == sorted(table["timestamp"].to_pylist())
+
+    start, end = t0 + timedelta(hours=2), t0 + timedelta(hours=5)
+    events = list(store.iter_events(start=start, end=end, hostnames=["host2"]))
+    assert len(events) == 3
+    assert all(start <= e.timestamp < end for e in events)
+    assert {e.data["$hostname"] for e in events} == {"host2"}
+
+    df = store.to_df(columns=["timestamp", "duration"])
+    assert list(df.columns) == ["timestamp", "duration"]
+    assert df["duration"].sum() == timedelta(minutes=30) * 20
+
+    assert store.time_range() == (t0, t0 + timedelta(hours=9, minutes=30))
+
+
+def test_store_write_replaces_part(tmp_path: Path):
+    store = EventStore(tmp_path)
+    store.write(_events("host1", n=10))
+    store.write(_events("host1", n=3), metadata={"source_key": "abc"})
+    assert len(store.scan()) == 3
+    assert store.metadata("events") == {"source_key": "abc"}
+    assert store.metadata("missing") is None
+    store.clear()
+    assert not store.exists()
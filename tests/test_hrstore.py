@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantifiedme.derived import heartrate
+from quantifiedme.hrstore import HeartrateStore
+
+t0 = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+def _hr(start: str, periods: int, freq: str = "20s", bpm: float = 60) -> pd.Series:
+    index = pd.date_range(start, periods=periods, freq=freq, tz="UTC")
+    return pd.Series(bpm + np.arange(periods) % 3, index=index, name="hr")
+
+
+def test_append_and_read(tmp_path: Path):
+    store = HeartrateStore(tmp_path / "hr")
+    assert store.sources() == []
+    assert store.origin() is None
+    assert store.minutes().empty
+
+    # three samples per minute, averaged: (60 + 61 + 62) / 3 = 61
+    hr = _hr("2024-01-02 10:00", 3 * 60)
+    assert store.append("fitbit", hr) == 60
+    assert store.sources() == ["fitbit"]
+    assert store.origin() == pd.Timestamp("2024-01-02", tz="UTC")
+    assert store.until("fitbit") == hr.index[-1]
+
+    index, bpm, valid = store.read(
+        "fitbit", start=datetime(2024, 1, 2, 9, 59), end=datetime(2024, 1, 2, 11, 1)
+    )
+    assert len(index) == len(bpm) == len(valid) == 62
+    assert index[0] == pd.Timestamp("2024-01-02 09:59", tz="UTC")
+    assert bpm.dtype == np.uint8
+    assert not valid[0] and valid[1:61].all() and not valid[-1]
+    assert (bpm[1:61] == 61).all()
+
+    # a fresh instance reads the same data from disk
+    minutes = HeartrateStore(tmp_path / "hr").minutes()
+    assert len(minutes) == 24 * 60
+    assert minutes.count() == 60
+    assert minutes.loc["2024-01-02 10:30"] == 61
+
+
+def test_append_incremental(tmp_path: Path):
+    store = HeartrateStore(tmp_path / "hr")
+    hr = _hr("2024-01-02 10:00", 10, freq="1min")
+    store.append("oura", hr.iloc[:5])
+    # samples up to the watermark's minute are already stored
+    assert store.append("oura", hr) == 6
+    assert store.append("oura", hr) == 1
+
+    # the next day grows the arrays
+    assert store.append("oura", _hr("2024-01-03 23:59", 1, bpm=70)) == 1
+    df = store.to_df()
+    assert len(df) == 2 * 24 * 60
+    assert df["oura"].count() == 11
+    assert df["oura"].iloc[-1] == 70
+
+
+def test_append_older_data(tmp_path: Path):
+    store = HeartrateStore(tmp_path / "hr")
+    store.append("fitbit", _hr("2024-01-02 10:00", 5, freq="1min", bpm=60))
+    # a newer export also covering earlier minutes fills them, without
+    # overwriting the minutes already stored
+    hr = _hr("2024-01-02 09:55", 15, freq="1min", bpm=80)
+    assert store.append("fitbit", hr) == 5 + 1 + 5
+    df = store.to_df()
+    assert df["fitbit"].count() == 15
+    assert df["fitbit"].loc["2024-01-02 09:55"] == 80
+    assert df["fitbit"].loc["2024-01-02 10:00"] == 60
+    assert df["fitbit"].loc["2024-01-02 10:05"] == hr.loc["2024-01-02 10:05"]
+
+    # and so do older days, before the origin
+    assert store.append("fitbit", _hr("2024-01-01 12:00", 3, freq="1min")) == 3
+    assert store.to_df()["fitbit"].count() == 18
+
+
+def test_append_before_origin(tmp_path: Path):
+    store = HeartrateStore(tmp_path / "hr")
+    store.append("fitbit", _hr("2024-01-02 10:00", 5, freq="1min"))
+    store.append("oura", _hr("2024-01-02 12:00", 5, freq="1min", bpm=80))
+    store.append("whoop", _hr("2023-12-30 23:00", 5, freq="1min", bpm=100))
+
+    assert store.origin() == pd.Timestamp("2023-12-30", tz="UTC")
+    df = store.to_df()
+    assert df.count().to_dict() == {"fitbit": 5, "oura": 5, "whoop": 5}
+    assert df["fitbit"].first_valid_index() == pd.Timestamp(
+        "2024-01-02 10:00", tz="UTC"
+    )
+    assert df["oura"].first_valid_index() == pd.Timestamp("2024-01-02 12:00", tz="UTC")
+    assert df["whoop"].loc["2023-12-30 23:04"] == 101
+
+
+def test_minutes_combines_sources(tmp_path: Path):
+    store = HeartrateStore(tmp_path / "hr")
+    store.append("fitbit", _hr("2024-01-02 10:00", 2, freq="1min", bpm=60))
+    store.append("oura", _hr("2024-01-02 10:01", 2, freq="1min", bpm=70))
+
+    minutes = store.minutes(
+        start=t0.replace(hour=10), end=t0.replace(hour=10, minute=4)
+    )
+    assert list(minutes) == pytest.approx([60, (61 + 70) / 2, 71, np.nan], nan_ok=True)
+    assert list(store.minutes(sources=["oura"]).dropna()) == [70, 71]
+
+
+def test_load_heartrate_store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(heartrate, "cache_dir", tmp_path)
+    monkeypatch.setattr(
+        heartrate, "load_config", lambda: {"me": {"date_offset_hours": 5}}
+    )
+    monkeypatch.setattr(
+        heartrate,
+        "_loaders",
+        {
+            "oura": lambda: _hr("2024-01-02 00:00", 3 * 60 * 24).to_frame(),
+            "whoop": lambda: None,
+        },
+    )
+    # reading doesn't load the sources
+    assert heartrate.load_heartrate_store().sources() == []
+    assert heartrate.load_heartrate_summary_df().empty
+    store = heartrate.update_heartrate_store()
+    assert store.sources() == ["oura"]
+
+    # days start at 05:00
+    df = heartrate.load_heartrate_summary_df()
+    assert list(df.index) == list(pd.date_range("2024-01-01", "2024-01-02", tz="UTC"))
+    assert list(df["hr_mean"]) == [61, 61]
+    assert list(df["hr_duration_resting"]) == [
+        pd.Timedelta(hours=5),
+        pd.Timedelta(hours=19),
+    ]
+
+
+def _summary_reference(hr: pd.Series, zones: dict[str, int], freq: str) -> pd.DataFrame:
+    # The previous implementation, with a pd.cut and a groupby per zone
+    df = pd.DataFrame()
+    df["hr_mean"] = hr.groupby(pd.Grouper(freq=freq)).mean()
+    df_zones = pd.cut(hr, bins=[*zones.values(), 300], labels=[*zones.keys()])
+    for zone in zones:
+        df[f"hr_duration_{zone}"] = df_zones[df_zones == zone].groupby(
+            pd.Grouper(freq=freq)
+        ).count() * pd.Timedelta(minutes=1)
+    duration_columns = [f"hr_duration_{zone}" for zone in zones]
+    df[duration_columns] = df[duration_columns].fillna(pd.Timedelta(0))
+    return df
+
+
+def test_summarize_heartrate():
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2024-01-01 07:13", "2024-01-20 13:00", freq="1min", tz="UTC")
+    values = rng.integers(40, 200, len(index)).astype(float)
+    # a gap, and a few minutes outside of all zones
+    values[1000:3000] = np.nan
+    values[:10] = [0, 100, 140, 160, 300, 301, 350, 1, 99.5, 100.5]
+    hr = pd.Series(values, index=index, name="hr")
+    zones = {"resting": 0, "low": 100, "med": 140, "high": 160}
+
+    freqs = ["h", "D", "W", "6h"]
+    summaries = heartrate.summarize_heartrate(
+        hr, zones, freqs=freqs, date_offset=timedelta(0)
+    )
+    assert list(summaries) == freqs
+    for freq in freqs:
+        pd.testing.assert_frame_equal(
+            summaries[freq],
+            _summary_reference(hr, zones, freq),
+            check_freq=False,
+            check_names=False,
+        )
+
+
+def test_summarize_heartrate_custom_zones_and_offset():
+    index = pd.date_range("2024-01-01 00:00", periods=48 * 60, freq="1min", tz="UTC")
+    hr = pd.Series(np.where(index.hour < 12, 55.0, 125.0), index=index)
+    zones = {"sleep": 40, "awake": 60, "active": 120}
+
+    summaries = heartrate.summarize_heartrate(
+        hr, zones, freqs=["D", "12h", "h"], date_offset=timedelta(hours=6)
+    )
+    df = summaries["D"]
+    # the first 6 hours belong to the day before
+    assert list(df.index.day) == [31, 1, 2]
+    hours = {col: list(df[col].dt.total_seconds() / 3600) for col in df.columns[1:]}
+    assert hours == {
+        "hr_duration_sleep": [6, 12, 6],
+        "hr_duration_awake": [0, 0, 0],
+        "hr_duration_active": [0, 12, 12],
+    }
+    assert df["hr_mean"].iloc[1] == (6 * 55 + 12 * 125 + 6 * 55) / 24
+    # 12h periods are also shifted by the offset, starting at 06:00 and 18:00,
+    # and labeled by their start
+    assert list(summaries["12h"].index) == list(
+        pd.date_range("2023-12-31 18:00", periods=5, freq="12h", tz="UTC")
+    )
+    assert summaries["12h"]["hr_mean"].iloc[1] == (6 * 55 + 6 * 125) / 12
+    assert list(summaries["12h"]["hr_duration_sleep"].dt.total_seconds() / 3600) == [
+        6,
+        6,
+        6,
+        6,
+        0,
+    ]
+    # hours are labeled by their start, like without an offset
+    df_hours = summaries["h"]
+    assert list(df_hours.index) == list(index[::60])
+    assert df_hours.loc["2024-01-01 10:00", "hr_mean"] == 55
+    assert df_hours.loc["2024-01-01 12:00", "hr_mean"] == 125
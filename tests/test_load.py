@@ -1,18 +1,27 @@
 import pickle
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pytest
 from aw_core import Event
+from aw_research.util import categorytime_per_day
 from qslang import Event as QSEvent
 from quantifiedme.config import has_config
-from quantifiedme.derived.all_df import load_all_df
+from quantifiedme.cache import fingerprint
+from quantifiedme.derived import all_df
+from quantifiedme.derived.all_df import cached_source, load_all_df, load_sources
 from quantifiedme.derived.screentime import classify, load_category_df, load_screentime
+from quantifiedme.eventstore import events_to_table
+from quantifiedme.load.activitywatch_fake import create_fake_events
 from quantifiedme.load.habitbull import load_df as load_habitbull_df
 from quantifiedme.load.location import load_all_dfs
 from quantifiedme.load.oura import load_activity_df, load_readiness_df, load_sleep_df
-from quantifiedme.load.qslang import load_df, to_series
+from quantifiedme.load.qslang import dose_to_base_units, load_df, to_series
+from quantifiedme.load.qslang import load_daily_df as qslang_load_daily_df
 from quantifiedme.load.toggl_ import load_toggl
 
 now = datetime.now(tz=timezone.utc)
@@ -55,6 +64,60 @@ def test_load_all_df():
     print(df)
 
 
+def test_load_sources():
+    def _df(col: str) -> pd.DataFrame:
+        return pd.DataFrame({col: [1]}, index=pd.DatetimeIndex(["2024-01-01"]))
+
+    def _slow() -> pd.DataFrame:
+        time.sleep(0.1)
+        return _df("a")
+
+    def _missing() -> pd.DataFrame:
+        raise FileNotFoundError("no export")
+
+    dfs, times = load_sources(
+        {"screentime": _slow, "drugs": lambda: _df("b"), "journal": _missing}
+    )
+    # joined in the order given, even though "drugs" finishes first
+    assert list(dfs) == ["screentime", "drugs"]
+    assert times["screentime"] >= 0.1
+
+    # required sources still fail loudly
+    with pytest.raises(FileNotFoundError):
+        load_sources({"sleep": _missing})
+
+
+def test_cached_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(all_df, "cache_dir", tmp_path)
+    calls = []
+
+    def _loader() -> pd.DataFrame:
+        calls.append(1)
+        return pd.DataFrame({"a": [len(calls)]})
+
+    assert cached_source("sleep", _loader)().iloc[0]["a"] == 1
+    # served from disk, even by a new wrapper (as after a restart)
+    assert cached_source("sleep", _loader)().iloc[0]["a"] == 1
+    # different parameters invalidate the cache
+    assert cached_source("sleep", _loader, {"days": 7})().iloc[0]["a"] == 2
+    assert len(calls) == 2
+    # ...but don't overwrite the frame cached for other parameters
+    assert cached_source("sleep", _loader)().iloc[0]["a"] == 1
+    assert cached_source("sleep", _loader, {"days": 7})().iloc[0]["a"] == 2
+    assert len(calls) == 2
+
+
+def test_fingerprint(tmp_path):
+    (tmp_path / "a.json").write_text("{}")
+    fp = fingerprint([tmp_path])
+    assert fp == fingerprint([tmp_path])
+    (tmp_path / "b.json").write_text("{}")
+    fp_added = fingerprint([tmp_path])
+    assert fp != fp_added
+    (tmp_path / "b.json").write_text("{1}")
+    assert fp_added != fingerprint([tmp_path])
+
+
 @pytest.mark.skipif(not has_config(), reason="no config available for test data")
 def test_load_qslang():
     df = load_df()
@@ -115,6 +178,107 @@ def test_qslang_unknown_dose():
     assert 0.00015 == df.iloc[0]["dose"]
 
 
+def test_qslang_dose_normalization():
+    dose_to_base_units.cache_clear()
+    events = [
+        QSEvent(
+            timestamp=now + timedelta(hours=i),
+            type="dose",
+            data={"substance": "Caffeine", "amount": amount},
+        )
+        for i, amount in enumerate(["100mg", "100mg", "0.2g", "100mg", "?mg"])
+    ] + [
+        QSEvent(
+            timestamp=now,
+            type="dose",
+            data={"substance": "Water", "dose": {"amount": "1", "unit": "l"}},
+        ),
+        QSEvent(
+            timestamp=now,
+            type="dose",
+            data={"substance": "Beer", "amount": "1 pint_of_nothing"},
+        ),
+        QSEvent(timestamp=now, type="journal", data={"note": "not a dose"}),
+    ]
+    df = load_df(events)
+    assert "data" not in df.columns
+    assert list(df["dose"]) == pytest.approx(
+        [100e-6, 100e-6, 200e-6, 100e-6, 125e-6, 1e-3, 0, 0]
+    )
+    # each distinct amount is only parsed once
+    assert dose_to_base_units.cache_info().misses == 4
+
+    df = load_df(events, keep_data=True)
+    assert df["data"].iloc[0] == {"substance": "Caffeine", "amount": "100mg"}
+
+
+def _qslang_daily_df_reference(events: list[QSEvent]) -> pd.DataFrame:
+    # The previous implementation, with one to_series call per tag and substance
+    df_src = load_df(events)
+    tags = {tag for e in events for tag in e.data.get("tags", [])}
+    series_tags = {
+        f"tag:{tag}": to_series(df_src, tag=tag).replace(np.nan, 0) for tag in tags
+    }
+    substances = {s for s in df_src["substance"] if s}
+    series_subst = {
+        subst.lower().replace("-", "").replace(" ", ""): to_series(
+            df_src, substance=subst
+        )
+        for subst in substances
+    }
+    df = pd.concat([pd.DataFrame(series_tags), pd.DataFrame(series_subst)], axis=1)
+    return df.fillna(0)
+
+
+def test_qslang_load_daily_df():
+    rng = np.random.default_rng(0)
+    substances = {
+        "Caffeine": ["stimulant"],
+        "L-Theanine": ["supplement"],
+        "Vitamin D": ["supplement", "vitamin"],
+        "Alcohol": ["alcohol", "depressant"],
+    }
+    events = []
+    for _ in range(300):
+        substance = rng.choice(list(substances))
+        # a gap in the middle, so the index is not a single range
+        day = int(rng.choice([*range(20), *range(40, 60)]))
+        events.append(
+            QSEvent(
+                timestamp=now - timedelta(days=day, hours=int(rng.integers(24))),
+                type="dose",
+                data={
+                    "substance": substance,
+                    "amount": f"{rng.integers(1, 200)}mg",
+                    "tags": substances[substance],
+                },
+            )
+        )
+    # Alcohol was only taken in the first half of the period
+    events = [
+        e
+        for e in events
+        if e.data["substance"] != "Alcohol" or e.timestamp < now - timedelta(days=45)
+    ]
+
+    df = qslang_load_daily_df(events)
+    expected = _qslang_daily_df_reference(events)
+    assert set(df.columns) == set(expected.columns)
+    # "vitamin" is never the first tag of a dose, so it's always zero
+    assert (df["tag:vitamin"] == 0).all()
+    pd.testing.assert_frame_equal(
+        df,
+        expected[df.columns],
+        check_freq=False,
+        check_names=False,
+        check_dtype=False,
+    )
+
+    df_sparse = qslang_load_daily_df(events, sparse=True)
+    assert isinstance(df_sparse["caffeine"].dtype, pd.SparseDtype)
+    pd.testing.assert_frame_equal(df_sparse.sparse.to_dense(), df)
+
+
 @pytest.mark.slow
 def test_load_screentime():
     events = load_screentime(
@@ -126,6 +290,56 @@ def test_load_screentime():
     assert not load_category_df(events).empty
 
 
+def _load_category_df_reference(events: list[Event]) -> pd.DataFrame:
+    # The previous implementation, which rescans all events for every category.
+    # (Except that it looked up All_events by Timestamp in a dict keyed by date,
+    # which never matched, so All_events was always zero.)
+    tss = {}
+    all_categories = list({t for e in events for t in e.data["$tags"]})
+    events_by_date = defaultdict(list)
+    for e in events:
+        events_by_date[e.timestamp.date()].append(e)
+    for cat in all_categories:
+        tss[cat] = categorytime_per_day(events, cat)
+    df = pd.DataFrame(tss)
+    df = df.replace(np.nan, 0)
+    df["All_cols"] = df.sum(axis=1)
+    df["All_events"] = [
+        sum((e.duration for e in events_by_date[d.date()]), start=timedelta(0))
+        for d in df.index
+    ]
+    return df
+
+
+def _fake_classified_events(days: int) -> list[Event]:
+    events = list(create_fake_events(start=now - timedelta(days=days), end=now))
+    return classify(events, personal=False)
+
+
+def test_load_category_df():
+    events = _fake_classified_events(days=30)
+    df = load_category_df(events)
+    pd.testing.assert_frame_equal(
+        df, _load_category_df_reference(events), check_like=True
+    )
+
+    # also works on a frame from the event store
+    df_store = load_category_df(events_to_table(events).to_pandas())
+    pd.testing.assert_frame_equal(df, df_store)
+
+
+@pytest.mark.slow
+def test_load_category_df_benchmark():
+    events = _fake_classified_events(days=365)
+    t0 = time.perf_counter()
+    df_ref = _load_category_df_reference(events)
+    t1 = time.perf_counter()
+    df = load_category_df(events)
+    t2 = time.perf_counter()
+    print(f"load_category_df: {t2 - t1:.3f}s (reference: {t1 - t0:.3f}s)")
+    pd.testing.assert_frame_equal(df, df_ref, check_like=True)
+
+
 def test_load_toggl():
     pytest.skip("Broken")
 
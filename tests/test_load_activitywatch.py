@@ -1,9 +1,24 @@
+import json
 import os
-from datetime import datetime, timezone
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
+import requests
 from aw_client import ActivityWatchClient
-from quantifiedme.load.activitywatch import load_events
+from aw_core import Event
+from aw_datastore import Datastore
+from aw_datastore.storages import MemoryStorage
+from aw_query import query2
+from quantifiedme.eventstore import EventStore
+from quantifiedme.load import activitywatch
+from quantifiedme.load.activitywatch import (
+    load_events,
+    query_tag_durations,
+    sync_events,
+    sync_hosts,
+)
 
 hostname = os.uname().nodename
 
@@ -24,5 +39,251 @@ def test_load_events():
     print(len(events))
 
 
+def _hourly_events(start: datetime, end: datetime) -> list[dict]:
+    events = []
+    ts = start + timedelta(minutes=1)
+    while ts + timedelta(minutes=10) < end:
+        events.append(
+            {
+                "timestamp": ts.isoformat(),
+                "duration": 600,
+                "data": {"app": "Firefox", "title": "test"},
+            }
+        )
+        ts += timedelta(hours=1)
+    return events
+
+
+class RecordingClient:
+    """Stand-in for ActivityWatchClient that returns one event per hour queried."""
+
+    server_address = "http://localhost:5666"
+
+    def __init__(self):
+        self.timeperiods: list[tuple[datetime, datetime]] = []
+
+    def query(self, query, timeperiods):
+        self.timeperiods += timeperiods
+        ((start, end),) = timeperiods
+        return [_hourly_events(start, end)]
+
+
+def test_sync_events(tmp_path):
+    awc = RecordingClient()
+    store = EventStore(tmp_path)
+    # Wednesday, so the first and last week are partial
+    since = datetime(2024, 1, 3, tzinfo=timezone.utc)
+    now = datetime(2024, 1, 17, 12, tzinfo=timezone.utc)
+
+    sync_events(awc, "host", since, now=now, store=store)  # type: ignore
+    # weeks are fetched concurrently, so not necessarily in order
+    assert [start.date().isoformat() for start, _ in sorted(awc.timeperiods)] == [
+        "2024-01-01",
+        "2024-01-08",
+        "2024-01-15",
+    ]
+    events = list(store.iter_events(start=since, end=now))
+    assert events
+    assert all(since <= e.timestamp < now for e in events)
+    assert {e.data["$hostname"] for e in events} == {"host"}
+    n_events = len(events)
+
+    # next day: only the partial week is re-fetched, and it now has more events
+    awc.timeperiods = []
+    now += timedelta(days=1)
+    sync_events(awc, "host", since, now=now, store=store)  # type: ignore
+    assert awc.timeperiods == [(datetime(2024, 1, 15, tzinfo=timezone.utc), now)]
+    assert len(store.scan(start=since)) == n_events + 24
+
+    # earlier since: only the missing week is backfilled
+    awc.timeperiods = []
+    sync_events(awc, "host", since - timedelta(days=7), now=now, store=store)  # type: ignore
+    assert [start.date().isoformat() for start, _ in sorted(awc.timeperiods)] == [
+        "2023-12-25",
+        "2024-01-15",
+    ]
+
+
+class QueryClient:
+    """Stand-in for ActivityWatchClient that runs queries on an in-memory datastore."""
+
+    def __init__(self):
+        self.datastore = Datastore(MemoryStorage, testing=True)
+        self.requests: list[list[tuple[datetime, datetime]]] = []
+
+    def insert(self, bucket_id: str, hostname: str, spans: list[tuple]) -> None:
+        bucket = self.datastore.create_bucket(bucket_id, "test", "test", hostname)
+        bucket.insert(
+            [
+                Event(timestamp=start, duration=end - start, data=data)
+                for start, end, data in spans
+            ]
+        )
+
+    def query(self, query, timeperiods):
+        self.requests.append(timeperiods)
+        result = [
+            [
+                e.to_json_dict()
+                for e in query2.query("test", query, start, end, self.datastore)
+            ]
+            for start, end in timeperiods
+        ]
+        # as returned by the server
+        return json.loads(json.dumps(result))
+
+
+def test_query_tag_durations():
+    day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    h = timedelta(hours=1)
+    awc = QueryClient()
+    awc.insert(
+        "aw-watcher-window_laptop",
+        "laptop",
+        [
+            (day + 10 * h, day + 11 * h, {"app": "Firefox", "title": "ActivityWatch"}),
+            (day + 11 * h, day + 11.5 * h, {"app": "Spotify", "title": "Song"}),
+        ],
+    )
+    awc.insert(
+        "aw-watcher-afk_laptop",
+        "laptop",
+        [(day + 10 * h, day + 11.25 * h, {"status": "not-afk"})],
+    )
+    awc.insert(
+        "aw-watcher-window_desktop",
+        "desktop",
+        [
+            # overlaps the laptop, which takes precedence
+            (day + 10.5 * h, day + 10.75 * h, {"app": "Terminal", "title": "vim"}),
+            (day + 36 * h, day + 37 * h, {"app": "Firefox", "title": "YouTube"}),
+            (day + 37 * h, day + 38 * h, {"app": "Terminal", "title": "vim"}),
+        ],
+    )
+    awc.insert(
+        "aw-watcher-afk_desktop",
+        "desktop",
+        [(day, day + 48 * h, {"status": "not-afk"})],
+    )
+
+    # the backslash checks the escaping of regexes in the query
+    rules = [("Music", "Spotify"), ("Video", r"You\w+"), ("Work", "Act")]
+    since = day + 6 * h
+    events = query_tag_durations(
+        awc,
+        ["laptop", "desktop"],
+        rules,
+        since,
+        day + 48 * h,  # type: ignore
+    )
+    # one request, with a timeperiod per day
+    assert awc.requests == [[(since, day + 24 * h), (day + 24 * h, day + 48 * h)]]
+    totals = {(e.timestamp, tuple(sorted(e.data["$tags"]))): e.duration for e in events}
+    assert totals == {
+        (since, ("Work",)): h,
+        (since, ("Music",)): 0.25 * h,
+        (day + 24 * h, ("Video",)): h,
+        (day + 24 * h, ()): h,
+    }
+
+
+class _StandInServer(ThreadingHTTPServer):
+    """Stand-in aw-server answering queries with one event per hour, over keep-alive."""
+
+    def __init__(self, fail: dict[str, list[int]]):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        # statuses to respond with for the next queries of a period start (date)
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.requests: list[tuple[int, str]] = []
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _StandInServer
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        ((period,),) = [data["timeperiods"]]
+        start, end = (datetime.fromisoformat(dt) for dt in period.split("/"))
+        with self.server.lock:
+            # the client port identifies the connection
+            self.server.requests.append((self.client_address[1], period))
+            statuses = self.server.fail.get(start.date().isoformat(), [])
+            status = statuses.pop(0) if statuses else 200
+        body = json.dumps([_hourly_events(start, end)] if status == 200 else {})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_server():
+    servers = []
+
+    def _start(
+        fail: dict[str, list[int]],
+    ) -> tuple[_StandInServer, ActivityWatchClient]:
+        server = _StandInServer(fail)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        awc = ActivityWatchClient(
+            "test-sync", testing=True, host="127.0.0.1", port=server.server_port
+        )
+        return server, awc
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sync_hosts(tmp_path, stand_in_server, monkeypatch):
+    delays: list[float] = []
+    monkeypatch.setattr(activitywatch.time, "sleep", delays.append)
+    # the first week fails twice with a transient error before succeeding
+    server, awc = stand_in_server({"2024-01-01": [503, 502]})
+    since = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    now = datetime(2024, 1, 22, 12, tzinfo=timezone.utc)
+    hostnames = ["laptop", "desktop"]
+    stores = {h: EventStore(tmp_path / h) for h in hostnames}
+
+    result = sync_hosts(awc, hostnames, since, now=now, stores=stores, workers=3)
+    assert list(result) == hostnames
+    # 4 weeks for each host, plus 2 retries with backoff
+    assert len(server.requests) == 2 * 4 + 2
+    assert delays == [activitywatch.BACKOFF, 2 * activitywatch.BACKOFF]
+    # connections are kept alive and reused
+    assert len({port for port, _ in server.requests}) <= 3
+    for hostname, store in result.items():
+        events = list(store.iter_events(start=since, end=now))
+        assert len(events) == 3 * 7 * 24 + 12
+        assert {e.data["$hostname"] for e in events} == {hostname}
+        timestamps = [e.timestamp for e in events]
+        assert timestamps == sorted(timestamps)
+        assert activitywatch._load_watermark(store) == (
+            since,
+            datetime(2024, 1, 22, tzinfo=timezone.utc),
+        )
+
+
+def test_sync_hosts_error(tmp_path, stand_in_server, monkeypatch):
+    monkeypatch.setattr(activitywatch.time, "sleep", lambda _: None)
+    server, awc = stand_in_server({"2024-01-08": [500]})
+    store = EventStore(tmp_path)
+    since = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    now = datetime(2024, 1, 22, 12, tzinfo=timezone.utc)
+    # errors that aren't transient aren't retried
+    with pytest.raises(requests.HTTPError):
+        sync_events(awc, "host", since, now=now, store=store, workers=1)
+    assert [period[:10] for _, period in server.requests].count("2024-01-08") == 1
+    assert activitywatch._load_watermark(store) is None
+
+
 if __name__ == "__main__":
     test_load_events()
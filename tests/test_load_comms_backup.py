@@ -6,9 +6,11 @@ both Alice's comms_summary.py (aggregates) and erbot's extract_erik_sms.py
 (sent-text corpus) can refactor against it.
 """
 
-from datetime import timezone
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
+from zoneinfo import ZoneInfo
 
+import numpy as np
 import pytest
 
 from quantifiedme.load import comms_backup as cbl
@@ -154,3 +156,175 @@ def test_latest_file_respects_prefix(tmp_path: Path) -> None:
 
 def test_latest_file_none_when_absent(tmp_path: Path) -> None:
     assert cbl.latest_file(tmp_path, "sms-") is None
+
+
+# --- records_to_arrays ---------------------------------------------------------
+
+
+def test_iter_record_batches(tmp_path: Path) -> None:
+    rows = [_sms("1", f"+4670000000{i}", JUN1_NOON_UTC_MS) for i in range(5)]
+    path = _write_sms(tmp_path, "sms-1.xml", rows)
+    batches = list(cbl.iter_record_batches(path, "sms", batch_size=2))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert [r["address"] for b in batches for r in b] == [r["address"] for r in rows]
+
+
+@pytest.mark.parametrize(
+    "tz",
+    [timezone.utc, timezone(timedelta(hours=-5)), ZoneInfo("Europe/Stockholm"), None],
+    ids=str,
+)
+def test_records_to_arrays_matches_epoch_ms_to_day(tz) -> None:
+    # hourly around the DST transitions, plus midnights and garbage
+    start = int(datetime(2026, 3, 28, tzinfo=timezone.utc).timestamp() * 1000)
+    dates = [str(start + h * 3600 * 1000 + 1) for h in range(24 * 220)]
+    dates += ["0", "", "garbage", "99999999999999999"]
+    records = [{"date": d, "type": "2"} for d in dates] + [{"type": "x"}]
+    arrays = cbl.records_to_arrays(records, tz)
+
+    assert arrays["date_ms"].dtype == np.int64
+    assert arrays["date_ms"][0] == start + 1
+    days = [
+        date.fromordinal(d).isoformat() if d >= 0 else None
+        for d in arrays["day"].tolist()
+    ]
+    assert days == [cbl.epoch_ms_to_day(r.get("date"), tz) for r in records]
+    assert arrays["type"].tolist() == [2] * len(dates) + [-1]
+
+
+def test_records_to_arrays_int_fields() -> None:
+    records = [
+        {"date": JUN1_NOON_UTC_MS, "type": "1", "duration": "90"},
+        {"date": JUN1_NOON_UTC_MS, "type": "3"},
+    ]
+    arrays = cbl.records_to_arrays(records, timezone.utc, int_fields=["duration"])
+    assert set(arrays) == {"date_ms", "day", "duration"}
+    assert arrays["duration"].tolist() == [90, -1]
+    assert arrays["day"].tolist() == [date(2026, 6, 1).toordinal()] * 2
+
+
+# --- update_daily_aggregates ---------------------------------------------------
+
+# 2026-06-02T12:00:00Z in epoch millis.
+JUN2_NOON_UTC_MS = str(int(JUN1_NOON_UTC_MS) + 24 * 3600 * 1000)
+
+
+def _sms(kind: str, address: str, date: str) -> dict[str, str]:
+    return {"type": kind, "address": address, "date": date, "body": "secret text"}
+
+
+def test_update_daily_aggregates(tmp_path: Path) -> None:
+    store = tmp_path / "store" / "daily.json"
+    _write_sms(
+        tmp_path,
+        "sms-20260601.xml",
+        [
+            _sms("1", "+46 700 000 001", JUN1_NOON_UTC_MS),
+            _sms("2", "+46-700-000-001", JUN1_NOON_UTC_MS),
+            _sms("2", "+46700000002", JUN1_NOON_UTC_MS),
+        ],
+    )
+    _write_calls(
+        tmp_path,
+        "calls-20260601.xml",
+        [
+            {
+                "type": "1",
+                "number": "+46700000001",
+                "duration": "90",
+                "date": JUN1_NOON_UTC_MS,
+            },
+            {
+                "type": "3",
+                "number": "+46700000003",
+                "duration": "0",
+                "date": JUN1_NOON_UTC_MS,
+            },
+        ],
+    )
+    days = cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+    assert days == {
+        "2026-06-01": {
+            "sms_received": 1,
+            "sms_sent": 2,
+            "sms_contacts": 2,
+            "calls_incoming": 1,
+            "calls_missed": 1,
+            "call_minutes": 1.5,
+            "call_contacts": 2,
+        }
+    }
+    # nothing identifying is persisted
+    text = store.read_text()
+    assert "4670000000" not in text
+    assert "secret" not in text
+
+
+def test_update_daily_aggregates_incremental(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store = tmp_path / "daily.json"
+    jun1 = [_sms("2", "+46700000001", JUN1_NOON_UTC_MS)]
+    _write_sms(tmp_path, "sms-20260601.xml", jun1)
+    cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+
+    scanned: list[int | None] = []
+    iter_records = cbl.iter_records
+
+    def _iter_records(path, tag, since_ms=None):
+        scanned.append(since_ms)
+        return iter_records(path, tag, since_ms=since_ms)
+
+    monkeypatch.setattr(cbl, "iter_records", _iter_records)
+
+    # an unchanged backup isn't read again
+    days = cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+    assert scanned == []
+    assert days["2026-06-01"]["sms_sent"] == 1
+
+    # a newer snapshot is only scanned from the start of the last seen day, so
+    # the older record (only in the new snapshot) isn't counted
+    older = str(int(JUN1_NOON_UTC_MS) - 24 * 3600 * 1000)
+    _write_sms(
+        tmp_path,
+        "sms-20260602.xml",
+        [
+            _sms("2", "+46700000009", older),
+            *jun1,
+            _sms("2", "+46700000002", JUN1_NOON_UTC_MS),
+            _sms("1", "+46700000001", JUN2_NOON_UTC_MS),
+        ],
+    )
+    days = cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+    assert scanned == [int(JUN1_NOON_UTC_MS) - 12 * 3600 * 1000]
+    assert days == {
+        "2026-06-01": {"sms_sent": 2, "sms_contacts": 2},
+        "2026-06-02": {"sms_received": 1, "sms_contacts": 1},
+    }
+
+
+def test_update_daily_aggregates_drops_stale_counters(tmp_path: Path) -> None:
+    store = tmp_path / "daily.json"
+
+    def _call(kind: str, duration: str) -> dict[str, str]:
+        return {
+            "type": kind,
+            "number": "+46700000001",
+            "duration": duration,
+            "date": JUN1_NOON_UTC_MS,
+        }
+
+    _write_calls(tmp_path, "calls-20260601.xml", [_call("1", "60"), _call("3", "0")])
+    days = cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+    assert days["2026-06-01"]["calls_missed"] == 1
+
+    # a rewritten backup without the missed call recomputes the day without it
+    _write_calls(tmp_path, "calls-20260602.xml", [_call("2", "120")])
+    days = cbl.update_daily_aggregates(tmp_path, store, tz=timezone.utc)
+    assert days == {
+        "2026-06-01": {"calls_outgoing": 1, "call_minutes": 2.0, "call_contacts": 1}
+    }
+
+
+def test_update_daily_aggregates_empty_dir(tmp_path: Path) -> None:
+    assert cbl.update_daily_aggregates(tmp_path, tmp_path / "daily.json") == {}
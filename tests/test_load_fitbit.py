@@ -0,0 +1,133 @@
+"""Tests for the Fitbit export loader.
+
+Uses a small synthetic export written to tmp_path, with the same layout as an
+unzipped Fitbit export (``Global Export Data/heart_rate-YYYY-MM-DD.json``).
+"""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from quantifiedme.load import fitbit
+from quantifiedme.load.fitbit import load_heartrate_df
+
+
+@pytest.fixture(autouse=True)
+def _cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(fitbit, "cache_dir", tmp_path / "cache")
+
+
+@pytest.fixture
+def export(tmp_path: Path) -> Path:
+    root = tmp_path / "fitbit"
+    (root / "Global Export Data").mkdir(parents=True)
+    for day in [1, 2, 3]:
+        _write_day(root, day, bpm=60 + day)
+    return root
+
+
+def _write_day(root: Path, day: int, bpm: int) -> None:
+    records = [
+        {
+            "dateTime": f"01/{day:02d}/20 {hour:02d}:00:05",
+            "value": {"bpm": bpm + hour, "confidence": 2},
+        }
+        for hour in range(24)
+    ]
+    path = root / "Global Export Data" / f"heart_rate-2020-01-{day:02d}.json"
+    path.write_text(json.dumps(records))
+
+
+@pytest.fixture
+def parsed(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Records the names of the files that are parsed."""
+    names = []
+    parse = fitbit._parse_heartrate_file
+
+    def _parse(filepath: Path):
+        names.append(filepath.name)
+        return parse(filepath)
+
+    monkeypatch.setattr(fitbit, "_parse_heartrate_file", _parse)
+    return names
+
+
+def test_load_heartrate_df(export: Path) -> None:
+    df = load_heartrate_df(export, workers=1)
+
+    assert list(df.columns) == ["hr"]
+    assert df.index.name == "timestamp"
+    assert str(df.index.tz) == "UTC"
+    assert len(df) == 3 * 24
+    assert df.index.is_monotonic_increasing
+    assert df.index[0] == pd.Timestamp("2020-01-01 00:00:05", tz="UTC")
+    assert df["hr"].iloc[0] == 61
+    assert df["hr"].iloc[-1] == 63 + 23
+
+
+def test_load_heartrate_df_pool(export: Path) -> None:
+    df = load_heartrate_df(export, workers=2)
+    for path in (fitbit.cache_dir / "fitbit").glob("heartrate-*.npz"):
+        path.unlink()
+    pd.testing.assert_frame_equal(df, load_heartrate_df(export, workers=1))
+
+
+def test_load_heartrate_df_incremental(export: Path, parsed: list[str]) -> None:
+    df = load_heartrate_df(export, workers=1)
+    assert len(parsed) == 3
+
+    # unchanged export is loaded from the cache
+    pd.testing.assert_frame_equal(df, load_heartrate_df(export, workers=1))
+    assert len(parsed) == 3
+
+    # only new files are parsed
+    _write_day(export, 4, bpm=70)
+    df = load_heartrate_df(export, workers=1)
+    assert parsed[3:] == ["heart_rate-2020-01-04.json"]
+    assert len(df) == 4 * 24
+
+    # modified files are parsed again
+    _write_day(export, 2, bpm=100)
+    df = load_heartrate_df(export, workers=1)
+    assert parsed[4:] == ["heart_rate-2020-01-02.json"]
+    assert df.loc["2020-01-02", "hr"].iloc[0] == 100
+
+    # removed files are dropped
+    (export / "Global Export Data" / "heart_rate-2020-01-01.json").unlink()
+    df = load_heartrate_df(export, workers=1)
+    assert len(parsed) == 5
+    assert len(df) == 3 * 24
+    assert df.index[0] == pd.Timestamp("2020-01-02 00:00:05", tz="UTC")
+
+
+def test_load_heartrate_df_exports(export: Path, tmp_path: Path) -> None:
+    other = tmp_path / "fitbit-other"
+    (other / "Global Export Data").mkdir(parents=True)
+    _write_day(other, 5, bpm=80)
+    # each export has its own cache
+    assert len(load_heartrate_df(export, workers=1)) == 3 * 24
+    assert len(load_heartrate_df(other, workers=1)) == 24
+    assert len(load_heartrate_df(export, workers=1)) == 3 * 24
+    assert len(list((fitbit.cache_dir / "fitbit").glob("heartrate-*.npz"))) == 2
+
+
+def test_load_heartrate_df_empty(tmp_path: Path) -> None:
+    df = load_heartrate_df(tmp_path, workers=1)
+    assert df.empty
+    assert list(df.columns) == ["hr"]
+
+
+def test_parse_datetimes() -> None:
+    datetimes = ["02/29/20 23:59:59", "12/31/19 00:00:00", "01/01/21 12:30:05"]
+    expected = pd.to_datetime(datetimes, format="%m/%d/%y %H:%M:%S", utc=True)
+    assert list(fitbit._parse_datetimes(datetimes)) == list(expected.as_unit("ns").asi8)
+    # invalid dates are rejected, rather than rolling over into the next month
+    for invalid in ["02/30/20 00:00:00", "02/29/21 00:00:00", "04/31/20 00:00:00"]:
+        with pytest.raises(ValueError):
+            fitbit._parse_datetimes([invalid])
+    # other formats fall back to pandas
+    assert list(fitbit._parse_datetimes(["2020-01-01T00:00:00"])) == [
+        pd.Timestamp("2020-01-01", tz="UTC").value
+    ]
@@ -1,6 +1,8 @@
 """Tests for the Home Assistant environmental sensor data loader."""
 
 import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -9,6 +11,7 @@ import pytest
 
 from quantifiedme.load.home_assistant import (
     create_fake_sensor_df,
+    iter_sensor_df,
     load_sensor_df,
     load_sensor_df_api,
 )
@@ -121,6 +124,23 @@ def test_load_sensor_df_legacy(legacy_db: Path) -> None:
     assert df["state"].notna().all()
 
 
+def test_load_sensor_df_legacy_microseconds(legacy_db: Path) -> None:
+    with closing(sqlite3.connect(legacy_db)) as con:
+        con.executemany(
+            "INSERT INTO states (entity_id, state, last_updated) VALUES (?, ?, ?)",
+            [
+                ("sensor.humidity", "40", "2024-01-01 02:00:00.123456"),
+                ("sensor.humidity", "41", "2024-01-01 02:00:01.5"),
+            ],
+        )
+        con.commit()
+    df = load_sensor_df(path=legacy_db, entity_ids=["sensor.humidity"])
+    assert list(df.index) == [
+        pd.Timestamp("2024-01-01 02:00:00.123456", tz="UTC"),
+        pd.Timestamp("2024-01-01 02:00:01.5", tz="UTC"),
+    ]
+
+
 def test_load_sensor_df_legacy_filter_entity(legacy_db: Path) -> None:
     df = load_sensor_df(path=legacy_db, entity_ids=["sensor.temperature_bedroom"])
 
@@ -146,6 +166,121 @@ def test_load_sensor_df_missing_file(tmp_path: Path) -> None:
         load_sensor_df(path=tmp_path / "nonexistent.db")
 
 
+def test_load_sensor_df_modern_epoch_timestamps(modern_db: Path) -> None:
+    df = load_sensor_df(path=modern_db, entity_ids=["sensor.temperature_bedroom"])
+    assert list(df.index) == [
+        pd.Timestamp("2024-01-01 00:00", tz="UTC"),
+        pd.Timestamp("2024-01-01 01:00", tz="UTC"),
+    ]
+    assert list(df["state"]) == [20.5, 21.0]
+
+
+def test_load_sensor_df_time_range(modern_db: Path, tmp_path: Path) -> None:
+    start = datetime(2024, 1, 1, 1, tzinfo=timezone.utc)
+    df = load_sensor_df(path=modern_db, start=start)
+    assert list(df["state"]) == [21.0]
+    df = load_sensor_df(path=modern_db, end=start)
+    assert sorted(df["state"]) == [20.5, 850.0]
+
+    # naive datetimes are taken as UTC, end is exclusive
+    legacy_db = _create_legacy_db(tmp_path / "legacy.db")
+    df = load_sensor_df(path=legacy_db, start=datetime(2024, 1, 1, 1))
+    assert list(df["state"]) == [20.1]
+    df = load_sensor_df(path=legacy_db, end=datetime(2024, 1, 1, 1))
+    assert list(df["state"]) == [19.8]
+    assert df.index[0] == pd.Timestamp("2024-01-01 00:00", tz="UTC")
+
+
+def _create_fake_db(path: Path, df: pd.DataFrame) -> Path:
+    """Create a modern-schema HA DB holding the states in `df`."""
+    entities = sorted(df["entity_id"].unique())
+    con = sqlite3.connect(path)
+    con.executescript("""
+        CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id TEXT);
+        CREATE TABLE states (
+            state_id INTEGER PRIMARY KEY,
+            metadata_id INTEGER,
+            state VARCHAR(255),
+            last_updated_ts FLOAT
+        );
+        CREATE INDEX ix_states_metadata_id_last_updated_ts
+            ON states (metadata_id, last_updated_ts);
+    """)
+    con.executemany("INSERT INTO states_meta VALUES (?, ?)", enumerate(entities))
+    con.executemany(
+        "INSERT INTO states (metadata_id, state, last_updated_ts) VALUES (?, ?, ?)",
+        zip(
+            df["entity_id"].map(entities.index),
+            df["state"].astype(str),
+            df.index.as_unit("us").asi8 / 1e6,
+            strict=True,
+        ),
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def test_load_sensor_df_resample(tmp_path: Path) -> None:
+    fake = create_fake_sensor_df(start="2024-01-01", end="2024-01-10")
+    # shift readings off the hour, so buckets are not trivially aligned
+    fake.index = fake.index + pd.Timedelta(minutes=17)
+    db = _create_fake_db(tmp_path / "home-assistant_v2.db", fake)
+
+    df = load_sensor_df(path=db, resample="1D", agg=["mean", "min", "max", "count"])
+    expected = (
+        fake.groupby("entity_id")["state"]
+        .resample("1D")
+        .agg(["mean", "min", "max", "count"])
+        .reset_index("entity_id")
+        .sort_index(kind="stable")
+    )
+    assert list(df.columns) == ["entity_id", "mean", "min", "max", "count", "unit"]
+    assert df.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(
+        df.drop(columns="unit").reset_index().sort_values(["timestamp", "entity_id"]),
+        expected.reset_index().sort_values(["timestamp", "entity_id"]),
+        check_dtype=False,
+    )
+
+    # a single aggregation is returned as `state`, and can be combined with bounds
+    df = load_sensor_df(
+        path=db,
+        entity_ids=["sensor.co2_office"],
+        start=datetime(2024, 1, 2, tzinfo=timezone.utc),
+        end=datetime(2024, 1, 3, tzinfo=timezone.utc),
+        resample="6h",
+        agg="max",
+    )
+    co2 = fake[fake["entity_id"] == "sensor.co2_office"].loc["2024-01-02"]
+    assert list(df.columns) == ["entity_id", "state", "unit"]
+    assert list(df["state"]) == pytest.approx(list(co2["state"].resample("6h").max()))
+
+
+def test_load_sensor_df_chunks(tmp_path: Path) -> None:
+    fake = create_fake_sensor_df(start="2024-01-01", end="2024-01-03")
+    db = _create_fake_db(tmp_path / "home-assistant_v2.db", fake)
+
+    chunks = list(iter_sensor_df(path=db, chunksize=50))
+    assert [len(c) for c in chunks[:-1]] == [50] * (len(chunks) - 1)
+    df = pd.concat(chunks)
+    assert df.index.is_monotonic_increasing
+    assert len(df) == len(fake)
+    pd.testing.assert_frame_equal(df, load_sensor_df(path=db).drop(columns="unit"))
+
+
+def test_load_sensor_df_resample_bad_agg(modern_db: Path) -> None:
+    with pytest.raises(ValueError, match="Unsupported aggregation"):
+        load_sensor_df(path=modern_db, resample="1h", agg="median")
+
+
+@pytest.mark.parametrize("resample", ["1M", "1ME", "W", "0h", "-1h", "hourly"])
+def test_load_sensor_df_resample_bad_frequency(modern_db: Path, resample: str) -> None:
+    # "1M" is a month (no longer supported) in pandas, not a minute
+    with pytest.raises(ValueError, match="resample"):
+        load_sensor_df(path=modern_db, resample=resample)
+
+
 HA_API_RESPONSE = [
     [
         {
@@ -220,7 +355,9 @@ def test_load_sensor_df_api_with_units() -> None:
 
 def test_load_sensor_df_api_sorted() -> None:
     with patch("requests.get", return_value=_make_api_mock(HA_API_RESPONSE)):
-        df = load_sensor_df_api(url="http://homeassistant.local:8123", token="test-token")
+        df = load_sensor_df_api(
+            url="http://homeassistant.local:8123", token="test-token"
+        )
 
     assert df.index.is_monotonic_increasing
 
@@ -241,7 +378,9 @@ def test_load_sensor_df_api_empty_entity_ids() -> None:
 
 def test_load_sensor_df_api_empty_response() -> None:
     with patch("requests.get", return_value=_make_api_mock([])):
-        df = load_sensor_df_api(url="http://homeassistant.local:8123", token="test-token")
+        df = load_sensor_df_api(
+            url="http://homeassistant.local:8123", token="test-token"
+        )
 
     assert len(df) == 0
     assert isinstance(df.index, pd.DatetimeIndex)
@@ -0,0 +1,232 @@
+"""Tests for the Google location history loader.
+
+Uses small synthetic Takeout files written to tmp_path, in both the older
+(``timestampMs``) and newer (ISO 8601 ``timestamp``) formats.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantifiedme.load import location
+from quantifiedme.load.location import (
+    colocate,
+    colocate_pairs,
+    haversine,
+    load_location_arrays,
+    location_history_to_df,
+    nearest_location,
+    proximity_to_locations,
+)
+
+# 2024-01-01T00:00:00Z in epoch millis.
+JAN1_MS = 1704067200000
+
+
+@pytest.fixture(autouse=True)
+def _cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(location, "cache_dir", tmp_path / "cache")
+
+
+def _write(tmp_path: Path, name: str, locs: list[dict]) -> Path:
+    path = tmp_path / name
+    path.write_text(json.dumps({"locations": locs}, indent=2))
+    return path
+
+
+def _loc(minutes: int, lat: float = 55.7, long: float = 13.2, **kwargs) -> dict:
+    return {
+        "timestampMs": str(JAN1_MS + minutes * 60_000),
+        "latitudeE7": round(lat * 1e7),
+        "longitudeE7": round(long * 1e7),
+        "activity": [{"type": "STILL", "confidence": 90}],
+        **kwargs,
+    }
+
+
+def test_parse_timestamp_ms(tmp_path: Path) -> None:
+    path = _write(tmp_path, "me.json", [_loc(0, accuracy=20), _loc(30)])
+    arrays = load_location_arrays(path)
+    assert arrays["timestamp"].dtype == np.int64
+    assert list(pd.to_datetime(arrays["timestamp"], utc=True)) == [
+        pd.Timestamp("2024-01-01T00:00Z"),
+        pd.Timestamp("2024-01-01T00:30Z"),
+    ]
+    assert arrays["lat"] == pytest.approx([55.7, 55.7])
+    assert arrays["long"] == pytest.approx([13.2, 13.2])
+    assert arrays["accuracy"][0] == 20
+    assert np.isnan(arrays["accuracy"][1])
+
+
+def test_parse_iso_timestamp(tmp_path: Path) -> None:
+    loc = _loc(0)
+    del loc["timestampMs"]
+    loc["timestamp"] = "2024-01-01T01:00:00.123Z"
+    arrays = load_location_arrays(_write(tmp_path, "me.json", [loc]))
+    assert pd.to_datetime(arrays["timestamp"][0], utc=True) == pd.Timestamp(
+        "2024-01-01T01:00:00.123Z"
+    )
+
+
+def test_parse_missing_location(tmp_path: Path) -> None:
+    loc = _loc(0)
+    del loc["latitudeE7"], loc["longitudeE7"]
+    loc["inferredLocation"] = [{"latitudeE7": 550000000, "longitudeE7": 130000000}]
+    path = _write(tmp_path, "me.json", [loc])
+
+    assert np.isnan(load_location_arrays(path)["lat"][0])
+    arrays = load_location_arrays(path, use_inferred_loc=True)
+    assert arrays["lat"][0] == pytest.approx(55.0)
+    assert arrays["long"][0] == pytest.approx(13.0)
+
+
+def test_parse_no_timestamp(tmp_path: Path) -> None:
+    loc = _loc(0)
+    del loc["timestampMs"]
+    with pytest.raises(ValueError, match="No timestamp"):
+        load_location_arrays(_write(tmp_path, "me.json", [loc]))
+
+
+def test_parse_grows_arrays(tmp_path: Path) -> None:
+    n = (1 << 16) + 10
+    locs = [
+        {"timestampMs": str(JAN1_MS + i * 1000), "latitudeE7": i, "longitudeE7": 0}
+        for i in range(n)
+    ]
+    arrays = load_location_arrays(_write(tmp_path, "me.json", locs))
+    assert len(arrays["timestamp"]) == n
+    assert arrays["lat"][-1] == pytest.approx((n - 1) / 1e7)
+
+
+def test_arrays_cached_until_file_changes(tmp_path: Path) -> None:
+    path = _write(tmp_path, "me.json", [_loc(0)])
+    load_location_arrays(path)
+    # written through a temporary file, which is replaced into place
+    assert [p.name for p in (tmp_path / "cache" / "location").iterdir()] == ["me.npz"]
+
+    path.write_text(json.dumps({"locations": [_loc(0), _loc(10)]}))
+    assert len(load_location_arrays(path)["timestamp"]) == 2
+
+
+def test_location_history_to_df(tmp_path: Path) -> None:
+    path = _write(tmp_path, "me.json", [_loc(0), _loc(0, lat=50), _loc(25, lat=56)])
+    df = location_history_to_df(path, resample=False)
+    # duplicate timestamps keep the first entry
+    assert list(df["lat"]) == pytest.approx([55.7, 56])
+    assert list(df.columns) == ["lat", "long", "accuracy"]
+
+    df = location_history_to_df(path)
+    assert df.index.freq == "10min"
+    assert list(df["lat"]) == pytest.approx([55.7, 55.7, 55.7])
+
+
+# --- proximity to locations ----------------------------------------------------
+
+
+def test_haversine() -> None:
+    # one degree of latitude is ~111.2km anywhere
+    assert haversine(55.0, 13.0, 56.0, 13.0) == pytest.approx(111_195, rel=1e-4)
+    # a degree of longitude shrinks with latitude
+    assert haversine(60.0, 13.0, 60.0, 14.0) == pytest.approx(55_597, rel=1e-3)
+
+
+def test_nearest_location() -> None:
+    locations = {
+        "home": {"lat": 55.0, "long": 13.0, "radius": 100},
+        "office": {"lat": 55.0, "long": 13.002, "radius": 150},  # ~128m east
+        "gym": {"lat": 56.0, "long": 13.0, "accuracy": 0.001},  # ~111m
+    }
+    lat = np.array([55.0, 55.0, 55.0, 56.0009, 56.0011, np.nan])
+    long = np.array([13.0, 13.0009, 13.0013, 13.0, 13.0, 13.0])
+    nearest = nearest_location(lat, long, locations, chunksize=4)
+    # 2nd point is within both radii, but closer to home
+    assert list(nearest) == [0, 0, 1, 2, -1, -1]
+    assert list(nearest_location(lat, long, {})) == [-1] * 6
+
+
+def test_proximity_to_locations() -> None:
+    index = pd.date_range("2024-01-01", periods=6 * 24 * 3, freq="10min", tz="UTC")
+    df = pd.DataFrame({"lat": 50.0, "long": 10.0}, index=index)
+    # at home for the first 2 hours of day 1 and 3, at the gym for 1h on day 3
+    df.iloc[:12] = [55.0, 13.0]
+    df.iloc[288 : 288 + 12] = [55.0, 13.0]
+    df.iloc[300:306] = [56.0, 13.0]
+    locations = {
+        "home": {"lat": 55.0, "long": 13.0, "accuracy": 0.001},
+        "gym": {"lat": 56.0, "long": 13.0, "accuracy": 0.001},
+        "beach": {"lat": 0.0, "long": 0.0, "accuracy": 0.001},
+    }
+    df_hours = proximity_to_locations(df, locations)
+    assert list(df_hours.columns) == ["home", "gym", "beach"]
+    assert list(df_hours.index.day) == [1, 2, 3]
+    assert list(df_hours["home"]) == pytest.approx([2, 0, 2])
+    assert list(df_hours["gym"]) == pytest.approx([0, 0, 1])
+    assert (df_hours["beach"] == 0).all()
+
+
+def test_proximity_to_locations_never_near() -> None:
+    index = pd.date_range("2024-01-01", periods=10, freq="10min", tz="UTC")
+    df = pd.DataFrame({"lat": 50.0, "long": 10.0}, index=index)
+    df_hours = proximity_to_locations(df, {"home": {"lat": 55.0, "long": 13.0}})
+    assert df_hours.empty
+    assert list(df_hours.columns) == ["home"]
+
+
+# --- colocation ----------------------------------------------------------------
+
+
+def _fixes_df(points: list[tuple[str, float, float]]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"lat": [p[1] for p in points], "long": [p[2] for p in points]},
+        index=pd.DatetimeIndex([p[0] for p in points], tz="UTC"),
+    )
+
+
+def test_colocate_irregular_fixes() -> None:
+    a = _fixes_df(
+        [
+            ("2024-01-01 20:00", 55.0, 13.0),
+            ("2024-01-02 02:00", 55.0, 13.0),
+            ("2024-01-02 04:00", 56.0, 13.0),
+        ]
+    )
+    b = _fixes_df(
+        [("2024-01-01 21:00", 55.001, 13.0), ("2024-01-02 03:00", 57.0, 13.0)]
+    )
+    hours = colocate(a, b)
+    # together from 21:00 until b leaves at 03:00, split at midnight
+    assert list(hours.index.day) == [1, 2]
+    assert list(hours) == pytest.approx([3, 3])
+
+
+def test_colocate_tolerance() -> None:
+    a = _fixes_df([("2024-01-01 00:00", 55.0, 13.0), ("2024-01-03 00:00", 55.0, 13.0)])
+    b = _fixes_df([("2024-01-01 01:00", 55.0, 13.0)])
+    # a's first fix only counts for 12h, so together from 01:00 until 12:00
+    assert list(colocate(a, b)) == pytest.approx([11])
+    assert list(colocate(a, b, tolerance=pd.Timedelta(hours=2))) == pytest.approx([1])
+
+
+def test_colocate_never_close() -> None:
+    a = _fixes_df([("2024-01-01 00:00", 55.0, 13.0)])
+    b = _fixes_df([("2024-01-01 01:00", 56.0, 13.0)])
+    assert colocate(a, b).empty
+    assert colocate(a, a.iloc[:0]).empty
+
+
+def test_colocate_pairs() -> None:
+    a = _fixes_df([("2024-01-01 00:00", 55.0, 13.0), ("2024-01-01 06:00", 55.0, 13.0)])
+    b = _fixes_df([("2024-01-01 02:00", 55.0, 13.0)])
+    c = _fixes_df([("2024-01-01 03:00", 56.0, 13.0), ("2024-01-02 00:00", 56.0, 13.0)])
+    df = colocate_pairs({"a": a, "b": b, "c": c})
+    assert list(df.columns) == [("a", "b"), ("a", "c"), ("b", "c")]
+    pd.testing.assert_series_equal(
+        df[("a", "b")], colocate(a, b), check_names=False, check_freq=False
+    )
+    assert (df[("a", "c")] == 0).all()
+
+    df = colocate_pairs({"a": a, "b": b, "c": c}, pairs=[("a", "b")])
+    assert list(df.columns) == [("a", "b")]
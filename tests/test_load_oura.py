@@ -0,0 +1,131 @@
+"""Tests for the Oura loader.
+
+Uses small synthetic exports written to tmp_path, in the format of the Oura
+API v2 (``heart_rate`` and ``sleep`` documents).
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import orjson
+import pandas as pd
+import pytest
+
+from quantifiedme.load import oura
+
+
+@pytest.fixture
+def exports(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> dict[str, Path]:
+    heartrate = {
+        "heart_rate": [
+            {"bpm": 70, "source": "awake", "timestamp": "2024-01-01T12:00:00+00:00"},
+            {"bpm": 0, "source": "awake", "timestamp": "2024-01-01T12:05:00+00:00"},
+            {"bpm": 72, "source": "awake", "timestamp": "2024-01-01T14:10:00+01:00"},
+        ]
+    }
+    sleep = {
+        "sleep": [
+            {
+                "day": "2024-01-02",
+                "bedtime_start": "2024-01-01T23:00:00+01:00",
+                "bedtime_end": "2024-01-02T07:00:00+01:00",
+                "score": 80,
+                "heart_rate": {"interval": 300.0, "items": [55, None, 53, 52]},
+            },
+            # a nap, without heart rate
+            {
+                "day": "2024-01-02",
+                "bedtime_start": "2024-01-02T14:00:00+00:00",
+                "bedtime_end": "2024-01-02T14:30:00+00:00",
+                "score": None,
+                "heart_rate": None,
+            },
+            {
+                "day": "2024-01-03",
+                "bedtime_start": "2024-01-02T22:30:00+00:00",
+                "bedtime_end": "2024-01-03T06:30:00+00:00",
+                "score": 85,
+                "heart_rate": {"interval": 60.0, "items": [60, 58]},
+            },
+        ]
+    }
+    paths = {
+        "oura-heartrate": tmp_path / "heartrate.json",
+        "oura-sleep": tmp_path / "sleep.json",
+    }
+    paths["oura-heartrate"].write_text(json.dumps(heartrate))
+    paths["oura-sleep"].write_text(json.dumps(sleep))
+    monkeypatch.setattr(oura, "_data_path", lambda key: paths[key])
+    return paths
+
+
+def test_load_heartrate_df(exports: dict[str, Path]) -> None:
+    df = oura.load_heartrate_df()
+
+    assert list(df.columns) == ["hr"]
+    assert df.index.name == "timestamp"
+    assert str(df.index.tz) == "UTC"
+    assert df.index.is_monotonic_increasing
+    expected = {
+        # daytime samples, without zeros
+        "2024-01-01 12:00": 70,
+        "2024-01-01 13:10": 72,
+        # first night, every 5 minutes from 22:00 UTC, without the missing sample
+        "2024-01-01 22:00": 55,
+        "2024-01-01 22:10": 53,
+        "2024-01-01 22:15": 52,
+        # second night, every minute
+        "2024-01-02 22:30": 60,
+        "2024-01-02 22:31": 58,
+    }
+    assert df["hr"].to_dict() == {
+        pd.Timestamp(ts, tz="UTC"): bpm for ts, bpm in expected.items()
+    }
+
+
+def test_load_sleep_df(exports: dict[str, Path]) -> None:
+    df = oura.load_sleep_df()
+    assert list(df.columns) == ["start", "end", "duration", "score"]
+    # the nap is removed
+    assert len(df) == 2
+    assert df["duration"].iloc[0] == pd.Timedelta(hours=8)
+
+
+def test_sleep_export_parsed_once(exports: dict[str, Path]) -> None:
+    oura._read_json.cache_clear()
+    # in the order of the heartrate and sleep sources of load_all_df
+    oura.load_heartrate_df()
+    oura.load_sleep_df()
+    # the sleep and heartrate exports, each parsed once
+    assert oura._read_json.cache_info().misses == 2
+    # only the last parsed export is kept in memory
+    assert oura._read_json.cache_info().currsize == 1
+
+    # a modified export is parsed again
+    path = exports["oura-sleep"]
+    mtime_ns = path.stat().st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    oura.load_sleep_df()
+    assert oura._read_json.cache_info().misses == 3
+
+
+def test_sleep_export_parsed_once_concurrently(
+    exports: dict[str, Path], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    oura._read_json.cache_clear()
+    parsed = []
+    loads = orjson.loads
+
+    def _loads(data):
+        parsed.append(data)
+        time.sleep(0.05)
+        return loads(data)
+
+    monkeypatch.setattr(oura.orjson, "loads", _loads)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(oura.load_sleep_df) for _ in range(4)]:
+            future.result()
+    assert len(parsed) == 1
@@ -1,10 +1,17 @@
+import json
+import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import pytest
+from aw_core.models import Event
+
+from quantifiedme.eventstore import EventStore
+from quantifiedme.load import smartertime
 from quantifiedme.load.smartertime import (
     _load_smartertime_events,
+    _load_smartertime_table,
     convert_csv_to_awbucket,
 )
 
@@ -22,6 +29,122 @@ def test_load_smartertime_events():
     assert len(events) > 0
 
 
+t0 = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def _write_bucket(path: Path, offset: timedelta = timedelta(0)) -> Path:
+    activities = ["phone: Firefox", "Sleep", "call: Alice", "phone: Signal", "Walk"]
+    events = [
+        {
+            "timestamp": (t0 + offset + i * timedelta(minutes=10)).isoformat(),
+            "duration": 120.5,
+            "data": {
+                "activity": activities[i % len(activities)],
+                "device": "Phone",
+                "place": "Home",
+                "room": "",
+            },
+        }
+        for i in range(50)
+    ]
+    # a timestamp in another timezone, and one without (assumed to be UTC)
+    events[3]["timestamp"] = (
+        (t0 + timedelta(minutes=30))
+        .astimezone(timezone(timedelta(hours=2)))
+        .isoformat()
+    )
+    events[8]["timestamp"] = "2022-01-01T01:20:00"
+    # UTC as "Z", with and without a (short) fraction of a second
+    for i, fraction in [(20, ""), (22, ".5")]:
+        timestamp = t0 + offset + i * timedelta(minutes=10)
+        events[i]["timestamp"] = timestamp.strftime(f"%Y-%m-%dT%H:%M:%S{fraction}Z")
+    path.write_text(json.dumps({"id": "smartertime_export", "events": events}))
+    return path
+
+
+def _load_smartertime_events_reference(since: datetime, filepath) -> list[Event]:
+    # The previous implementation, loading all events before filtering
+    with open(filepath) as f:
+        events = [Event(**e) for e in json.load(f)["events"]]
+    events = [e for e in events if since.astimezone(timezone.utc) < e.timestamp]
+    events = [
+        e for e in events if any(s in e.data["activity"] for s in ["phone:", "call:"])
+    ]
+    for e in events:
+        e.data["app"] = e.data["activity"]
+        e.data["title"] = e.data["app"]
+        e.data["$source"] = "smartertime"
+    return sorted(events, key=lambda e: e.timestamp)
+
+
+@pytest.mark.parametrize("since", [t0 - timedelta(days=1), t0 + timedelta(hours=3)])
+def test_load_smartertime_events_equivalent(tmp_path: Path, since: datetime):
+    path = _write_bucket(tmp_path / "bucket.json")
+    events = _load_smartertime_events(since, path)
+    expected = _load_smartertime_events_reference(since, path)
+    assert len(events) == len(expected) > 0
+    assert t0 + timedelta(minutes=220, milliseconds=500) in [
+        e.timestamp for e in events
+    ]
+    for e, e_ref in zip(events, expected, strict=True):
+        assert e.timestamp == e_ref.timestamp
+        assert e.duration == e_ref.duration
+        assert e.data == e_ref.data
+
+
+def test_load_tables(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    paths = {
+        "phone1": _write_bucket(tmp_path / "phone1.json"),
+        "phone2": _write_bucket(tmp_path / "phone2.json", offset=timedelta(days=1)),
+    }
+    monkeypatch.setattr(
+        smartertime,
+        "load_config",
+        lambda: {
+            "data": {"smartertime_buckets": {k: str(v) for k, v in paths.items()}}
+        },
+    )
+    store = EventStore(tmp_path / "events")
+    store.write(_load_smartertime_table(None, paths["phone1"]), name="removed-phone")
+
+    since = t0 + timedelta(hours=6)
+    tables = smartertime.load_tables(since, store)
+    assert list(tables) == ["phone1", "phone2"]
+    assert len(tables["phone1"]) == 8
+    # two of the events of phone2 have fixed timestamps, before `since`
+    assert len(tables["phone2"]) == 28
+    assert set(tables["phone2"]["hostname"].to_pylist()) == {"phone2"}
+    assert tables["phone1"]["app"][0].as_py() == "call: Alice"
+
+    # all events of each device are kept in the store, a part per device
+    assert store.parts() == ["phone1", "phone2"]
+    assert len(store.scan(parts=["phone1"])) == 30
+
+    events = smartertime.load_events(since, store)
+    assert [e.data["$hostname"] for e in events] == ["phone1"] * 8 + ["phone2"] * 28
+
+    # unchanged exports aren't parsed again, changed ones are
+    parsed = []
+    load_table = smartertime._load_smartertime_table
+
+    def _load_table(since, filepath, hostname=None):
+        parsed.append(hostname)
+        return load_table(since, filepath, hostname)
+
+    monkeypatch.setattr(smartertime, "_load_smartertime_table", _load_table)
+    assert smartertime.load_tables(since, store)["phone2"].equals(tables["phone2"])
+    assert parsed == []
+
+    _write_bucket(paths["phone1"], offset=timedelta(hours=1))
+    os.utime(paths["phone1"], ns=(0, 0))
+    tables = smartertime.load_tables(since, store)
+    assert parsed == ["phone1"]
+    assert tables["phone1"].equals(
+        _load_smartertime_table(since, paths["phone1"], "phone1")
+    )
+    assert len(tables["phone1"]) != 8
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "convert":
         assert len(sys.argv) > 2
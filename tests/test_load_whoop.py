@@ -6,6 +6,7 @@ CSVs that match the actual column schemas Whoop ships (verified against Erik's
 2026-05-13 export).
 """
 
+import os
 from pathlib import Path
 
 import pandas as pd
@@ -23,6 +24,7 @@ from quantifiedme.load.whoop import (
     load_cycles_df,
     load_heartrate_df,
     load_journal_daily_df,
+    load_metrics_df,
     load_sleep_df,
     load_workouts_df,
 )
@@ -302,6 +304,88 @@ def test_load_journal_standard_missing_file(tmp_path: Path) -> None:
         _load_journal_standard(tmp_path)
 
 
+# ── GDPR metrics ──────────────────────────────────────────────────────────────
+
+
+METRICS_CSV_1 = """\
+hr,accel_x,accel_y,accel_z,skin_temp,ts
+62,0.01,-0.98,0.12,33.5,2019-06-08 14:47:00
+61,0.02,-0.97,0.11,33.4,2019-06-08 14:46:00
+,,,,,2019-06-08 14:48:00
+"""
+
+METRICS_CSV_2 = """\
+hr,accel_x,accel_y,accel_z,skin_temp,ts
+70,0.5,-0.5,0.5,34.0,2019-06-09 08:00:00
+"""
+
+
+@pytest.fixture
+def gdpr_metrics_export(
+    gdpr_export: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    (gdpr_export / "Health" / "metrics-1.csv").write_text(METRICS_CSV_1)
+    (gdpr_export / "Health" / "metrics-2.csv").write_text(METRICS_CSV_2)
+    monkeypatch.setattr(whoop, "cache_dir", tmp_path / "cache")
+    monkeypatch.setattr(whoop, "_whoop_dir", lambda: gdpr_export)
+    return gdpr_export
+
+
+def test_load_heartrate_gdpr(gdpr_metrics_export: Path) -> None:
+    df = load_heartrate_df()
+
+    assert list(df.columns) == ["hr"]
+    assert df.index.name == "timestamp"
+    assert str(df.index.tz) == "UTC"
+    assert df.index.is_monotonic_increasing
+    assert df.index[0] == pd.Timestamp("2019-06-08 14:46:00", tz="UTC")
+    assert list(df["hr"].fillna(0)) == [61, 62, 0, 70]
+
+
+def test_load_metrics_df(gdpr_metrics_export: Path) -> None:
+    df = load_metrics_df()
+    assert list(df.columns) == ["hr", "accel_x", "accel_y", "accel_z", "skin_temp"]
+    assert df["skin_temp"].dtype == "float32"
+    assert len(df) == 4
+
+    df = load_metrics_df(columns=["skin_temp"])
+    assert list(df.columns) == ["skin_temp"]
+    assert df["skin_temp"].iloc[-1] == 34.0
+
+
+def test_load_metrics_df_cache(
+    gdpr_metrics_export: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    converted = []
+    convert = whoop._convert_metrics_csv
+
+    def _convert(src: Path, dst: Path, key: str) -> None:
+        converted.append(src.name)
+        convert(src, dst, key)
+
+    monkeypatch.setattr(whoop, "_convert_metrics_csv", _convert)
+    df = load_metrics_df()
+    assert converted == ["metrics-1.csv", "metrics-2.csv"]
+
+    # unchanged files are read from the cache
+    pd.testing.assert_frame_equal(df, load_metrics_df())
+    assert len(converted) == 2
+
+    # modified files are converted again
+    path = gdpr_metrics_export / "Health" / "metrics-2.csv"
+    mtime_ns = path.stat().st_mtime_ns + 10**9
+    path.write_text(METRICS_CSV_2.replace("70", "75"))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    df = load_metrics_df()
+    assert converted[2:] == ["metrics-2.csv"]
+    assert df["hr"].iloc[-1] == 75
+
+
+def test_load_metrics_df_missing_files(gdpr_export: Path) -> None:
+    with pytest.raises(FileNotFoundError, match="No metrics"):
+        load_metrics_df(gdpr_export)
+
+
 # ── Question text normalization ───────────────────────────────────────────────
 
 
@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from aw_core import Event
+from aw_transform.union_no_overlap import union_no_overlap
+
+from quantifiedme.merge import merge_events, merge_intervals
+
+t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _events(host: str, spans: list[tuple[float, float]]) -> list[Event]:
+    return [
+        Event(
+            timestamp=t0 + timedelta(seconds=start),
+            duration=timedelta(seconds=end - start),
+            data={"$hostname": host, "i": i},
+        )
+        for i, (start, end) in enumerate(spans)
+    ]
+
+
+def _random_events(host: str, n: int, rng: random.Random) -> list[Event]:
+    spans = []
+    t = rng.randint(0, 100)
+    for _ in range(n):
+        # millisecond timestamps and durations, with touching events
+        t += rng.choice([0, 0, rng.randint(1, 60_000)])
+        duration = rng.randint(1, 120_000)
+        spans.append((t / 1000, (t + duration) / 1000))
+        t += duration
+    return _events(host, spans)
+
+
+def _union_chain(sources: list[list[Event]]) -> list[Event]:
+    events: list[Event] = []
+    for source in sources:
+        events = union_no_overlap(events, source)
+    return events
+
+
+def _merge_reference(sources: list[list[Event]]) -> list[Event]:
+    # Cuts every event by all events of earlier sources, one at a time
+    result: list[Event] = []
+    covered: list[tuple[datetime, datetime]] = []
+    for source in sources:
+        spans = [(e.timestamp, e.timestamp + e.duration) for e in source]
+        for e, (start, end) in zip(source, spans, strict=True):
+            if start == end:
+                if not any(s <= start <= e_ for s, e_ in covered):
+                    result.append(e)
+                continue
+            pieces = [(start, end)]
+            for s, e_ in covered:
+                pieces = [
+                    piece
+                    for p_start, p_end in pieces
+                    for piece in [(p_start, min(p_end, s)), (max(p_start, e_), p_end)]
+                    if piece[0] < piece[1]
+                ]
+            for p_start, p_end in pieces:
+                piece = Event(timestamp=p_start, duration=p_end - p_start, data=e.data)
+                result.append(e if (p_start, p_end) == (start, end) else piece)
+        covered += spans
+    return sorted(result, key=lambda e: e.timestamp)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_merge_events_equivalent(seed: int):
+    rng = random.Random(seed)
+    sources = [_random_events(f"host{k}", 100, rng) for k in range(rng.randint(2, 5))]
+    merged = merge_events(sources)
+    expected = _merge_reference(sources)
+    assert len(merged) == len(expected)
+    assert merged == expected
+    assert all(
+        e1.timestamp + e1.duration <= e2.timestamp
+        for e1, e2 in zip(merged[:-1], merged[1:], strict=True)
+    )
+
+
+def test_merge_events_priority():
+    high = _events("high", [(10, 20), (30, 40)])
+    low = _events("low", [(0, 50), (50, 60)])
+    merged = merge_events([high, low])
+    assert [
+        (e.data["$hostname"], e.timestamp.second, e.duration.seconds) for e in merged
+    ] == [
+        ("low", 0, 10),
+        ("high", 10, 10),
+        ("low", 20, 10),
+        ("high", 30, 10),
+        ("low", 40, 10),
+        ("low", 50, 10),
+    ]
+    # events that aren't cut are kept as is, pieces are copies
+    assert merged[1] is high[0]
+    assert merged[-1] is low[1]
+    assert merged[0].data is not low[0].data
+    assert merge_events([low, high]) == low
+    assert merged == _union_chain([high, low])
+
+
+def test_merge_events_zero_duration():
+    high = _events("high", [(10, 20), (25, 25)])
+    low = _events("low", [(5, 5), (10, 10), (20, 20), (22, 22)])
+    merged = merge_events([high, low])
+    assert [(e.data["$hostname"], e.timestamp.second) for e in merged] == [
+        ("low", 5),
+        ("high", 10),
+        ("low", 22),
+        ("high", 25),
+    ]
+
+
+def test_merge_events_overlapping_source():
+    overlapping = _events("a", [(0, 10), (5, 15)])
+    other = _events("b", [(12, 20)])
+    assert (
+        merge_intervals(
+            [np.array([0, 5]), np.array([12])], [np.array([10, 15]), np.array([20])]
+        )
+        is None
+    )
+    assert merge_events([overlapping, other]) == _union_chain([overlapping, other])
+
+
+def test_merge_events_empty():
+    assert merge_events([]) == []
+    assert merge_events([[], []]) == []
+    events = _events("a", [(0, 10)])
+    assert merge_events([[], events]) == events
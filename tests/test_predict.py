@@ -5,11 +5,13 @@ import pandas as pd
 import pytest
 
 from quantifiedme.predict.features import (
+    SUBSTANCE_DECAY_DAYS,
     build_feature_frame,
     build_screentime_features,
     build_substance_features,
     build_temporal_features,
     decay_kernel,
+    decay_kernels,
 )
 from quantifiedme.predict.models.sleep import (
     WELLBEING_TARGETS,
@@ -71,6 +73,49 @@ class TestDecayKernel:
         # Slow decay retains more at day 2
         assert slow.iloc[2] > fast.iloc[2]
 
+    def test_batched_matches_per_day_dot(self):
+        # a decade of daily data for many tags, with a mix of taus
+        rng = np.random.default_rng(0)
+        values = rng.choice([0.0, 1.0], size=(3650, 50), p=[0.8, 0.2])
+        taus = rng.uniform(0.25, 3.0, 50)
+        window = 7
+        result = decay_kernels(values, taus=taus, window=window)
+
+        # reference: explicit dot product over the padded window for each day
+        padded = np.concatenate([np.zeros((window - 1, 50)), values])
+        for j in [0, 17, 49]:
+            weights = np.exp(-np.arange(window) / taus[j])
+            expected = [
+                np.dot(padded[i : i + window, j][::-1], weights)
+                for i in range(len(values))
+            ]
+            np.testing.assert_allclose(result[:, j], expected, rtol=1e-12)
+
+    def test_several_windows_in_one_pass(self):
+        rng = np.random.default_rng(1)
+        values = rng.choice([0.0, 1.0], size=(100, 5), p=[0.7, 0.3])
+        taus = [0.5, 1.0, 2.0, np.inf, 1.5]
+        windows = [14, 3, 7, 3]
+        result = decay_kernels(values, taus=taus, window=windows)
+        assert result.shape == (4, 100, 5)
+        for i, window in enumerate(windows):
+            np.testing.assert_allclose(
+                result[i], decay_kernels(values, taus=taus, window=window)
+            )
+        # τ = inf is a trailing count
+        np.testing.assert_allclose(
+            result[1][:, 3], pd.Series(values[:, 3]).rolling(3, min_periods=1).sum()
+        )
+
+    def test_window_longer_than_series(self):
+        series = pd.Series([1, 0, 1])
+        result = decay_kernel(series, tau=1.0, window=10)
+        assert result.iloc[2] == pytest.approx(1 + np.exp(-2))
+
+    def test_rejects_nonpositive_tau(self):
+        with pytest.raises(ValueError):
+            decay_kernel(pd.Series([1, 0]), tau=0)
+
 
 class TestSubstanceFeatures:
     def test_creates_expected_columns(self, sample_df: pd.DataFrame):
@@ -85,6 +130,22 @@ class TestSubstanceFeatures:
         # psychedelics has 0 frequency, should be excluded
         assert not any("psychedelics" in c for c in features.columns)
 
+    def test_matches_per_substance_kernels(self, sample_df: pd.DataFrame):
+        features = build_substance_features(sample_df, window=7)
+        for substance in ["caffeine", "alcohol"]:
+            col = sample_df[f"tag:{substance}"]
+            tau = SUBSTANCE_DECAY_DAYS[substance]
+            pd.testing.assert_series_equal(
+                features[f"decay:{substance}:kernel"],
+                decay_kernel(col, tau=tau, window=7),
+                check_names=False,
+            )
+            pd.testing.assert_series_equal(
+                features[f"decay:{substance}:count_7d"],
+                col.rolling(7, min_periods=1).sum().astype(float),
+                check_names=False,
+            )
+
     def test_top_n_limits_substances(self, sample_df: pd.DataFrame):
         features = build_substance_features(sample_df, top_n=2)
         substances = {c.split(":")[1] for c in features.columns}
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from aw_core import Event
+
+from quantifiedme.validate import validate_events
+
+t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _events(spans: list[tuple[float, float]]) -> list[Event]:
+    return [
+        Event(
+            timestamp=t0 + timedelta(seconds=start),
+            duration=timedelta(seconds=end - start),
+            data={"i": i},
+        )
+        for i, (start, end) in enumerate(spans)
+    ]
+
+
+def _spans(events: list[Event]) -> list[tuple[float, float]]:
+    return [
+        (
+            (e.timestamp - t0).total_seconds(),
+            (e.timestamp + e.duration - t0).total_seconds(),
+        )
+        for e in events
+    ]
+
+
+since = t0 + timedelta(seconds=10)
+now = t0 + timedelta(seconds=100)
+
+
+def test_validate_valid():
+    events = _events([(10, 20), (20, 20), (30, 100)])
+    result, violations = validate_events(events, "a", since, now, on_invalid="raise")
+    assert violations == []
+    assert result is events
+
+
+def test_validate_report():
+    events = _events([(0, 5), (5, 15), (12, 20), (50, 40), (90, 110)])
+    result, violations = validate_events(events, "a", since, now, on_invalid="warn")
+    assert result is events
+    assert {v.check: v.count for v in violations} == {
+        "with negative duration": 1,
+        "before since": 2,
+        "after now": 1,
+        "overlapping the previous event": 1,
+    }
+    before = next(v for v in violations if v.check == "before since")
+    assert before.source == "a"
+    assert before.examples == [
+        (t0, timedelta(seconds=5)),
+        (t0 + timedelta(seconds=5), timedelta(seconds=10)),
+    ]
+    assert "a: 2 events before since" in str(before)
+
+    with pytest.raises(ValueError, match="a: 1 events after now"):
+        validate_events(events, "a", since, now, on_invalid="raise")
+
+
+def test_validate_repair():
+    events = _events(
+        [(0, 5), (5, 15), (40, 60), (12, 20), (50, 40), (55, 55), (90, 110)]
+    )
+    result, violations = validate_events(events, "a", since, now)
+    assert violations
+    # clipped to [since, now], sorted, cut at the next event, and invalid
+    # (or clipped to nothing) events dropped
+    assert _spans(result) == [(10, 12), (12, 20), (40, 55), (55, 55), (90, 100)]
+    assert [e.data["i"] for e in result] == [1, 3, 2, 5, 6]
+    # unchanged events are kept as is
+    assert result[1] is events[3]
+    _, violations = validate_events(result, "a", since, now, on_invalid="raise")
+    assert violations == []
+
+
+def test_validate_empty():
+    assert validate_events([], "a", since, now, on_invalid="raise") == ([], [])